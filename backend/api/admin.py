@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, OTP
+from .models import User, OTP, AuditSnapshot, AuditRecord, AuditSchedule, AuditJob, EmailOutbox, RequestProfile
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -32,3 +34,97 @@ class OTPAdmin(admin.ModelAdmin):
     search_fields = ['email', 'otp_code']
     ordering = ['-created_at']
     readonly_fields = ['created_at']
+
+@admin.register(AuditSnapshot)
+class AuditSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['url', 'user', 'created_at', 'last_accessed_at', 'expires_at']
+    list_filter = ['created_at']
+    search_fields = ['url', 'user__email']
+    ordering = ['-created_at']
+    readonly_fields = ['id', 'created_at', 'last_accessed_at']
+
+@admin.register(AuditRecord)
+class AuditRecordAdmin(admin.ModelAdmin):
+    list_display = ['url', 'user', 'created_at', 'status_code', 'performance_mobile', 'performance_desktop']
+    search_fields = ['user__email']
+    ordering = ['-id']
+    show_full_result_count = False
+    raw_id_fields = ['user']
+    exclude = ['payload']
+    readonly_fields = ['created_at', 'url_hash', 'payload_size']
+
+    def get_queryset(self, request):
+        # The changelist never shows the compressed result; don't read it for every row
+        return super().get_queryset(request).defer('payload')
+
+@admin.register(AuditSchedule)
+class AuditScheduleAdmin(admin.ModelAdmin):
+    list_display = ['url', 'user', 'interval_minutes', 'is_active', 'next_run_at', 'last_enqueued_at']
+    list_filter = ['is_active', 'interval_minutes']
+    search_fields = ['url', 'user__email']
+    ordering = ['next_run_at']
+    raw_id_fields = ['user']
+    readonly_fields = ['url_hash', 'host', 'scheduled_for', 'last_enqueued_at', 'created_at']
+
+@admin.register(AuditJob)
+class AuditJobAdmin(admin.ModelAdmin):
+    list_display = ['url', 'user', 'status', 'attempts', 'available_at', 'created_at', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['url', 'host']
+    ordering = ['-id']
+    raw_id_fields = ['schedule', 'user', 'audit']
+    readonly_fields = ['created_at', 'finished_at']
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['to_email', 'subject', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['to_email', 'subject']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'sent_at']
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'cpu_ms', 'trigger',
+                    'user']
+    list_filter = ['trigger', 'view_name', 'status_code', 'created_at']
+    search_fields = ['path', 'view_name', 'user__email']
+    ordering = ['-created_at']
+    exclude = ['profile_data', 'stages', 'top_functions']
+    readonly_fields = ['created_at', 'trigger', 'user', 'method', 'path', 'view_name', 'status_code',
+                       'duration_ms', 'cpu_ms', 'download', 'stage_timeline', 'slowest_functions']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Profile')
+    def download(self, obj):
+        url = reverse('download_request_profile', args=[obj.pk])
+        return format_html('<a href="{}">Download .prof</a> (open with pstats or snakeviz)', url)
+
+    @admin.display(description='Stages')
+    def stage_timeline(self, obj):
+        if not obj.stages:
+            return '-'
+        rows = format_html_join(
+            '\n', '<tr><td>{}</td><td>{} ms</td><td>{} ms</td></tr>',
+            ((stage['name'], f"{stage['start_ms']:.1f}", f"{stage['duration_ms']:.1f}") for stage in obj.stages),
+        )
+        return format_html('<table><tr><th>Stage</th><th>Starts at</th><th>Duration</th></tr>{}</table>', rows)
+
+    @admin.display(description='Slowest functions (cumulative)')
+    def slowest_functions(self, obj):
+        if not obj.top_functions:
+            return '-'
+        rows = format_html_join(
+            '\n', '<tr><td>{}</td><td>{}</td><td>{} ms</td><td>{} ms</td></tr>',
+            ((row['function'], row['calls'], f"{row['cumulative_ms']:.1f}", f"{row['total_ms']:.1f}")
+             for row in obj.top_functions),
+        )
+        return format_html(
+            '<table><tr><th>Function</th><th>Calls</th><th>Cumulative</th><th>Own time</th></tr>{}</table>', rows
+        )
@@ -1,45 +1,103 @@
-import google.generativeai as genai
-from decouple import Config, RepositoryEnv
-import json
-import os
+from django.conf import settings
+import time
+
+from .llm_json import RESPONSE_SCHEMAS, LLMResponseError, failed_calls, parse_llm_json
+from .llm_providers import get_llm_provider
+from .coalescing import coalesce, request_key
+from .metrics import registry
+from .prompt_budget import PromptBudget, record_llm_call, truncate_to_tokens
+from .resilience import LLMUnavailableError, get_llm_caller
+from .seo_rules import evaluate_page
+
+
+class ModelReply:
+    """Text of a model response; picklable so coalesced callers in other workers can share it"""
+
+    def __init__(self, text):
+        self.text = text
 
 
 class GeminiAIService:
-    def __init__(self):
-        # Load .env from api folder
-        env_path = os.path.join(os.path.dirname(__file__), '.env')
-        try:
-            config = Config(RepositoryEnv(env_path))
-            self.api_key = config('GEMINI_API_KEY', default='').strip().strip("'\"")
-            self.project_id = config('GEMINI_PROJECT', default='').strip().strip("'\"")
-        except Exception as e:
-            print(f"Error loading .env: {e}")
-            self.api_key = ''
-            self.project_id = ''
-        
-        if self.api_key:
-            try:
-                genai.configure(api_key=self.api_key)
-                # Use Gemini Flash - fast and cost-effective
-                self.model = genai.GenerativeModel('gemini-2.5-flash')
-            except Exception as e:
-                print(f"Error configuring Gemini: {e}")
-                self.model = None
-        else:
-            self.model = None
+    """
+    SEO prompts and response handling. The model itself is reached through
+    an LLMProvider (Gemini by default, see LLM_PROVIDER).
+    """
+
+    def __init__(self, provider=None):
+        self.provider = provider or get_llm_provider()
     
     def is_configured(self):
-        """Check if Gemini API is properly configured"""
-        return self.model is not None
+        """Check if the LLM provider (e.g. the Gemini API key) is configured"""
+        return self.provider.is_configured()
+    
+    def _budget(self, endpoint):
+        """Start a prompt budget for one endpoint"""
+        return PromptBudget(endpoint, settings.AI_PROMPT_TOKEN_BUDGET)
+    
+    def _generate(self, prompt, endpoint, generation_config=None):
+        """
+        Generate a reply, sharing one model call between concurrent identical
+        requests (same endpoint, prompt and generation config)
+        """
+        key = request_key(endpoint, prompt, generation_config)
+        reply, _ = coalesce('llm', key, lambda: self._call_model(prompt, endpoint, generation_config))
+        return reply
+    
+    def _call_model(self, prompt, endpoint, generation_config=None):
+        """
+        Call the model through the process-wide resilience layer (deadline,
+        retries, circuit breaker, concurrency cap), recording token counts
+        and latency for the endpoint
+        """
+        response = None
+        outcome = 'error'
+        start = time.perf_counter()
+        
+        def call(timeout):
+            return self.provider.generate(prompt, timeout, generation_config)
+        
+        try:
+            response = get_llm_caller(self.provider.name).call(call)
+            outcome = 'ok'
+            return ModelReply(response.text)
+        except LLMUnavailableError:
+            outcome = 'rejected'
+            raise
+        finally:
+            record_llm_call(endpoint, prompt, response, time.perf_counter() - start, outcome)
+    
+    def _generate_json(self, prompt, endpoint):
+        """
+        Call the model in JSON mode constrained to the endpoint's response
+        schema, then parse tolerantly and validate.
+        """
+        fingerprint = failed_calls.fingerprint(endpoint, prompt)
+        if failed_calls.is_retry(fingerprint):
+            registry.inc('llm_json_retries_total', endpoint=endpoint)
+        
+        response = self._generate(prompt, endpoint, generation_config={
+            'response_mime_type': 'application/json',
+            'response_schema': RESPONSE_SCHEMAS[endpoint],
+        })
+        try:
+            return parse_llm_json(response.text, endpoint)
+        except LLMResponseError:
+            failed_calls.record_failure(fingerprint)
+            raise
     
     def generate_meta_title(self, current_title, meta_description, content_preview, keywords):
         """Generate optimized meta title suggestions"""
-        prompt = f"""You are an expert SEO specialist. Analyze the following website data and generate 5 highly optimized meta title suggestions.
-
-Current Meta Title: {current_title}
-Meta Description: {meta_description}
-Content Preview: {content_preview[:500]}
-Keywords: {keywords}
+        budget = self._budget('meta_title')
+        budget.add('current_title', current_title, priority=3)
+        budget.add('meta_description', meta_description, priority=2)
+        budget.add('content_preview', content_preview[:500], priority=1)
+        budget.add('keywords', keywords, priority=2)
+        prompt = budget.render(lambda s: f"""You are an expert SEO specialist. Analyze the following website data and generate 5 highly optimized meta title suggestions.
+
+Current Meta Title: {s['current_title']}
+Meta Description: {s['meta_description']}
+Content Preview: {s['content_preview']}
+Keywords: {s['keywords']}
 
 Requirements for meta titles:
 1. Length: 50-60 characters (optimal for Google search results)
@@ -59,32 +117,28 @@ Generate 5 creative and effective meta title options. Return ONLY a valid JSON a
   {{"title": "suggestion 5", "length": 54, "reason": "why this works"}}
 ]
 
-Return ONLY the JSON array, no additional text or explanation."""
+Return ONLY the JSON array, no additional text or explanation.""")
 
         try:
-            response = self.model.generate_content(prompt)
-            # Extract JSON from response
-            text = response.text.strip()
-            # Remove markdown code blocks if present
-            if text.startswith('```'):
-                text = text.split('```')[1]
-                if text.startswith('json'):
-                    text = text[4:]
-            text = text.strip()
-            
-            suggestions = json.loads(text)
-            return suggestions
+            return self._generate_json(prompt, 'meta_title')
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             return {'error': str(e)}
     
     def generate_meta_description(self, current_description, meta_title, content_preview, keywords):
         """Generate optimized meta description suggestions"""
-        prompt = f"""You are an expert SEO specialist. Analyze the following website data and generate 5 highly optimized meta description suggestions.
-
-Current Meta Description: {current_description}
-Meta Title: {meta_title}
-Content Preview: {content_preview[:500]}
-Keywords: {keywords}
+        budget = self._budget('meta_description')
+        budget.add('current_description', current_description, priority=3)
+        budget.add('meta_title', meta_title, priority=2)
+        budget.add('content_preview', content_preview[:500], priority=1)
+        budget.add('keywords', keywords, priority=2)
+        prompt = budget.render(lambda s: f"""You are an expert SEO specialist. Analyze the following website data and generate 5 highly optimized meta description suggestions.
+
+Current Meta Description: {s['current_description']}
+Meta Title: {s['meta_title']}
+Content Preview: {s['content_preview']}
+Keywords: {s['keywords']}
 
 Requirements for meta descriptions:
 1. Length: 150-160 characters (optimal for Google search results)
@@ -104,30 +158,30 @@ Generate 5 creative and effective meta description options. Return ONLY a valid
   {{"description": "suggestion 5", "length": 154, "reason": "why this works"}}
 ]
 
-Return ONLY the JSON array, no additional text or explanation."""
+Return ONLY the JSON array, no additional text or explanation.""")
 
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            if text.startswith('```'):
-                text = text.split('```')[1]
-                if text.startswith('json'):
-                    text = text[4:]
-            text = text.strip()
-            
-            suggestions = json.loads(text)
-            return suggestions
+            return self._generate_json(prompt, 'meta_description')
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             return {'error': str(e)}
     
-    def generate_keywords(self, meta_title, meta_description, content_preview, headings):
-        """Generate SEO keyword suggestions"""
-        prompt = f"""You are an expert SEO keyword researcher. Analyze the following website data and generate strategic keyword suggestions.
-
-Meta Title: {meta_title}
-Meta Description: {meta_description}
-Content Preview: {content_preview[:500]}
-Main Headings: {', '.join(headings[:10]) if headings else 'None'}
+    def generate_keywords(self, meta_title, meta_description, content_preview, headings, hints=None):
+        """Generate SEO keyword suggestions, optionally seeded with locally extracted candidates"""
+        budget = self._budget('keywords')
+        budget.add('meta_title', meta_title, priority=3)
+        budget.add('meta_description', meta_description, priority=2)
+        budget.add('content_preview', content_preview[:500], priority=1)
+        budget.add('headings', items=(headings or [])[:10], separator=', ', priority=1)
+        budget.add('hints', items=hints or [], separator=', ', priority=2)
+        prompt = budget.render(lambda s: f"""You are an expert SEO keyword researcher. Analyze the following website data and generate strategic keyword suggestions.
+
+Meta Title: {s['meta_title']}
+Meta Description: {s['meta_description']}
+Content Preview: {s['content_preview']}
+Main Headings: {s['headings']}
+Candidate Terms Ranked From The Full Page Text: {s['hints']}
 
 Analyze the content and generate:
 1. Primary Keywords (3-5): Most important, high-value keywords
@@ -143,30 +197,28 @@ Return ONLY a valid JSON object with this exact structure:
   "lsi": ["related1", "related2", "related3"]
 }}
 
-Return ONLY the JSON object, no additional text or explanation."""
+Return ONLY the JSON object, no additional text or explanation.""")
 
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            if text.startswith('```'):
-                text = text.split('```')[1]
-                if text.startswith('json'):
-                    text = text[4:]
-            text = text.strip()
-            
-            keywords = json.loads(text)
-            return keywords
+            return self._generate_json(prompt, 'keywords')
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             return {'error': str(e)}
     
     def generate_content_improvements(self, content_preview, meta_title, headings, target_keywords):
         """Generate content improvement suggestions"""
-        prompt = f"""You are an expert SEO content strategist. Analyze the following website content and provide actionable improvement recommendations.
-
-Meta Title: {meta_title}
-Main Headings: {', '.join(headings[:5]) if headings else 'None'}
-Content Preview: {content_preview[:800]}
-Target Keywords: {target_keywords}
+        budget = self._budget('content_improvements')
+        budget.add('meta_title', meta_title, priority=3)
+        budget.add('headings', items=(headings or [])[:5], separator=', ', priority=1)
+        budget.add('content_preview', content_preview[:800], priority=1)
+        budget.add('target_keywords', target_keywords, priority=2)
+        prompt = budget.render(lambda s: f"""You are an expert SEO content strategist. Analyze the following website content and provide actionable improvement recommendations.
+
+Meta Title: {s['meta_title']}
+Main Headings: {s['headings']}
+Content Preview: {s['content_preview']}
+Target Keywords: {s['target_keywords']}
 
 Analyze and provide specific recommendations for:
 1. Content Structure: How to improve heading hierarchy and content flow
@@ -184,29 +236,30 @@ Return ONLY a valid JSON object with this exact structure:
   "cta": ["suggestion 1", "suggestion 2", "suggestion 3"]
 }}
 
-Return ONLY the JSON object, no additional text or explanation."""
+Return ONLY the JSON object, no additional text or explanation.""")
 
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            if text.startswith('```'):
-                text = text.split('```')[1]
-                if text.startswith('json'):
-                    text = text[4:]
-            text = text.strip()
-            
-            improvements = json.loads(text)
-            return improvements
+            return self._generate_json(prompt, 'content_improvements')
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             return {'error': str(e)}
     
     def generate_heading_suggestions(self, current_headings, meta_title, content_preview):
         """Generate improved heading structure suggestions"""
-        prompt = f"""You are an expert SEO content optimizer. Analyze the current heading structure and suggest improvements.
-
-Meta Title: {meta_title}
-Current Headings: {json.dumps(current_headings) if current_headings else 'None'}
-Content Preview: {content_preview[:500]}
+        budget = self._budget('heading_suggestions')
+        budget.add('meta_title', meta_title, priority=3)
+        budget.add('current_headings', items=[
+            f"{tag.upper()}: {heading}"
+            for tag, items in (current_headings or {}).items() for heading in items
+        ], priority=2)
+        budget.add('content_preview', content_preview[:500], priority=1)
+        prompt = budget.render(lambda s: f"""You are an expert SEO content optimizer. Analyze the current heading structure and suggest improvements.
+
+Meta Title: {s['meta_title']}
+Current Headings:
+{s['current_headings']}
+Content Preview: {s['content_preview']}
 
 Analyze the heading structure and provide:
 1. Improved H1 suggestions (2-3 options)
@@ -228,23 +281,16 @@ Return ONLY a valid JSON object with this exact structure:
   "recommendations": ["recommendation 1", "recommendation 2", "recommendation 3"]
 }}
 
-Return ONLY the JSON object, no additional text or explanation."""
+Return ONLY the JSON object, no additional text or explanation.""")
 
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            if text.startswith('```'):
-                text = text.split('```')[1]
-                if text.startswith('json'):
-                    text = text[4:]
-            text = text.strip()
-            
-            suggestions = json.loads(text)
-            return suggestions
+            return self._generate_json(prompt, 'heading_suggestions')
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             return {'error': str(e)}
     
-    def chat_about_website(self, question, scraped_data, chat_history=None):
+    def chat_about_website(self, question, scraped_data, chat_history=None, page_index=None):
         """
         Answer questions about the website using AI
         
@@ -252,28 +298,47 @@ Return ONLY the JSON object, no additional text or explanation."""
             question: User's question
             scraped_data: All scraped website data
             chat_history: Previous conversation for context
+            page_index: Optional BM25Index over the full page text; when given,
+                only the passages most relevant to the question are sent
         """
         # First, optimize the user's question
         optimized_question = self._optimize_question(question, scraped_data)
         
-        # Build context from scraped data
-        context = self._build_website_context(scraped_data)
+        passages = None
+        if page_index is not None:
+            passages = [
+                chunk for chunk, _ in page_index.search(
+                    f"{question} {optimized_question}", k=settings.CHAT_RETRIEVAL_TOP_K
+                )
+            ]
+        
+        # Build context from scraped data; passages are trimmed before the overview
+        budget = self._budget('chat')
+        budget.add('overview', self._build_website_context(scraped_data), priority=4)
+        if passages:
+            budget.add('content', items=passages, separator='\n---\n', priority=2)
+        else:
+            budget.add('content', scraped_data.get('content', '')[:800], priority=2)
         
-        # Build conversation history
-        history_text = ""
-        if chat_history:
-            history_text = "\n\nPrevious conversation:\n"
-            for msg in chat_history[-5:]:  # Last 5 messages for context
-                history_text += f"{msg['role']}: {msg['content']}\n"
+        # Conversation history: oldest messages are dropped first
+        budget.add('history', items=[
+            f"{msg['role']}: {msg['content']}" for msg in (chat_history or [])[-5:]
+        ], priority=1, keep='last', empty='(none)')
+        budget.add('question', self._capped_question(question), priority=5, min_tokens=256)
+        budget.add('optimized_question', optimized_question, priority=3)
         
-        prompt = f"""You are an expert SEO and web analytics consultant. A user has analyzed a website and wants to ask questions about it.
+        prompt = budget.render(lambda s: f"""You are an expert SEO and web analytics consultant. A user has analyzed a website and wants to ask questions about it.
 
 Website Data:
-{context}
-{history_text}
+{s['overview']}
+Page Content:
+{s['content']}
 
-User's Question: {question}
-Optimized Question: {optimized_question}
+Previous conversation:
+{s['history']}
+
+User's Question: {s['question']}
+Optimized Question: {s['optimized_question']}
 
 IMPORTANT INSTRUCTIONS:
 1. Keep your answer CONCISE and to-the-point (3-5 sentences max) unless the user explicitly asks for detailed analysis
@@ -286,38 +351,50 @@ IMPORTANT INSTRUCTIONS:
 4. Be specific and actionable
 5. If the question asks for "detailed", "comprehensive", or "in-depth" analysis, then provide more detail
 
-Your concise, markdown-formatted answer:"""
+Your concise, markdown-formatted answer:""")
 
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, 'chat')
             return {
                 'answer': response.text,
                 'optimized_question': optimized_question,
                 'original_question': question
             }
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             return {'error': str(e)}
     
+    def _capped_question(self, question):
+        """The user's question cut to AI_QUESTION_MAX_TOKENS"""
+        return truncate_to_tokens(question or '', settings.AI_QUESTION_MAX_TOKENS)
+    
     def _optimize_question(self, question, scraped_data):
         """Optimize/clarify the user's question"""
-        prompt = f"""Given this user question about a website: "{question}"
+        budget = self._budget('optimize_question')
+        budget.add('question', self._capped_question(question), priority=3, min_tokens=256)
+        budget.add('meta_title', scraped_data.get('meta_title') or 'N/A', priority=2)
+        budget.add('meta_description', scraped_data.get('meta_description') or 'N/A', priority=1)
+        prompt = budget.render(lambda s: f"""Given this user question about a website: "{s['question']}"
 
 And knowing the website has:
-- Title: {scraped_data.get('meta_title', 'N/A')}
-- Description: {scraped_data.get('meta_description', 'N/A')}
+- Title: {s['meta_title']}
+- Description: {s['meta_description']}
 - {scraped_data.get('internal_links_count', 0)} internal links
 - {scraped_data.get('external_links_count', 0)} external links
 
-Rephrase this question to be more specific and actionable for SEO/website analysis. Make it clear and focused. Return ONLY the optimized question, nothing else."""
+Rephrase this question to be more specific and actionable for SEO/website analysis. Make it clear and focused. Return ONLY the optimized question, nothing else.""")
 
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, 'optimize_question')
             return response.text.strip()
+        except LLMUnavailableError:
+            raise
         except Exception:
             return question
     
     def _build_website_context(self, scraped_data):
-        """Build context string from scraped data"""
+        """Build the page overview from scraped data"""
         headings_text = ""
         if scraped_data.get('headings'):
             for tag, items in scraped_data['headings'].items():
@@ -334,54 +411,72 @@ Internal Links: {scraped_data.get('internal_links_count', 0)}
 External Links: {scraped_data.get('external_links_count', 0)}
 Images: {scraped_data.get('images_count', 0)}
 Headings: {headings_text}
-Content Preview: {scraped_data.get('content', '')[:800]}
 """
         return context
     
     def generate_comprehensive_analysis(self, scraped_data):
-        """Generate comprehensive SEO analysis and recommendations"""
-        prompt = f"""You are an expert SEO auditor. Perform a comprehensive analysis of this website data.
-
-Meta Title: {scraped_data.get('meta_title', 'N/A')}
-Meta Description: {scraped_data.get('meta_description', 'N/A')}
-Meta Keywords: {scraped_data.get('meta_keywords', 'N/A')}
+        """
+        Generate comprehensive SEO analysis and recommendations.
+        
+        The score and issue list come from the deterministic rule engine;
+        the model only adds the narrative (quick wins, strategy, technical
+        notes and a content assessment) on top of them.
+        """
+        report = evaluate_page(scraped_data)
+        
+        budget = self._budget('comprehensive_analysis')
+        budget.add('meta_title', scraped_data.get('meta_title') or 'N/A', priority=3)
+        budget.add('meta_description', scraped_data.get('meta_description') or 'N/A', priority=2)
+        budget.add('meta_keywords', scraped_data.get('meta_keywords') or 'N/A', priority=1)
+        budget.add('issues', items=[
+            f"- [{issue['severity']}] {issue['message']}" for issue in report['issues']
+        ], priority=4, empty='- None detected')
+        prompt = budget.render(lambda s: f"""You are an expert SEO auditor. An automated audit has already scored this website; explain and build on its findings.
+
+Meta Title: {s['meta_title']}
+Meta Description: {s['meta_description']}
+Meta Keywords: {s['meta_keywords']}
 Content Length: {scraped_data.get('content_length', 0)} bytes
+Word Count: {scraped_data.get('word_count', 'N/A')}
 Internal Links: {scraped_data.get('internal_links_count', 0)}
 External Links: {scraped_data.get('external_links_count', 0)}
 Images: {scraped_data.get('images_count', 0)}
 Language: {scraped_data.get('language', 'N/A')}
 
-Provide a comprehensive SEO audit with:
-1. Overall SEO Score (0-100)
-2. Critical Issues (3-5 most important problems)
-3. Quick Wins (3-5 easy improvements with high impact)
-4. Long-term Strategy (3-5 strategic recommendations)
-5. Technical SEO Issues (3-5 technical problems)
-6. Content Quality Assessment
+Automated SEO Score: {report['score']}/100
+Detected Issues:
+{s['issues']}
+
+Provide:
+1. Quick Wins (3-5 easy improvements with high impact, addressing the detected issues first)
+2. Long-term Strategy (3-5 strategic recommendations)
+3. Technical SEO Issues (3-5 technical problems worth investigating)
+4. Content Quality Assessment
 
 Return ONLY a valid JSON object with this exact structure:
 {{
-  "score": 75,
-  "critical_issues": ["issue 1", "issue 2", "issue 3"],
   "quick_wins": ["win 1", "win 2", "win 3"],
   "strategy": ["strategy 1", "strategy 2", "strategy 3"],
   "technical": ["tech issue 1", "tech issue 2", "tech issue 3"],
   "content_quality": "Assessment paragraph describing content quality"
 }}
 
-Return ONLY the JSON object, no additional text or explanation."""
+Return ONLY the JSON object, no additional text or explanation.""")
 
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            if text.startswith('```'):
-                text = text.split('```')[1]
-                if text.startswith('json'):
-                    text = text[4:]
-            text = text.strip()
-            
-            analysis = json.loads(text)
-            return analysis
+            narrative = self._generate_json(prompt, 'comprehensive_analysis')
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             return {'error': str(e)}
+        
+        return {
+            'score': report['score'],
+            'critical_issues': [
+                issue['message'] for issue in report['issues']
+                if issue['severity'] in ('critical', 'high')
+            ],
+            'issues': report['issues'],
+            **narrative,
+        }
 
@@ -1,5 +1,25 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _running_management_command():
+    """True under `manage.py <command>` (migrate, test, send_outbox_emails, ...), except runserver"""
+    return os.path.basename(sys.argv[0]) == 'manage.py' and sys.argv[1:2] != ['runserver']
+
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connects the signal handlers that keep cached users in sync
+        from . import authentication  # noqa: F401
+
+        # Web processes deliver the outbox from startup, so mail queued before a restart
+        # (or by another process) goes out without waiting for this process to queue more
+        if settings.EMAIL_OUTBOX_MODE == 'thread' and not _running_management_command():
+            from .email_service import outbox_dispatcher
+            outbox_dispatcher.wake()
@@ -0,0 +1,111 @@
+"""
+What changed between two audits of the same page.
+
+A scrape() result is split into sections (meta tags, content, headings,
+links, images, structured data, PageSpeed scores) and each section gets a
+short content hash when the audit is stored. The next audit of the page
+compares hashes, and only the sections whose hash differs are diffed:
+
+    diff_sections(before_data, after_data, ['meta', 'headings']) -> {
+        'meta': {'meta_title': {'before': 'Old', 'after': 'New'}},
+        'headings': {'headings': {'h2': {'added': ['Pricing'], 'removed': []}}},
+    }
+
+Scalars become {'before', 'after'}, dicts are diffed key by key and lists
+report added / removed items (at most MAX_LIST_CHANGES each, with the full
+counts when there are more). JSON-LD blocks and microdata items are
+compared by digest, so a changed catalogue doesn't copy itself into the
+delta. PageSpeed timings vary from run to run; only the scores count.
+"""
+import hashlib
+
+import orjson
+
+
+MAX_LIST_CHANGES = 20
+
+SECTION_FIELDS = {
+    'meta': ('status_code', 'meta_title', 'meta_description', 'meta_keywords', 'og_image', 'canonical_url',
+             'language'),
+    'content': ('content', 'word_count'),
+    'headings': ('headings',),
+    'links': ('internal_links', 'external_links', 'internal_links_count', 'external_links_count'),
+    'images': ('images', 'images_count', 'images_missing_alt_count'),
+}
+SECTIONS = tuple(SECTION_FIELDS) + ('structured_data', 'pagespeed')
+
+
+def _dumps(value):
+    return orjson.dumps(value, option=orjson.OPT_SORT_KEYS, default=str)
+
+
+def _digest(value):
+    return hashlib.blake2b(_dumps(value), digest_size=8).hexdigest()
+
+
+def _structured_data(data):
+    found = data.get('structured_data') or {}
+    return {
+        'types': found.get('types', []),
+        'open_graph': found.get('open_graph', {}),
+        'twitter': found.get('twitter', {}),
+        'json_ld': [_digest(block) for block in found.get('json_ld', [])],
+        'microdata': [_digest(item) for item in found.get('microdata', [])],
+    }
+
+
+def _pagespeed_scores(data):
+    results = data.get('pagespeed_insights') or {}
+    return {
+        strategy: result['scores'] for strategy, result in results.items()
+        if isinstance(result, dict) and 'scores' in result
+    }
+
+
+def section_values(data, section):
+    """The part of a scrape result that makes up a section"""
+    if section == 'structured_data':
+        return _structured_data(data)
+    if section == 'pagespeed':
+        return _pagespeed_scores(data)
+    return {field: data.get(field) for field in SECTION_FIELDS[section]}
+
+
+def section_hashes(data):
+    """{section: content hash} of a scrape result"""
+    return {section: _digest(section_values(data, section)) for section in SECTIONS}
+
+
+def _list_diff(before, after):
+    before_keys = {_dumps(item) for item in before}
+    after_keys = {_dumps(item) for item in after}
+    added = [item for item in after if _dumps(item) not in before_keys]
+    removed = [item for item in before if _dumps(item) not in after_keys]
+    if not added and not removed:
+        return {'reordered': True}
+    delta = {'added': added[:MAX_LIST_CHANGES], 'removed': removed[:MAX_LIST_CHANGES]}
+    if len(added) > MAX_LIST_CHANGES or len(removed) > MAX_LIST_CHANGES:
+        delta.update({'added_count': len(added), 'removed_count': len(removed)})
+    return delta
+
+
+def _diff(before, after):
+    if isinstance(before, dict) and isinstance(after, dict):
+        return {
+            key: _diff(before.get(key), after.get(key))
+            for key in sorted(before.keys() | after.keys())
+            if before.get(key) != after.get(key)
+        }
+    if isinstance(before, list) and isinstance(after, list):
+        return _list_diff(before, after)
+    return {'before': before, 'after': after}
+
+
+def diff_sections(before, after, sections=SECTIONS):
+    """Deltas between two scrape results for the given sections; unchanged sections are left out"""
+    delta = {}
+    for section in sections:
+        changes = _diff(section_values(before, section), section_values(after, section))
+        if changes:
+            delta[section] = changes
+    return delta
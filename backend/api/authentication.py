@@ -1,8 +1,56 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
 from rest_framework.authentication import SessionAuthentication
 
+from .metrics import registry
+
+
 class CsrfExemptSessionAuthentication(SessionAuthentication):
     """SessionAuthentication without CSRF checks for API endpoints"""
-    
+
     def enforce_csrf(self, request):
         return
 
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose per-request user lookup (the session's user id ->
+    User row) is served from the cache for AUTH_USER_CACHE_SECONDS.
+
+    Saving or deleting a user drops its entry, so password changes, logins
+    (last_login) and deactivation take effect on the next request in every
+    process sharing the cache.
+    """
+
+    def get_user(self, user_id):
+        timeout = settings.AUTH_USER_CACHE_SECONDS
+        if not timeout:
+            return super().get_user(user_id)
+
+        cache = caches[settings.AUTH_USER_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            registry.inc('auth_user_cache_total', result='miss')
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, timeout)
+            return user
+
+        registry.inc('auth_user_cache_total', result='hit')
+        return user if self.user_can_authenticate(user) else None
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    caches[settings.AUTH_USER_CACHE_ALIAS].delete(user_cache_key(instance.pk))
+
+
+post_save.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='invalidate_cached_user_save')
+post_delete.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL,
+                    dispatch_uid='invalidate_cached_user_delete')
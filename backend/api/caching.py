@@ -0,0 +1,251 @@
+"""
+Two-level cache: a bounded per-process LRU in front of a shared Django cache.
+
+Hot keys are answered from process memory without a network hop; every
+worker (and node, when the Django cache is shared) sees the same values
+through the shared level. Caches are namespaced:
+
+    psi_cache = get_cache('psi', ttl=3600)
+    report = psi_cache.get_or_set(url, lambda: fetch_report(url))
+
+- Entries expire after ttl in the shared level and after at most
+  local_ttl in the local level, which bounds how long another process can
+  keep serving a value that was deleted or invalidated elsewhere.
+- invalidate() drops the whole namespace by bumping its version (keys
+  embed the version, so old entries are simply never read again).
+- get_or_set() computes a missing value once: threads in this process
+  share one computation and other processes wait on a lock in the shared
+  cache for the leader's result.
+- Hits, misses and evictions per namespace and level are counted in the
+  metrics registry (cache_summary()).
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .coalescing import SingleFlight
+from .metrics import registry
+
+
+MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe LRU of (value, expires_at) with a maximum number of entries"""
+
+    def __init__(self, max_entries, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store value; returns how many entries were evicted to make room"""
+        if self.max_entries <= 0 or ttl <= 0:
+            return 0
+        with self._lock:
+            self._entries[key] = (value, self.clock() + ttl)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TwoLevelCache:
+    def __init__(self, namespace, ttl=300, local_ttl=None, max_local_entries=None, cache_alias=None,
+                 lock_timeout=30, poll_interval=0.02):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local_ttl = min(ttl, settings.TWO_LEVEL_CACHE_LOCAL_TTL_SECONDS if local_ttl is None else local_ttl)
+        self.cache_alias = cache_alias or settings.TWO_LEVEL_CACHE_ALIAS
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        if max_local_entries is None:
+            max_local_entries = settings.TWO_LEVEL_CACHE_LOCAL_MAX_ENTRIES
+        self.local = LocalLRU(max_local_entries)
+        self._flights = SingleFlight(f'cache:{namespace}')
+        self._version = None
+        self._version_checked_at = 0.0
+        self._version_key = f'tlc:{namespace}:version'
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    def _count(self, level, result):
+        registry.inc('cache_requests_total', namespace=self.namespace, level=level, result=result)
+
+    def version(self):
+        """Current namespace version, re-read from the shared cache every local_ttl seconds"""
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.local_ttl:
+            version = self.shared.get(self._version_key)
+            if version is None:
+                # Start from the clock so a lost version key never brings old entries back
+                self.shared.add(self._version_key, int(time.time() * 1000), None)
+                version = self.shared.get(self._version_key, int(time.time() * 1000))
+            self._version, self._version_checked_at = version, now
+        return self._version
+
+    def make_key(self, key):
+        return f'tlc:{self.namespace}:{self.version()}:{key}'
+
+    def get(self, key, default=None):
+        full_key = self.make_key(key)
+        value = self.local.get(full_key)
+        if value is not MISSING:
+            self._count('local', 'hit')
+            return value
+        self._count('local', 'miss')
+
+        value = self.shared.get(full_key, MISSING)
+        if value is MISSING:
+            self._count('shared', 'miss')
+            return default
+        self._count('shared', 'hit')
+        self._set_local(full_key, value)
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        full_key = self.make_key(key)
+        self.shared.set(full_key, value, ttl)
+        self._set_local(full_key, value, ttl)
+
+    def _set_local(self, full_key, value, ttl=None):
+        evicted = self.local.set(full_key, value, min(self.local_ttl, self.ttl if ttl is None else ttl))
+        if evicted:
+            registry.inc('cache_evictions_total', evicted, namespace=self.namespace)
+
+    def delete(self, key):
+        """Delete key everywhere; other processes may serve their local copy for up to local_ttl"""
+        full_key = self.make_key(key)
+        self.local.delete(full_key)
+        self.shared.delete(full_key)
+
+    def invalidate(self):
+        """Drop every entry in the namespace"""
+        try:
+            self._version = self.shared.incr(self._version_key)
+        except ValueError:
+            self._version = int(time.time() * 1000)
+            self.shared.set(self._version_key, self._version, None)
+        self._version_checked_at = time.monotonic()
+        self.local.clear()
+
+    def get_or_set(self, key, func, ttl=None):
+        """Return the cached value for key, computing it with func() (once) on a miss"""
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        value, _ = self._flights.do(key, lambda: self._compute(key, func, ttl))
+        return value
+
+    def _compute(self, key, func, ttl):
+        full_key = self.make_key(key)
+        lock_key = f'{full_key}:lock'
+        token = uuid.uuid4().hex
+        if not self.shared.add(lock_key, token, self.lock_timeout):
+            # Another process is computing it; wait for its result
+            registry.inc('cache_stampede_waits_total', namespace=self.namespace)
+            give_up_at = time.monotonic() + self.lock_timeout
+            while time.monotonic() < give_up_at:
+                value = self.shared.get(full_key, MISSING)
+                if value is not MISSING:
+                    self._set_local(full_key, value, ttl)
+                    return value
+                if self.shared.get(lock_key) is None:
+                    break
+                time.sleep(self.poll_interval)
+            # The leader failed or timed out; compute it ourselves
+            token = None
+
+        try:
+            registry.inc('cache_computations_total', namespace=self.namespace)
+            value = func()
+            self.set(key, value, ttl)
+            return value
+        finally:
+            if token is not None and self.shared.get(lock_key) == token:
+                self.shared.delete(lock_key)
+
+    def clear_local(self):
+        self.local.clear()
+        self._version = None
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace, **options):
+    """The process-wide TwoLevelCache for namespace (options apply on first use)"""
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = _caches[namespace] = TwoLevelCache(namespace, **options)
+        return cache
+
+
+def clear_local_caches():
+    """Empty every local level in this process (tests)"""
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.clear_local()
+
+
+def cache_summary():
+    """Hits, misses, hit ratio, evictions and computations per namespace"""
+    summary = {}
+
+    def entry(namespace):
+        return summary.setdefault(namespace, {
+            'local': {'hit': 0, 'miss': 0}, 'shared': {'hit': 0, 'miss': 0},
+            'evictions': 0, 'computations': 0, 'stampede_waits': 0,
+        })
+
+    for counter in registry.snapshot()['counters']:
+        labels = counter['labels']
+        if counter['name'] == 'cache_requests_total':
+            entry(labels['namespace'])[labels['level']][labels['result']] += counter['value']
+        elif counter['name'] == 'cache_evictions_total':
+            entry(labels['namespace'])['evictions'] += counter['value']
+        elif counter['name'] == 'cache_computations_total':
+            entry(labels['namespace'])['computations'] += counter['value']
+        elif counter['name'] == 'cache_stampede_waits_total':
+            entry(labels['namespace'])['stampede_waits'] += counter['value']
+
+    for stats in summary.values():
+        requests = stats['local']['hit'] + stats['local']['miss']
+        hits = stats['local']['hit'] + stats['shared']['hit']
+        stats['hit_ratio'] = round(hits / requests, 4) if requests else None
+    return summary
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import registry
+
+
+def request_key(*parts):
+    """Stable hash of the parts that make two requests identical"""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def normalize_url(url):
+    """Normalize a URL so trivially different spellings coalesce together"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f'{host}:{port}'
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    In-process request coalescing: the first caller for a key runs the
+    function, concurrent callers with the same key wait for and share its
+    result (or exception).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return (result, shared) where shared is True for coalesced callers"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            registry.inc('coalesced_requests_total', group=self.name)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            registry.inc('coalesced_executions_total', group=self.name)
+
+
+class CacheSingleFlight:
+    """
+    Cross-worker request coalescing on top of a shared Django cache.
+
+    The leader takes a lock with cache.add() and publishes its (picklable)
+    result under a per-flight key; other workers poll for that result. If the
+    leader fails or the wait times out, followers run the function themselves.
+    """
+
+    def __init__(self, name, cache_alias='default', lock_timeout=120, result_ttl=30, poll_interval=0.05):
+        self.name = name
+        self.cache_alias = cache_alias
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+
+    def do(self, key, func):
+        cache = caches[self.cache_alias]
+        lock_key = f'singleflight:{self.name}:{key}'
+        flight_id = uuid.uuid4().hex
+
+        if cache.add(lock_key, flight_id, self.lock_timeout):
+            try:
+                result = func()
+                cache.set(f'{lock_key}:{flight_id}', result, self.result_ttl)
+                return result, False
+            finally:
+                cache.delete(lock_key)
+
+        give_up_at = time.monotonic() + self.lock_timeout
+        leader_id = cache.get(lock_key)
+        while leader_id is not None and time.monotonic() < give_up_at:
+            # The leader publishes its result before releasing the lock
+            leader_done = cache.get(lock_key) != leader_id
+            result = cache.get(f'{lock_key}:{leader_id}')
+            if result is not None:
+                registry.inc('coalesced_requests_total', group=self.name)
+                return result, True
+            if leader_done:
+                break
+            time.sleep(self.poll_interval)
+
+        # The leader published nothing we could read; do the work ourselves
+        return func(), False
+
+
+_local_flights = {}
+_local_flights_lock = threading.Lock()
+
+
+def coalesce(group, key, func):
+    """
+    Run func once per key across concurrent identical requests.
+
+    Threads in this process always share one execution. With
+    REQUEST_COALESCING_CROSS_WORKER enabled, the in-process leader also
+    coordinates with other workers through the shared cache.
+
+    Returns (result, shared)
+    """
+    with _local_flights_lock:
+        local = _local_flights.get(group)
+        if local is None:
+            local = _local_flights[group] = SingleFlight(group)
+
+    if settings.REQUEST_COALESCING_CROSS_WORKER:
+        shared_flight = CacheSingleFlight(group, cache_alias=settings.REQUEST_COALESCING_CACHE_ALIAS)
+        outcome = {}
+
+        def run_shared():
+            result, outcome['shared'] = shared_flight.do(key, func)
+            return result
+
+        result, shared = local.do(key, run_shared)
+        return result, shared or outcome.get('shared', False)
+
+    return local.do(key, func)
+
+
+def coalescing_summary():
+    """Executions and avoided duplicate executions per group"""
+    summary = {}
+    for counter in registry.snapshot()['counters']:
+        group = counter['labels'].get('group')
+        if group is None:
+            continue
+        entry = summary.setdefault(group, {'executions': 0, 'duplicates_avoided': 0})
+        if counter['name'] == 'coalesced_executions_total':
+            entry['executions'] += counter['value']
+        elif counter['name'] == 'coalesced_requests_total':
+            entry['duplicates_avoided'] += counter['value']
+    return summary
@@ -1,20 +1,26 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
 import logging
+import threading
+
+from .metrics import registry
+from .models import EmailOutbox
 
 logger = logging.getLogger(__name__)
 
 class EmailService:
     @staticmethod
-    def send_otp_email(email, otp_code, otp_type):
-        """Send OTP email for registration or password reset"""
-        try:
-            if otp_type == 'registration':
-                subject = 'Welcome to SiteScope - Verify Your Email'
-                message = f"""
+    def build_otp_email(otp_code, otp_type):
+        """Return (subject, message) for an OTP email, or None for an unknown type"""
+        if otp_type == 'registration':
+            subject = 'Welcome to SiteScope - Verify Your Email'
+            message = f"""
 Hello,
 
-Welcome to SiteScope! 
+Welcome to SiteScope!
 
 Your verification code is: {otp_code}
 
@@ -25,9 +31,9 @@ If you didn't request this, please ignore this email.
 Best regards,
 SiteScope Team
 """
-            elif otp_type == 'password_reset':
-                subject = 'SiteScope - Password Reset Request'
-                message = f"""
+        elif otp_type == 'password_reset':
+            subject = 'SiteScope - Password Reset Request'
+            message = f"""
 Hello,
 
 We received a request to reset your password.
@@ -41,9 +47,19 @@ If you didn't request this, please ignore this email and your password will rema
 Best regards,
 SiteScope Team
 """
-            else:
-                logger.error(f"Invalid OTP type: {otp_type}")
+        else:
+            logger.error(f"Invalid OTP type: {otp_type}")
+            return None
+        return subject, message
+
+    @staticmethod
+    def send_otp_email(email, otp_code, otp_type):
+        """Send OTP email for registration or password reset right away"""
+        try:
+            content = EmailService.build_otp_email(otp_code, otp_type)
+            if content is None:
                 return False
+            subject, message = content
 
             send_mail(
                 subject=subject,
@@ -52,10 +68,193 @@ SiteScope Team
                 recipient_list=[email],
                 fail_silently=False,
             )
-            
+
             logger.info(f"Email sent successfully to {email}")
             return True
-            
+
         except Exception as e:
             logger.error(f"Email sending failed: {str(e)}")
             return False
+
+    @staticmethod
+    def queue_otp_email(email, otp_code, otp_type):
+        """
+        Queue an OTP email in the outbox so the request doesn't wait on SMTP.
+
+        With EMAIL_OUTBOX_MODE='inline' the email is sent immediately instead.
+        """
+        if settings.EMAIL_OUTBOX_MODE == 'inline':
+            return EmailService.send_otp_email(email, otp_code, otp_type)
+
+        content = EmailService.build_otp_email(otp_code, otp_type)
+        if content is None:
+            return False
+        subject, message = content
+        EmailOutbox.objects.create(to_email=email, subject=subject, body=message)
+        registry.inc('email_outbox_queued_total')
+        if settings.EMAIL_OUTBOX_MODE == 'thread':
+            transaction.on_commit(outbox_dispatcher.wake)
+        return True
+
+
+def claim_outbox_batch(batch_size):
+    """
+    Claim up to batch_size due messages for this worker.
+
+    Claimed rows move to 'sending' until EMAIL_OUTBOX_CLAIM_SECONDS from now;
+    rows whose claim lapsed (worker died mid-batch) are claimed again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[EmailOutbox.STATUS_PENDING, EmailOutbox.STATUS_SENDING], available_at__lte=now)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            EmailOutbox.objects.filter(id__in=ids).update(
+                status=EmailOutbox.STATUS_SENDING,
+                attempts=F('attempts') + 1,
+                available_at=now + timezone.timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_SECONDS),
+            )
+    return list(EmailOutbox.objects.filter(id__in=ids).order_by('id'))
+
+
+def deliver_outbox(batch_size=None, connection=None):
+    """
+    Send one batch of queued emails over a single mail connection.
+
+    Pass an open connection to reuse it across batches; otherwise one is
+    opened for the batch and closed afterwards. Failed messages are retried
+    with exponential backoff up to EMAIL_OUTBOX_MAX_ATTEMPTS.
+
+    Returns (sent, failed)
+    """
+    messages = claim_outbox_batch(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not messages:
+        return 0, 0
+
+    owns_connection = connection is None
+    if owns_connection:
+        connection = get_connection(fail_silently=False)
+
+    sent_ids = []
+    failed = 0
+    try:
+        for outbox in messages:
+            email = EmailMessage(outbox.subject, outbox.body, settings.DEFAULT_FROM_EMAIL, [outbox.to_email])
+            try:
+                _send(connection, email)
+                sent_ids.append(outbox.id)
+            except Exception as e:
+                failed += 1
+                _record_failure(outbox, e)
+                # The connection may be broken; reconnect for the next message
+                connection.close()
+    finally:
+        if owns_connection:
+            connection.close()
+        if sent_ids:
+            # The body holds the OTP; nothing needs it once it's delivered
+            EmailOutbox.objects.filter(id__in=sent_ids).update(
+                status=EmailOutbox.STATUS_SENT, sent_at=timezone.now(), last_error='', body=''
+            )
+
+    registry.inc('email_outbox_sent_total', len(sent_ids))
+    registry.inc('email_outbox_failed_attempts_total', failed)
+    return len(sent_ids), failed
+
+
+def _send(connection, email):
+    """Send on the open connection, reconnecting once if the relay dropped it"""
+    # open() returns False (a no-op) while the connection is already open
+    reused = connection.open() is False
+    try:
+        connection.send_messages([email])
+    except Exception:
+        if not reused:
+            raise
+        connection.close()
+        connection.open()
+        connection.send_messages([email])
+
+
+def _record_failure(outbox, error):
+    logger.error(f"Email to {outbox.to_email} failed (attempt {outbox.attempts}): {error}")
+    if outbox.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        outbox.status = EmailOutbox.STATUS_FAILED
+        outbox.body = ''
+    else:
+        outbox.status = EmailOutbox.STATUS_PENDING
+        delay = settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (outbox.attempts - 1)
+        outbox.available_at = timezone.now() + timezone.timedelta(seconds=delay)
+    outbox.last_error = str(error)[:1000]
+    outbox.save(update_fields=['status', 'available_at', 'last_error', 'body'])
+
+
+def purge_outbox(batch_size=500):
+    """Delete one bounded batch of sent / failed emails older than EMAIL_OUTBOX_RETENTION_DAYS"""
+    cutoff = timezone.now() - timezone.timedelta(days=settings.EMAIL_OUTBOX_RETENTION_DAYS)
+    ids = list(
+        EmailOutbox.objects.filter(status__in=[EmailOutbox.STATUS_SENT, EmailOutbox.STATUS_FAILED],
+                                   created_at__lt=cutoff)
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if ids:
+        EmailOutbox.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def drain_outbox(connection):
+    """Deliver batches until nothing is due; returns the number sent"""
+    total = 0
+    while True:
+        sent, failed = deliver_outbox(connection=connection)
+        total += sent
+        if not sent and not failed:
+            return total
+
+
+class OutboxDispatcher:
+    """
+    In-process outbox worker (EMAIL_OUTBOX_MODE='thread'): a daemon thread,
+    started when the app is ready (or by the first queued email after a
+    fork), woken after each commit that queues
+    mail and polling every EMAIL_OUTBOX_POLL_SECONDS for retries. The mail
+    connection stays open while mail keeps arriving and is closed after
+    EMAIL_OUTBOX_LINGER_SECONDS without any; old delivered mail is purged
+    once the queue goes quiet.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait(timeout=settings.EMAIL_OUTBOX_POLL_SECONDS)
+            self._event.clear()
+            connection = get_connection(fail_silently=False)
+            try:
+                drain_outbox(connection)
+                while self._event.wait(timeout=settings.EMAIL_OUTBOX_LINGER_SECONDS):
+                    self._event.clear()
+                    drain_outbox(connection)
+                purge_outbox()
+            except Exception as e:
+                logger.error(f"Email outbox delivery failed: {e}")
+            finally:
+                connection.close()
+                close_old_connections()
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,243 @@
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .retrieval import STOPWORDS, tokenize
+
+
+# Words (letters and digits in any script) plus the punctuation that ends a RAKE phrase candidate
+SEGMENT_PATTERN = re.compile(r'[^\W_]+|[.,;:!?()\[\]{}"|/\\\u00ab\u00bb\u201c\u201d\u3001\u3002\uff01\uff0c\uff1f]+|\s[-\u2013\u2014]\s')
+
+MAX_PHRASE_WORDS = 4
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundCorpus:
+    """
+    Document frequencies of terms across previously audited pages.
+
+    Terms are mapped to integer ids and document frequencies kept in a NumPy
+    array, so IDF for a whole page vocabulary is one vectorized expression.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.doc_freq = np.zeros(1024, dtype=np.int64)
+        self.n_docs = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.n_docs
+
+    def _term_ids(self, terms, add=False):
+        if not add:
+            return np.fromiter((self.vocabulary.get(term, -1) for term in terms), dtype=np.int64, count=len(terms))
+        ids = [self.vocabulary.setdefault(term, len(self.vocabulary)) for term in terms]
+        if len(self.vocabulary) > len(self.doc_freq):
+            grown = np.zeros(max(len(self.vocabulary), 2 * len(self.doc_freq)), dtype=np.int64)
+            grown[:len(self.doc_freq)] = self.doc_freq
+            self.doc_freq = grown
+        return np.asarray(ids, dtype=np.int64)
+
+    def add_document(self, text):
+        terms = list(set(tokenize(text)))
+        with self._lock:
+            ids = self._term_ids(terms, add=True)
+            self.doc_freq[ids] += 1
+            self.n_docs += 1
+
+    def idf(self, terms):
+        """Smoothed IDF for a list of terms (unknown terms get the maximum)"""
+        with self._lock:
+            ids = self._term_ids(terms)
+            doc_freq = np.where(ids >= 0, self.doc_freq[np.maximum(ids, 0)], 0)
+            n_docs = self.n_docs
+        return np.log((1 + n_docs) / (1 + doc_freq)) + 1.0
+
+
+def _runs(mask):
+    """(starts, lengths) of consecutive True runs in a boolean array"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def extract_keywords(text, headings=None, title='', corpus=None, top_n=15, heading_weight=3):
+    """
+    Rank unigram and phrase keyword candidates for a page.
+
+    Unigrams are scored by TF-IDF against the background corpus; title and
+    heading terms count heading_weight times. Phrases (2-4 words) are RAKE
+    candidates - runs of words between stopwords and punctuation - whose
+    degree/frequency score is scaled by the mean IDF of their words, so
+    boilerplate phrases common to every page sink.
+
+    The text is tokenized once; counting, RAKE word scores and phrase
+    grouping all run over integer token ids with NumPy.
+    """
+    emphasis = '. '.join([title] + list(headings or []))
+    stream = text + ('. ' + emphasis) * heading_weight
+    vocabulary = {}
+    tokens = SEGMENT_PATTERN.findall(stream.casefold())
+    ids = np.fromiter((vocabulary.setdefault(token, len(vocabulary)) for token in tokens),
+                      dtype=np.int64, count=len(tokens))
+    terms = list(vocabulary)
+    if not terms:
+        return {'unigrams': [], 'phrases': []}
+
+    is_term = np.fromiter((term[0].isalnum() and term not in STOPWORDS for term in terms),
+                          dtype=bool, count=len(terms))
+    in_phrase = is_term & ~np.fromiter((term.isdigit() for term in terms), dtype=bool, count=len(terms))
+    idf = corpus.idf(terms) if corpus is not None and len(corpus) else np.ones(len(terms))
+
+    counts = np.bincount(ids, minlength=len(terms))
+    scores = np.where(is_term, counts, 0) * idf
+    total = counts[is_term].sum()
+    scores = scores / total if total else scores
+    # Very short tokens are rarely useful keywords
+    scores[np.fromiter((len(term) < 3 for term in terms), dtype=bool, count=len(terms))] = 0
+
+    top = np.argsort(-scores, kind='stable')[:top_n]
+    unigrams = [
+        {'term': terms[i], 'score': round(float(scores[i]), 5), 'count': int(counts[i])}
+        for i in top if scores[i] > 0
+    ]
+
+    # RAKE word scores: degree / frequency over all candidate runs
+    starts, lengths = _runs(in_phrase[ids])
+    positions = np.flatnonzero(in_phrase[ids])
+    run_ids = ids[positions]
+    frequency = np.bincount(run_ids, minlength=len(terms))
+    degree = np.bincount(run_ids, weights=np.repeat(lengths, lengths), minlength=len(terms))
+    word_score = np.divide(degree, frequency, out=np.zeros(len(terms)), where=frequency > 0)
+
+    keep = (lengths >= 2) & (lengths <= MAX_PHRASE_WORDS)
+    if not keep.any():
+        return {'unigrams': unigrams, 'phrases': []}
+    starts, lengths = starts[keep], lengths[keep]
+    offsets = np.arange(MAX_PHRASE_WORDS)
+    filled = offsets < lengths[:, None]
+    phrase_ids = np.where(filled, ids[np.minimum(starts[:, None] + offsets, len(ids) - 1)], -1)
+    phrase_ids, phrase_counts = np.unique(phrase_ids, axis=0, return_counts=True)
+
+    filled = phrase_ids >= 0
+    safe_ids = np.maximum(phrase_ids, 0)
+    phrase_scores = (
+        np.where(filled, word_score[safe_ids], 0).sum(axis=1)
+        * np.where(filled, idf[safe_ids], 0).sum(axis=1) / filled.sum(axis=1)
+        * np.log1p(phrase_counts)
+    )
+
+    top = np.argsort(-phrase_scores, kind='stable')[:top_n]
+    phrases = [
+        {
+            'phrase': ' '.join(terms[i] for i in phrase_ids[row] if i >= 0),
+            'score': round(float(phrase_scores[row]), 4),
+            'count': int(phrase_counts[row]),
+        }
+        for row in top if phrase_scores[row] > 0
+    ]
+    return {'unigrams': unigrams, 'phrases': phrases}
+
+
+class CorpusProvider:
+    """
+    Process-wide background corpus, built from the most recently stored
+    audits (their search index text, or the stored content excerpt when
+    search is off) and refreshed every KEYWORD_CORPUS_REFRESH_SECONDS so
+    pages audited by other workers are included.
+
+    Builds run on a daemon thread, started once the current transaction
+    commits (like the email outbox thread): requests keep using the current
+    corpus meanwhile, and an empty one until the first build is done.
+    """
+
+    def __init__(self, refresh_seconds=None, max_documents=None):
+        self._refresh_seconds = refresh_seconds
+        self._max_documents = max_documents
+        self._corpus = None
+        self._built_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    @property
+    def refresh_seconds(self):
+        if self._refresh_seconds is None:
+            return settings.KEYWORD_CORPUS_REFRESH_SECONDS
+        return self._refresh_seconds
+
+    @property
+    def max_documents(self):
+        if self._max_documents is None:
+            return settings.KEYWORD_CORPUS_MAX_DOCUMENTS
+        return self._max_documents
+
+    def texts(self):
+        from .models import AuditRecord
+        from .search import get_search_backend
+
+        backend = get_search_backend()
+        if backend is not None:
+            return backend.recent_texts(self.max_documents)
+        audits = AuditRecord.objects.order_by('-id').only('id', 'payload')[:self.max_documents]
+        return (audit.get_data().get('content') or '' for audit in audits.iterator())
+
+    def build(self):
+        corpus = BackgroundCorpus()
+        for text in self.texts():
+            corpus.add_document(text)
+        return corpus
+
+    def refresh(self):
+        """Rebuild the corpus now and swap it in"""
+        try:
+            corpus = self.build()
+        except Exception as e:
+            logger.error(f"Keyword corpus build failed: {e}")
+            corpus = None
+        with self._lock:
+            # After a failure the current corpus is kept until the next refresh is due
+            if corpus is not None:
+                self._corpus = corpus
+            self._built_at = time.monotonic()
+            self._refreshing = False
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            close_old_connections()
+
+    def _start_refresh(self):
+        threading.Thread(target=self._refresh_in_background, name='keyword-corpus', daemon=True).start()
+
+    def get(self):
+        """The current corpus, never waiting for a build; schedules one when it is due"""
+        with self._lock:
+            corpus = self._corpus
+            due = corpus is None or time.monotonic() - self._built_at > self.refresh_seconds
+            if due and not self._refreshing:
+                self._refreshing = True
+                transaction.on_commit(self._start_refresh)
+        return corpus if corpus is not None else BackgroundCorpus()
+
+    def add_document(self, text):
+        """Add a newly audited page without waiting for the next refresh"""
+        with self._lock:
+            corpus = self._corpus
+        if corpus is not None and text:
+            corpus.add_document(text)
+
+    def reset(self):
+        with self._lock:
+            self._corpus = None
+            self._refreshing = False
+
+
+corpus_provider = CorpusProvider()
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import registry
+
+
+def _string_list():
+    return {'type': 'array', 'items': {'type': 'string'}}
+
+
+def _suggestion_list(field):
+    return {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'properties': {
+                field: {'type': 'string'},
+                'length': {'type': 'integer'},
+                'reason': {'type': 'string'},
+            },
+            'required': [field, 'length', 'reason'],
+        },
+    }
+
+
+# Response schemas per GeminiAIService endpoint, in the OpenAPI subset Gemini accepts
+RESPONSE_SCHEMAS = {
+    'meta_title': _suggestion_list('title'),
+    'meta_description': _suggestion_list('description'),
+    'keywords': {
+        'type': 'object',
+        'properties': {
+            'primary': _string_list(),
+            'secondary': _string_list(),
+            'long_tail': _string_list(),
+            'lsi': _string_list(),
+        },
+        'required': ['primary', 'secondary', 'long_tail', 'lsi'],
+    },
+    'content_improvements': {
+        'type': 'object',
+        'properties': {
+            'structure': _string_list(),
+            'keywords': _string_list(),
+            'readability': _string_list(),
+            'seo': _string_list(),
+            'cta': _string_list(),
+        },
+        'required': ['structure', 'keywords', 'readability', 'seo', 'cta'],
+    },
+    'heading_suggestions': {
+        'type': 'object',
+        'properties': {
+            'h1': _string_list(),
+            'h2': _string_list(),
+            'h3': _string_list(),
+            'recommendations': _string_list(),
+        },
+        'required': ['h1', 'h2', 'h3', 'recommendations'],
+    },
+    # Score and critical issues come from the local rule engine (seo_rules)
+    'comprehensive_analysis': {
+        'type': 'object',
+        'properties': {
+            'quick_wins': _string_list(),
+            'strategy': _string_list(),
+            'technical': _string_list(),
+            'content_quality': {'type': 'string'},
+        },
+        'required': ['quick_wins', 'strategy', 'technical', 'content_quality'],
+    },
+}
+
+
+class LLMResponseError(ValueError):
+    """The model response could not be turned into schema-valid JSON"""
+
+
+FENCE_PATTERN = re.compile(r'```(?:json|JSON)?\s*(.*?)(?:```|$)', re.DOTALL)
+TRAILING_COMMA_PATTERN = re.compile(r',(\s*[}\]])')
+SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+
+
+def _json_candidates(text):
+    """
+    Candidate JSON strings: the outermost JSON value with surrounding prose
+    cut away, and everything from the first bracket on (for truncated output)
+    """
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        return [text]
+    start = min(starts)
+    end = max(text.rfind('}'), text.rfind(']'))
+    candidates = [text[start:end + 1]] if end > start else []
+    return candidates + [_close_truncated(text[start:])]
+
+
+def _close_truncated(text):
+    """Close an unterminated string and any open brackets (truncated output)"""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '[{':
+            stack.append(']' if char == '[' else '}')
+        elif char in ']}' and stack:
+            stack.pop()
+
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(',')
+    return text + ''.join(reversed(stack))
+
+
+def repair_json(text):
+    """
+    Parse model output as JSON, recovering from common formatting drift:
+    code fences, prose around the JSON, smart quotes, trailing commas and
+    truncated output.
+
+    Returns (value, repaired)
+    """
+    try:
+        return json.loads(text), False
+    except (TypeError, ValueError):
+        pass
+
+    candidate = text.strip()
+    fenced = FENCE_PATTERN.search(candidate)
+    if fenced:
+        candidate = fenced.group(1).strip()
+    candidate = TRAILING_COMMA_PATTERN.sub(r'\1', candidate.translate(SMART_QUOTES))
+
+    for attempt in _json_candidates(candidate):
+        try:
+            return json.loads(attempt), True
+        except ValueError:
+            continue
+    raise LLMResponseError('Model response was not valid JSON')
+
+
+def validate(value, schema, path='$'):
+    """
+    Validate (and lightly coerce) a value against a schema subset:
+    type, properties, required and items. Returns (value, errors).
+    """
+    errors = []
+    expected = schema.get('type')
+
+    if expected == 'object':
+        if not isinstance(value, dict):
+            return value, [f'{path}: expected object']
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f'{path}.{key}: missing')
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value:
+                value[key], sub_errors = validate(value[key], subschema, f'{path}.{key}')
+                errors.extend(sub_errors)
+    elif expected == 'array':
+        if not isinstance(value, list):
+            return value, [f'{path}: expected array']
+        items = schema.get('items')
+        if items:
+            for i, item in enumerate(value):
+                value[i], sub_errors = validate(item, items, f'{path}[{i}]')
+                errors.extend(sub_errors)
+    elif expected == 'integer':
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            errors.append(f'{path}: expected integer')
+        else:
+            try:
+                value = int(float(value))
+            except (ValueError, OverflowError):
+                errors.append(f'{path}: expected integer')
+    elif expected == 'string':
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        elif not isinstance(value, str):
+            errors.append(f'{path}: expected string')
+
+    return value, errors
+
+
+class FailedCallTracker:
+    """
+    Remembers recently failed prompts so that an identical prompt arriving
+    shortly afterwards can be counted as a user retry.
+    """
+
+    def __init__(self, window_seconds=600, max_entries=1024):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(endpoint, prompt):
+        return hashlib.sha1(f'{endpoint}\0{prompt}'.encode('utf-8')).hexdigest()
+
+    def record_failure(self, key):
+        with self._lock:
+            self._failures[key] = time.monotonic()
+            self._failures.move_to_end(key)
+            while len(self._failures) > self.max_entries:
+                self._failures.popitem(last=False)
+
+    def is_retry(self, key):
+        with self._lock:
+            failed_at = self._failures.pop(key, None)
+        return failed_at is not None and time.monotonic() - failed_at <= self.window_seconds
+
+
+failed_calls = FailedCallTracker()
+
+
+def parse_llm_json(text, endpoint):
+    """
+    Parse and validate a model response for an endpoint, recording whether it
+    parsed cleanly, needed repair or failed.
+    """
+    schema = RESPONSE_SCHEMAS[endpoint]
+    try:
+        value, repaired = repair_json(text)
+    except LLMResponseError:
+        registry.inc('llm_json_parse_total', endpoint=endpoint, result='failed')
+        raise
+
+    value, errors = validate(value, schema)
+    if errors:
+        registry.inc('llm_json_parse_total', endpoint=endpoint, result='invalid')
+        raise LLMResponseError('Model response did not match the expected format: ' + '; '.join(errors[:3]))
+
+    registry.inc('llm_json_parse_total', endpoint=endpoint, result='repaired' if repaired else 'clean')
+    return value
@@ -0,0 +1,279 @@
+"""
+LLM providers behind one interface, so the AI service is not tied to a
+single vendor SDK and can be load-tested without real API calls.
+
+- GeminiProvider: google.generativeai (production)
+- FakeProvider: deterministic in-process replies with configurable latency,
+  streaming and error injection
+- HttpProvider: talks to the fake server in api/stub_servers.py (or anything
+  speaking the same small protocol) over real sockets
+
+Select one with the LLM_PROVIDER setting.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import google.generativeai as genai
+import requests
+from decouple import Config, RepositoryEnv
+from django.conf import settings
+from google.api_core import exceptions as google_exceptions
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderResponse:
+    """Provider-neutral reply; usage_metadata mirrors Gemini's token counts when known"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class LLMProvider(ABC):
+    """
+    Interface every provider implements.
+
+    generate() returns an object with .text (and optionally .usage_metadata)
+    and must raise TimeoutError or a google.api_core exception from
+    resilience.RETRYABLE_ERRORS for transient failures so calls are retried.
+    """
+    name = 'base'
+
+    def is_configured(self):
+        return True
+
+    @abstractmethod
+    def generate(self, prompt, timeout, generation_config=None):
+        """Return the whole reply"""
+
+    def stream(self, prompt, timeout, generation_config=None):
+        """Yield the reply in text chunks; providers without streaming yield it whole"""
+        yield self.generate(prompt, timeout, generation_config).text
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def __init__(self, api_key='', model_name='gemini-2.5-flash', model=None):
+        self.model = model
+        if self.model is None and api_key:
+            try:
+                genai.configure(api_key=api_key)
+                self.model = genai.GenerativeModel(model_name)
+            except Exception:
+                logger.exception("Error configuring Gemini")
+                self.model = None
+
+    @classmethod
+    def from_env(cls):
+        """Read GEMINI_API_KEY from api/.env"""
+        env_path = os.path.join(os.path.dirname(__file__), '.env')
+        try:
+            config = Config(RepositoryEnv(env_path))
+            api_key = config('GEMINI_API_KEY', default='').strip().strip("'\"")
+        except Exception as e:
+            logger.warning(f"Error loading .env: {e}")
+            api_key = ''
+        return cls(api_key=api_key, model_name=settings.LLM_GEMINI_MODEL)
+
+    def is_configured(self):
+        return self.model is not None
+
+    def _options(self, timeout, generation_config):
+        options = {'request_options': {'timeout': timeout}}
+        if generation_config:
+            options['generation_config'] = generation_config
+        return options
+
+    def generate(self, prompt, timeout, generation_config=None):
+        return self.model.generate_content(prompt, **self._options(timeout, generation_config))
+
+    def stream(self, prompt, timeout, generation_config=None):
+        response = self.model.generate_content(prompt, stream=True, **self._options(timeout, generation_config))
+        for chunk in response:
+            yield chunk.text
+
+
+def example_for_schema(schema, seed):
+    """A deterministic value that satisfies one of the RESPONSE_SCHEMAS"""
+    kind = schema.get('type')
+    if kind == 'object':
+        return {
+            name: example_for_schema(child, f'{seed}.{name}')
+            for name, child in schema.get('properties', {}).items()
+        }
+    if kind == 'array':
+        return [example_for_schema(schema.get('items', {}), f'{seed}.{i}') for i in range(3)]
+    if kind == 'integer':
+        return int(hashlib.md5(seed.encode()).hexdigest()[:4], 16) % 60 + 20
+    digest = hashlib.md5(seed.encode()).hexdigest()[:8]
+    return f'Suggestion {digest}'
+
+
+class FakeLLM:
+    """
+    Deterministic model stand-in shared by FakeProvider and the fake server.
+
+    Replies depend only on the prompt and response schema. latency (+ up to
+    jitter) is slept per call, error_rate of calls fail with a transient
+    error, and streamed replies are split into chunk_words-word chunks sent
+    chunk_delay apart.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, chunk_words=8, chunk_delay=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_words = chunk_words
+        self.chunk_delay = chunk_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def reply(self, prompt, response_schema=None):
+        seed = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        if response_schema:
+            return json.dumps(example_for_schema(response_schema, seed))
+        return (
+            f'Here is an answer based on the page content (reference {seed}). '
+            'The page covers its main topic clearly, but the meta description could be more specific '
+            'and the headings could include the primary keyword.'
+        )
+
+    def delay(self):
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def should_fail(self):
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def chunks(self, text):
+        words = text.split(' ')
+        for i in range(0, len(words), self.chunk_words):
+            yield ' '.join(words[i:i + self.chunk_words]) + (' ' if i + self.chunk_words < len(words) else '')
+
+
+class FakeProvider(LLMProvider):
+    name = 'fake'
+
+    def __init__(self, fake=None, **options):
+        self.fake = fake or FakeLLM(**options)
+
+    def _wait(self, timeout):
+        delay = self.fake.delay()
+        if delay > timeout:
+            time.sleep(timeout)
+            raise google_exceptions.DeadlineExceeded('fake provider timed out')
+        time.sleep(delay)
+        if self.fake.should_fail():
+            raise google_exceptions.ServiceUnavailable('fake provider injected failure')
+
+    def generate(self, prompt, timeout, generation_config=None):
+        self._wait(timeout)
+        schema = (generation_config or {}).get('response_schema')
+        return ProviderResponse(self.fake.reply(prompt, schema))
+
+    def stream(self, prompt, timeout, generation_config=None):
+        self._wait(timeout)
+        schema = (generation_config or {}).get('response_schema')
+        for chunk in self.fake.chunks(self.fake.reply(prompt, schema)):
+            if self.fake.chunk_delay:
+                time.sleep(self.fake.chunk_delay)
+            yield chunk
+
+
+HTTP_ERRORS = {
+    429: google_exceptions.TooManyRequests,
+    500: google_exceptions.InternalServerError,
+    503: google_exceptions.ServiceUnavailable,
+    504: google_exceptions.DeadlineExceeded,
+}
+
+
+class HttpProvider(LLMProvider):
+    """
+    Client for the fake LLM server protocol:
+    POST {base_url}/generate {"prompt", "response_schema", "stream"} ->
+    {"text": ...} or, when streaming, newline-delimited {"text": chunk} lines.
+    """
+    name = 'http'
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def is_configured(self):
+        return bool(self.base_url)
+
+    def _post(self, prompt, timeout, generation_config, stream):
+        body = {
+            'prompt': prompt,
+            'response_schema': (generation_config or {}).get('response_schema'),
+            'stream': stream,
+        }
+        try:
+            response = self.session.post(f'{self.base_url}/generate', json=body, timeout=timeout, stream=stream)
+        except requests.Timeout as e:
+            raise google_exceptions.DeadlineExceeded(str(e))
+        except requests.ConnectionError as e:
+            raise ConnectionError(str(e))
+        if response.status_code in HTTP_ERRORS:
+            raise HTTP_ERRORS[response.status_code](response.text)
+        response.raise_for_status()
+        return response
+
+    def generate(self, prompt, timeout, generation_config=None):
+        return ProviderResponse(self._post(prompt, timeout, generation_config, stream=False).json()['text'])
+
+    def stream(self, prompt, timeout, generation_config=None):
+        response = self._post(prompt, timeout, generation_config, stream=True)
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)['text']
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def build_llm_provider(name=None):
+    """Construct the provider named by LLM_PROVIDER (or `name`)"""
+    name = name or settings.LLM_PROVIDER
+    if name == 'gemini':
+        return GeminiProvider.from_env()
+    if name == 'fake':
+        return FakeProvider(
+            latency=settings.LLM_FAKE_LATENCY_SECONDS,
+            jitter=settings.LLM_FAKE_JITTER_SECONDS,
+            error_rate=settings.LLM_FAKE_ERROR_RATE,
+        )
+    if name == 'http':
+        return HttpProvider(settings.LLM_HTTP_BASE_URL)
+    raise ValueError(f'Unknown LLM_PROVIDER: {name}')
+
+
+def get_llm_provider():
+    """Process-wide provider (SDK clients and HTTP sessions are reused across requests)"""
+    global _provider
+    with _provider_lock:
+        if _provider is not None:
+            return _provider
+        provider = build_llm_provider()
+        # An unconfigured provider (e.g. missing API key) is rebuilt on the next request
+        if provider.is_configured():
+            _provider = provider
+        return provider
+
+
+def reset_llm_provider():
+    """Drop the cached provider (e.g. after settings change in tests)"""
+    global _provider
+    with _provider_lock:
+        _provider = None
@@ -0,0 +1,111 @@
+"""Shared helpers for the bench_* management commands (not a command itself)."""
+import random
+import statistics
+import time
+from pathlib import Path
+
+
+WORDS = (
+    'seo audit page content search engine ranking keyword title description heading link image '
+    'performance mobile desktop speed index crawl sitemap canonical schema markup structured data '
+    'analytics traffic conversion landing product pricing customer support blog article guide '
+    'tutorial review service company team contact privacy policy terms shipping returns account'
+).split()
+
+# A scraped page that passes most SEO rules, for endpoints taking scraped_data
+SAMPLE_PAGE = {
+    'url': 'https://example.com/',
+    'status_code': 200,
+    'meta_title': 'Example Store - Lightweight Running Shoes',
+    'meta_description': 'Shop lightweight running shoes with free shipping and returns on every order.',
+    'headings': {'h1': ['Example Store'], 'h2': ['Pricing', 'Shipping and returns']},
+    'canonical_url': 'https://example.com/',
+    'language': 'en',
+    'internal_links_count': 12,
+    'word_count': 650,
+}
+
+
+def synthetic_text(n_words, seed=0):
+    """Deterministic pseudo-prose of roughly n_words words"""
+    rng = random.Random(seed)
+    sentences = []
+    remaining = n_words
+    while remaining > 0:
+        length = min(rng.randint(8, 20), remaining)
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + '.')
+        remaining -= length
+    return ' '.join(sentences)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def time_calls(func, repeat):
+    """Call func repeat times and return the durations in milliseconds"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def summarize(durations):
+    """Median / p95 / max of millisecond durations"""
+    return {
+        'median_ms': round(statistics.median(durations), 3) if durations else 0.0,
+        'p95_ms': round(percentile(durations, 95), 3),
+        'max_ms': round(max(durations), 3) if durations else 0.0,
+    }
+
+
+# Hand-written pages; the larger ones are generated from them by html_corpus()
+BENCH_PAGES_DIR = Path(__file__).resolve().parents[2] / 'bench_pages'
+BENCH_PAGE_URL = 'https://example.com/guides/seo-audit/'
+
+
+def _page(title, body, head=''):
+    return (f'<!doctype html>\n<html lang="en"><head><meta charset="utf-8"><title>{title}</title>{head}</head>'
+            f'<body>{body}</body></html>').encode('utf-8')
+
+
+def html_corpus(seed=0):
+    """The offline extraction corpus: {name: HTML bytes}, deterministic for a given seed"""
+    rng = random.Random(seed)
+    corpus = {path.stem: path.read_bytes() for path in sorted(BENCH_PAGES_DIR.glob('*.html'))}
+
+    # ~1 MB: a long article with inline scripts and styles, like a bloated CMS page
+    sections = []
+    for i in range(400):
+        sections.append(
+            f'<section><h2>Section {i}</h2><p>{synthetic_text(300, seed=seed + i)}</p>'
+            f'<script>var config{i} = {{"id": {i}, "items": [{", ".join(str(n) for n in range(50))}]}};</script>'
+            f'<style>.s{i} {{ margin: {i % 9}px; }}</style></section>'
+        )
+    corpus['huge'] = _page('A very long page', ''.join(sections))
+
+    # 5000 links: relative, absolute internal, external, fragments and mailto
+    links = []
+    for i in range(5000):
+        kind = rng.randrange(5)
+        href = (f'/docs/{i}', f'https://example.com/blog/{i}?ref=nav', f'https://site{i % 300}.example.org/page/{i}',
+                f'#section-{i}', f'mailto:team{i}@example.com')[kind]
+        links.append(f'<li><a href="{href}">{rng.choice(WORDS)} {i}</a></li>')
+    corpus['link_heavy'] = _page('Sitemap', f'<h1>Every page</h1><ul>{"".join(links)}</ul>')
+
+    # 3000 images, a third missing alt text, in a gallery grid
+    images = []
+    for i in range(3000):
+        alt = '' if i % 3 == 0 else f' alt="{rng.choice(WORDS)} photo {i}"'
+        images.append(f'<figure><img src="/media/photo-{i}.jpg"{alt} loading="lazy"><figcaption>#{i}</figcaption></figure>')
+    corpus['image_heavy'] = _page('Gallery', f'<h1>Gallery</h1>{"".join(images)}',
+                                  head='<meta property="og:image" content="/media/photo-0.jpg">')
+    return corpus
@@ -0,0 +1,160 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from api.llm_providers import FakeProvider, HttpProvider, reset_llm_provider
+from api.resilience import RETRYABLE_ERRORS, reset_llm_callers
+from api.stub_servers import FakeLLMServer
+
+from ._bench import summarize, synthetic_text
+
+
+ENDPOINTS = [
+    'optimize-title',
+    'optimize-description',
+    'generate-keywords',
+    'content-improvements',
+    'heading-suggestions',
+    'comprehensive-analysis',
+    'chat',
+]
+
+
+def make_payload(n):
+    """Request body accepted by every /api/ai/* endpoint; n makes it unique"""
+    content = synthetic_text(300, seed=n)
+    headings = {'h1': ['Example Store'], 'h2': ['Pricing', 'Shipping and returns']}
+    page = {
+        'url': 'https://example.com/',
+        'status_code': 200,
+        'meta_title': 'Example Store - Running Shoes',
+        'meta_description': 'Shop lightweight running shoes with free shipping and returns.',
+        'content': content,
+        'headings': headings,
+        'word_count': 300,
+    }
+    return {
+        'current_title': page['meta_title'],
+        'meta_title': page['meta_title'],
+        'current_description': page['meta_description'],
+        'meta_description': page['meta_description'],
+        'content_preview': content[:1000],
+        'keywords': 'running shoes',
+        'target_keywords': 'running shoes',
+        'headings': headings['h1'] + headings['h2'],
+        'current_headings': headings,
+        'scraped_data': page,
+        'question': f'How can I improve this page? (request {n})',
+    }
+
+
+class Command(BaseCommand):
+    help = ('Throughput/latency benchmark of every /api/ai/* endpoint against a '
+            'fake LLM (no real API calls)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', choices=['fake', 'http'], default='http',
+                            help='fake: in-process provider; http: local fake LLM server over sockets')
+        parser.add_argument('--llm-url', default='',
+                            help='Use an already running fake LLM server (see run_fake_llm)')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+        parser.add_argument('--requests', type=int, default=40, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--latency', type=float, default=0.05, help='Fake model latency (seconds)')
+        parser.add_argument('--jitter', type=float, default=0.0)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--chunk-delay', type=float, default=0.01, help='Delay between streamed chunks')
+        parser.add_argument('--identical', action='store_true',
+                            help='Send identical payloads (exercises request coalescing)')
+
+    def handle(self, *args, **options):
+        server = None
+        llm_url = options['llm_url']
+        if options['provider'] == 'http' and not llm_url:
+            server = FakeLLMServer(latency=options['latency'], jitter=options['jitter'],
+                                   error_rate=options['error_rate'], chunk_delay=options['chunk_delay']).start()
+            llm_url = server.url
+
+        overrides = override_settings(
+            LLM_PROVIDER=options['provider'],
+            LLM_HTTP_BASE_URL=llm_url,
+            LLM_FAKE_LATENCY_SECONDS=options['latency'],
+            LLM_FAKE_JITTER_SECONDS=options['jitter'],
+            LLM_FAKE_ERROR_RATE=options['error_rate'],
+            ALLOWED_HOSTS=['testserver'],
+            # Every benchmark request comes from one client; measure the endpoints, not its quota
+            THROTTLE_ENABLED=False,
+        )
+        # A throwaway database keeps benchmark traffic out of the real one
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            with overrides:
+                reset_llm_provider()
+                reset_llm_callers()
+                self.run_endpoints(options)
+                self.run_streaming(options, llm_url)
+        finally:
+            reset_llm_provider()
+            reset_llm_callers()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if server:
+                server.stop()
+
+    def run_endpoints(self, options):
+        endpoints = options['endpoints'].split(',')
+        total = options['requests']
+        self.stdout.write(
+            f"provider={options['provider']} latency={options['latency']}s "
+            f"concurrency={options['concurrency']} requests/endpoint={total}"
+        )
+        self.stdout.write(f"{'endpoint':<24} {'req/s':>7} {'median':>9} {'p95':>9} {'max':>9}  status codes")
+
+        for endpoint in endpoints:
+            def send(n):
+                payload = make_payload(0 if options['identical'] else n)
+                start = time.perf_counter()
+                response = Client(raise_request_exception=False).post(
+                    f'/api/ai/{endpoint}/', payload, content_type='application/json'
+                )
+                return (time.perf_counter() - start) * 1000, response.status_code
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(send, range(total)))
+            elapsed = time.perf_counter() - started
+
+            timing = summarize([duration for duration, _ in results])
+            codes = {}
+            for _, code in results:
+                codes[code] = codes.get(code, 0) + 1
+            self.stdout.write(
+                f"{endpoint:<24} {total / elapsed:>7.1f} {timing['median_ms']:>7.1f}ms "
+                f"{timing['p95_ms']:>7.1f}ms {timing['max_ms']:>7.1f}ms  "
+                + ' '.join(f'{code}x{count}' for code, count in sorted(codes.items()))
+            )
+
+    def run_streaming(self, options, llm_url):
+        if options['provider'] == 'http':
+            provider = HttpProvider(llm_url)
+        else:
+            provider = FakeProvider(latency=options['latency'], jitter=options['jitter'],
+                                    error_rate=options['error_rate'], chunk_delay=options['chunk_delay'])
+        first_chunk, complete, failures = [], [], 0
+        for n in range(min(options['requests'], 20)):
+            start = time.perf_counter()
+            try:
+                for i, _ in enumerate(provider.stream(make_payload(n)['question'], timeout=30)):
+                    if i == 0:
+                        first_chunk.append((time.perf_counter() - start) * 1000)
+            except RETRYABLE_ERRORS:
+                failures += 1
+                continue
+            complete.append((time.perf_counter() - start) * 1000)
+        first, full = summarize(first_chunk), summarize(complete)
+        self.stdout.write(
+            f"streaming: first chunk median {first['median_ms']:.1f}ms, "
+            f"complete median {full['median_ms']:.1f}ms, {failures} failed"
+        )
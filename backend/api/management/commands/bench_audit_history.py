@@ -0,0 +1,156 @@
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from api.audit_changes import diff_sections, section_hashes
+from api.models import AuditRecord, User
+from api.scraper import WebScraper
+from api.stub_servers import PAGESPEED_REPORT
+
+from ._bench import BENCH_PAGE_URL, html_corpus, summarize, time_calls
+
+
+def sample_result():
+    """A realistic scrape() result: the typical corpus page plus the recorded PageSpeed report"""
+    scraper = WebScraper(BENCH_PAGE_URL)
+    scraper.load_html(html_corpus()['typical'])
+    scraper.get_page_text()
+    data = {'url': BENCH_PAGE_URL, 'status_code': 200}
+    data.update(scraper.extract_all())
+    scraper.release()
+    psi = scraper._parse_pagespeed_data(json.loads(PAGESPEED_REPORT.read_bytes()))
+    data.update({'content_length': 13000, 'pagespeed_insights': {'mobile': psi, 'desktop': psi}})
+    return data
+
+
+class Command(BaseCommand):
+    help = ('Benchmark audit history listing, detail and change timeline queries on a large audit_records '
+            'table: keyset vs OFFSET pages, summary columns vs full rows, hashed vs full re-audit diffs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--heavy', type=int, default=100000,
+                            help='Audits owned by one heavy user (an agency re-auditing its clients)')
+        parser.add_argument('--urls', type=int, default=200, help='Distinct pages audited by the heavy user')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        # SQLite test databases live in memory; millions of blobs need a file
+        database_file = None
+        if connection.vendor == 'sqlite':
+            database_file = os.path.join(tempfile.mkdtemp(), 'bench_audit_history.sqlite3')
+            connection.settings_dict['TEST']['NAME'] = database_file
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            heavy, urls, data = self.populate(options)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.report(heavy, urls, data, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if database_file:
+                connection.settings_dict['TEST']['NAME'] = None
+
+    def populate(self, options):
+        """--heavy audits for one user, the rest spread over --users, interleaved in time"""
+        rng = random.Random(0)
+        users = User.objects.bulk_create(
+            [User(email=f'user{i}@example.com') for i in range(options['users'] + 1)]
+        )
+        heavy, others = users[0], users[1:]
+        urls = [f'https://client{i % 40}.example.com/page-{i}' for i in range(options['urls'])]
+        data = sample_result()
+        template = AuditRecord.build(heavy, data)
+        self.stdout.write(f"Inserting {options['records']} audits ({template.payload_size} bytes of JSON, "
+                          f"{len(template.payload)} compressed, each)...")
+
+        changes = {'previous_id': 1, 'sections': ['pagespeed'],
+                   'delta': {'pagespeed': {'mobile': {'performance': {'before': 71, 'after': 74}}}}}
+        heavy_share = options['heavy'] / options['records']
+        started = time.perf_counter()
+        batch = []
+        for i in range(options['records']):
+            if rng.random() < heavy_share:
+                user, url = heavy, rng.choice(urls)
+            else:
+                user, url = rng.choice(others), f'https://site{rng.randrange(10 ** 6)}.example.org/'
+            batch.append(AuditRecord(
+                user=user, url=url, url_hash=AuditRecord.hash_url(url), status_code=200, title=template.title,
+                word_count=rng.randrange(100, 3000), performance_mobile=rng.randrange(101),
+                performance_desktop=rng.randrange(101), payload_size=template.payload_size,
+                section_hashes=template.section_hashes, changes=changes, payload=template.payload,
+            ))
+            if len(batch) == 5000:
+                AuditRecord.objects.bulk_create(batch)
+                batch = []
+        AuditRecord.objects.bulk_create(batch)
+        self.stdout.write(f'  {time.perf_counter() - started:.1f}s')
+        return heavy, urls, data
+
+    def report(self, heavy, urls, data, options):
+        rng = random.Random(1)
+        owned = AuditRecord.objects.filter(user=heavy).count()
+        depth = owned * 9 // 10
+        deep_cursor = AuditRecord.objects.filter(user=heavy).order_by('-id').values_list('id', flat=True)[depth]
+        any_id = AuditRecord.objects.filter(user=heavy).values_list('id', flat=True).first()
+        users = list(User.objects.values_list('id', flat=True)[1:1001])
+
+        # Re-audits alternating between two titles: each one has a changed section
+        retitled = itertools.cycle([{**data, 'meta_title': 'Renamed'}, data])
+        url = rng.choice(urls)
+
+        def hashed_changes():
+            # What record() does before the insert when nothing changed
+            hashes = section_hashes(data)
+            previous = AuditRecord.objects.filter(user=heavy, url_hash=AuditRecord.hash_url(url)) \
+                .only('id', 'section_hashes').first()
+            return [section for section, digest in hashes.items() if previous.section_hashes.get(section) != digest]
+
+        def full_diff():
+            previous = AuditRecord.objects.filter(user=heavy, url_hash=AuditRecord.hash_url(url)).first()
+            return diff_sections(previous.get_data(), {**data, 'url': url})
+
+        client = Client()
+        client.force_login(heavy)
+
+        queries = [
+            ('first page', lambda: AuditRecord.history(heavy)),
+            ('first page, small account', lambda: AuditRecord.history(rng.choice(users))),
+            ('first page of one URL', lambda: AuditRecord.history(heavy, url=rng.choice(urls))),
+            (f'page at depth {depth} (keyset)', lambda: AuditRecord.history(heavy, before=deep_cursor)),
+            (f'page at depth {depth} (OFFSET)', lambda: list(
+                AuditRecord.objects.filter(user=heavy).order_by('-id')
+                .values(*AuditRecord.SUMMARY_FIELDS)[depth:depth + 21]
+            )),
+            ('first page, full rows', lambda: list(AuditRecord.objects.filter(user=heavy).order_by('-id')[:21])),
+            ('detail (decompressed)', lambda: AuditRecord.objects.get(pk=any_id, user=heavy).get_data()),
+            ('change timeline of one URL', lambda: AuditRecord.timeline(heavy, rng.choice(urls))),
+            ('find changes by section hash', hashed_changes),
+            ('find changes by diffing payloads', full_diff),
+            ('store re-audit, nothing changed', lambda: AuditRecord.record(heavy, {**data, 'url': url})),
+            ('store re-audit, title changed', lambda: AuditRecord.record(heavy, {**next(retitled), 'url': url})),
+            ('GET /api/audits/', lambda: client.get('/api/audits/')),
+            ('GET /api/audits/<id>/', lambda: client.get(f'/api/audits/{any_id}/')),
+        ]
+        self.stdout.write(f"{AuditRecord.objects.count()} audits, heavy user owns {owned} "
+                          f"over {len(urls)} URLs ({connection.vendor})")
+        self.stdout.write(f"{'query':<36} {'median':>10} {'p95':>10} {'max':>10}")
+        with override_settings(ALLOWED_HOSTS=['testserver'], THROTTLE_ENABLED=False):
+            for name, query in queries:
+                query()
+                timing = summarize(time_calls(query, options['repeat']))
+                self.stdout.write(f"{name:<36} {timing['median_ms']:>8.3f}ms {timing['p95_ms']:>8.3f}ms "
+                                  f"{timing['max_ms']:>8.3f}ms")
+
+        listing = AuditRecord.objects.filter(user=heavy, id__lt=deep_cursor).order_by('-id')
+        self.stdout.write(f'listing plan: {listing.values(*AuditRecord.SUMMARY_FIELDS)[:21].explain()}')
+        per_url = AuditRecord.objects.filter(user=heavy, url_hash=AuditRecord.hash_url(urls[0])).order_by('-id')
+        self.stdout.write(f'per-URL plan: {per_url.values(*AuditRecord.SUMMARY_FIELDS)[:21].explain()}')
@@ -0,0 +1,72 @@
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from api.models import User
+
+from ._bench import summarize, time_calls
+
+
+CONFIGS = (
+    ('db sessions, uncached user', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTH_USER_CACHE_SECONDS': 0,
+    }),
+    ('cached_db sessions, cached user', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTH_USER_CACHE_SECONDS': 300,
+    }),
+)
+
+
+class Command(BaseCommand):
+    help = 'Queries and latency per authenticated request with DB-backed vs cached sessions and user lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--db-latency', type=float, default=1.0,
+                            help='Milliseconds added to every query (network round trip to Postgres)')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            User.objects.create_user('bench@example.com', 'Bench-pass-123', is_verified=True)
+            self.stdout.write(f"backend={caches['default'].__class__.__name__} "
+                              f"db latency={options['db_latency']}ms per query")
+            self.stdout.write(f"{'configuration':<34} {'request':<22} {'queries':>8} {'median':>9} {'p95':>9}")
+            for label, overrides in CONFIGS:
+                with override_settings(ALLOWED_HOSTS=['testserver'], **overrides):
+                    self.run_config(label, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_config(self, label, options):
+        caches['default'].clear()
+        client = Client()
+        client.post('/api/auth/login/', {'email': 'bench@example.com', 'password': 'Bench-pass-123'},
+                    content_type='application/json')
+        delay = options['db_latency'] / 1000.0
+
+        executed = []
+
+        def slow_query(execute, sql, params, many, context):
+            executed.append(sql)
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        requests = (
+            ('GET /api/auth/user/', lambda: client.get('/api/auth/user/')),
+            ('GET /api/quota/', lambda: client.get('/api/quota/')),
+        )
+        for name, request in requests:
+            response = request()  # warm the cache
+            assert response.status_code == 200, response.content
+            executed.clear()
+            with connection.execute_wrapper(slow_query):
+                timing = summarize(time_calls(request, options['repeat']))
+            queries = len(executed) / options['repeat']
+            self.stdout.write(f"{label:<34} {name:<22} {queries:>8.1f} {timing['median_ms']:>7.2f}ms "
+                              f"{timing['p95_ms']:>7.2f}ms")
@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from api.caching import TwoLevelCache, cache_summary
+from api.metrics import registry
+
+from ._bench import summarize, time_calls
+
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+}
+
+
+class SlowCache:
+    """Wraps a Django cache, adding a fixed delay to every call (network round trip)"""
+
+    def __init__(self, cache, delay):
+        self.cache = cache
+        self.delay = delay
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self.delay)
+            return method(*args, **kwargs)
+        return call
+
+
+class BenchCache(TwoLevelCache):
+    delay = 0.0
+
+    @property
+    def shared(self):
+        cache = caches[self.cache_alias]
+        return SlowCache(cache, self.delay) if self.delay else cache
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark the two-level cache: local vs shared hits, a skewed workload and a stampede'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default='locmem', choices=sorted(BACKENDS))
+        parser.add_argument('--shared-latency', type=float, default=0.5,
+                            help='Milliseconds added to each shared cache call (e.g. Redis round trip)')
+        parser.add_argument('--keys', type=int, default=20000, help='Key space of the skewed workload')
+        parser.add_argument('--local-size', type=int, default=1024)
+        parser.add_argument('--operations', type=int, default=20000)
+        parser.add_argument('--threads', type=int, default=32, help='Concurrent callers in the stampede test')
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        location = '/tmp/sitescope-bench-cache' if options['backend'] == 'file' else 'bench_cache'
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            with override_settings(CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'bench': {'BACKEND': BACKENDS[options['backend']], 'LOCATION': location,
+                          'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}},
+            }):
+                if options['backend'] == 'db':
+                    from django.core.management import call_command
+                    call_command('createcachetable', 'bench_cache', verbosity=0)
+                caches['bench'].clear()
+                BenchCache.delay = options['shared_latency'] / 1000.0
+                self.stdout.write(f"shared backend={options['backend']} latency={options['shared_latency']}ms")
+                self.point_lookups(options)
+                self.skewed_workload(options)
+                self.stampede(options)
+                caches['bench'].clear()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def point_lookups(self, options):
+        repeat = options['repeat']
+        two_level = BenchCache('bench-point', ttl=300, cache_alias='bench', max_local_entries=options['local_size'])
+        shared_only = BenchCache('bench-shared', ttl=300, cache_alias='bench', max_local_entries=0)
+        for cache in (two_level, shared_only):
+            cache.set('hot', {'score': 87, 'issues': list(range(20))})
+
+        counter = iter(range(10 ** 9))
+        results = [
+            ('local hit', summarize(time_calls(lambda: two_level.get('hot'), repeat))),
+            ('shared hit (no local level)', summarize(time_calls(lambda: shared_only.get('hot'), repeat // 4))),
+            ('miss + compute + set', summarize(time_calls(
+                lambda: two_level.get_or_set(f'cold-{next(counter)}', lambda: 1), repeat // 4))),
+        ]
+        self.stdout.write(f"{'lookup':<30} {'median':>9} {'p95':>9}")
+        for label, timing in results:
+            self.stdout.write(f"{label:<30} {timing['median_ms'] * 1000:>7.1f}us {timing['p95_ms'] * 1000:>7.1f}us")
+
+    def skewed_workload(self, options):
+        """Zipf-like key popularity, as for PSI reports of popular sites"""
+        rng = random.Random(0)
+        weights = [1.0 / (rank + 1) ** 1.1 for rank in range(options['keys'])]
+        keys = rng.choices(range(options['keys']), weights=weights, k=options['operations'])
+
+        self.stdout.write(f"\n{'skewed workload':<30} {'ops/s':>9} {'local hit':>10} {'shared hit':>11} "
+                          f"{'evictions':>10}")
+        for label, local_size in (('shared only', 0), (f"local LRU {options['local_size']}", options['local_size'])):
+            registry.reset()
+            cache = BenchCache(f'bench-zipf-{local_size}', ttl=300, cache_alias='bench', max_local_entries=local_size)
+            started = time.perf_counter()
+            for key in keys:
+                cache.get_or_set(key, lambda: key)
+            elapsed = time.perf_counter() - started
+            stats = cache_summary()[cache.namespace]
+            requests = stats['local']['hit'] + stats['local']['miss']
+            self.stdout.write(
+                f"{label:<30} {len(keys) / elapsed:>9.0f} {stats['local']['hit'] / requests:>9.1%} "
+                f"{stats['shared']['hit'] / requests:>10.1%} {stats['evictions']:>10}"
+            )
+
+    def stampede(self, options):
+        """Many concurrent callers miss the same key whose value takes 50ms to compute"""
+        self.stdout.write(f"\n{'stampede':<30} {'computations':>13} {'errors':>7} {'wall':>9}")
+        for label, protected in (('naive get + set', False), ('get_or_set', True)):
+            cache = BenchCache(f'bench-stampede-{protected}', ttl=300, cache_alias='bench',
+                               max_local_entries=options['local_size'])
+            computations = []
+
+            def compute():
+                computations.append(1)
+                time.sleep(0.05)
+                return 'report'
+
+            def naive():
+                if cache.get('key') is None:
+                    cache.set('key', compute())
+
+            barrier = threading.Barrier(options['threads'])
+            errors = []
+
+            def worker():
+                barrier.wait()
+                try:
+                    if protected:
+                        cache.get_or_set('key', compute)
+                    else:
+                        naive()
+                except Exception as e:
+                    # e.g. SQLite's table lock under concurrent cache writes
+                    errors.append(e)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{label:<30} {len(computations):>13} {len(errors):>7} {elapsed * 1000:>7.1f}ms")
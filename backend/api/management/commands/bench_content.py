@@ -0,0 +1,85 @@
+import re
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.scraper import WebScraper
+
+from ._bench import BENCH_PAGE_URL, html_corpus, summarize
+
+
+def legacy_content(scraper):
+    """get_content() + get_word_count() as they were: whole-page get_text, then cut"""
+    for script in scraper.soup(['script', 'style', 'noscript']):
+        script.decompose()
+    text = re.sub(r'\s+', ' ', scraper.soup.get_text(separator=' ', strip=True)).strip()
+    content = text[:1000] + '...' if len(text) > 1000 else text
+    return content, len(text.split())
+
+
+def streaming_content(scraper):
+    return scraper.get_content(), scraper.get_word_count()
+
+
+def boilerplate_free_content(scraper):
+    scraper.skip_boilerplate = True
+    return scraper.get_content(), scraper.get_word_count()
+
+
+def excerpt_only(scraper):
+    return scraper.get_content()
+
+
+def full_text(scraper):
+    """What scrape() does: build the page text once, derive excerpt and count from it"""
+    scraper.get_page_text()
+    return scraper.get_content(), scraper.get_word_count()
+
+
+VARIANTS = [
+    ('legacy (get_text + cut)', legacy_content),
+    ('streaming excerpt + count', streaming_content),
+    ('  without boilerplate', boilerplate_free_content),
+    ('  excerpt only', excerpt_only),
+    ('page text, then both', full_text),
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark content excerpt and word count extraction against the previous whole-page implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        for name, html in html_corpus().items():
+            self.stdout.write(f"\n{name} ({len(html) / 1024:.1f} KB)")
+            self.stdout.write(f"  {'variant':<28} {'median':>10} {'p95':>10} {'peak mem':>11}  words")
+            for label, variant in VARIANTS:
+                durations = []
+                for _ in range(options['repeat']):
+                    scraper = self.parsed(html)
+                    started = time.perf_counter()
+                    variant(scraper)
+                    durations.append((time.perf_counter() - started) * 1000)
+                    scraper.release()
+
+                scraper = self.parsed(html)
+                tracemalloc.start()
+                try:
+                    result = variant(scraper)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                scraper.release()
+
+                timing = summarize(durations)
+                words = result[1] if isinstance(result, tuple) else ''
+                self.stdout.write(f"  {label:<28} {timing['median_ms']:>8.3f}ms {timing['p95_ms']:>8.3f}ms "
+                                  f"{peak / 1024:>8.1f}KB  {words}")
+
+    def parsed(self, html):
+        scraper = WebScraper(BENCH_PAGE_URL, skip_boilerplate=False)
+        scraper.load_html(html)
+        return scraper
@@ -0,0 +1,158 @@
+import json
+import platform
+import time
+import tracemalloc
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.scraper import WebScraper
+
+from ._bench import BENCH_PAGE_URL, BENCH_PAGES_DIR, html_corpus, summarize
+
+
+# Reference results (python 3.11, --repeat 30; compare with the same --repeat, fewer runs are
+# noisier). Timings only compare meaningfully on the same hardware: regenerate it with
+# --save-baseline on the machine that runs the check.
+REFERENCE_BASELINE = BENCH_PAGES_DIR / 'extraction_baseline.json'
+
+STAGES = ['parse'] + [stage for _, stage, _ in WebScraper.EXTRACTORS] + ['release']
+
+
+def offline(*args, **kwargs):
+    raise AssertionError('bench_extraction must not touch the network')
+
+
+def run_extraction(html, trace_memory=False):
+    """Parse html, run every extractor in scrape() order and release the tree.
+
+    Returns {stage: (seconds, peak bytes)}, plus 'total'. Peak memory is only
+    measured with trace_memory (tracemalloc slows everything down, so timing
+    and memory runs are separate).
+    """
+    results = {}
+    highest = [0]
+
+    def measure(stage, func):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        peak = 0
+        if trace_memory:
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            peak = traced_peak - before
+            highest[0] = max(highest[0], traced_peak - start_memory)
+        results[stage] = (elapsed, peak)
+
+    scraper = WebScraper(BENCH_PAGE_URL)
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        start_memory = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+        started = time.perf_counter()
+        measure('parse', lambda: scraper.load_html(html))
+        for _, stage, method in WebScraper.EXTRACTORS:
+            measure(stage, getattr(scraper, method))
+        measure('release', scraper.release)
+        # The parsed tree stays alive throughout, so the overall peak includes it
+        results['total'] = (time.perf_counter() - started, highest[0])
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return results
+
+
+def benchmark(corpus, repeat):
+    """{page: {stage: {'median_ms', 'p95_ms', 'peak_kb'}}} over the corpus"""
+    report = {}
+    for name, html in corpus.items():
+        timings = {stage: [] for stage in STAGES + ['total']}
+        run_extraction(html)  # warm-up: imports, lxml and regex caches
+        for _ in range(repeat):
+            for stage, (seconds, _) in run_extraction(html).items():
+                timings[stage].append(seconds * 1000)
+        memory = run_extraction(html, trace_memory=True)
+        report[name] = {
+            stage: {**summarize(durations), 'peak_kb': round(memory[stage][1] / 1024, 1)}
+            for stage, durations in timings.items()
+        }
+    return report
+
+
+def find_regressions(report, baseline, tolerance=0.25, min_delta_ms=0.05, min_delta_kb=16):
+    """(page, stage, metric, old, new) for each measurement worse than baseline by more than tolerance.
+
+    Differences below min_delta_ms / min_delta_kb are ignored: on sub-millisecond
+    extractors a few microseconds of jitter would otherwise read as a 30% regression.
+    """
+    regressions = []
+    for page, stages in report.items():
+        for stage, current in stages.items():
+            previous = baseline.get(page, {}).get(stage)
+            if previous is None:
+                continue
+            for metric, min_delta in (('median_ms', min_delta_ms), ('peak_kb', min_delta_kb)):
+                old, new = previous[metric], current[metric]
+                if new > old * (1 + tolerance) and new - old > min_delta:
+                    regressions.append((page, stage, metric, old, new))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Benchmark WebScraper extraction (time and peak memory per extractor) on the offline HTML corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--pages', default='', help='Comma-separated corpus pages (default: all)')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write the results as a JSON baseline')
+        parser.add_argument('--baseline', metavar='PATH', nargs='?', const=str(REFERENCE_BASELINE),
+                            help='Compare against a saved baseline (default: the committed reference '
+                                 'baseline); fail on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed slowdown / memory growth over the baseline (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        corpus = html_corpus()
+        if options['pages']:
+            names = options['pages'].split(',')
+            unknown = set(names) - set(corpus)
+            if unknown:
+                raise CommandError(f"Unknown pages: {', '.join(sorted(unknown))} (have: {', '.join(corpus)})")
+            corpus = {name: corpus[name] for name in names}
+
+        # Extraction is offline by design; any network call is a bug
+        with mock.patch('api.scraper.requests.get', offline):
+            report = benchmark(corpus, options['repeat'])
+
+        for page, stages in report.items():
+            self.stdout.write(f"\n{page} ({len(corpus[page]) / 1024:.1f} KB)")
+            self.stdout.write(f"  {'stage':<22} {'median':>10} {'p95':>10} {'peak mem':>11}")
+            for stage, result in stages.items():
+                self.stdout.write(f"  {stage:<22} {result['median_ms']:>8.3f}ms {result['p95_ms']:>8.3f}ms "
+                                  f"{result['peak_kb']:>8.1f}KB")
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as handle:
+                json.dump({'python': platform.python_version(), 'repeat': options['repeat'], 'pages': report},
+                          handle, indent=2)
+            self.stdout.write(f"\nBaseline saved to {options['save_baseline']}")
+
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as handle:
+                    baseline = json.load(handle)['pages']
+            except FileNotFoundError:
+                self.stdout.write(f"\nNo baseline at {options['baseline']}; skipping the regression check "
+                                  f"(create one with --save-baseline)")
+                return
+            regressions = find_regressions(report, baseline, options['tolerance'])
+            if regressions:
+                self.stdout.write('\nRegressions against the baseline:')
+                for page, stage, metric, old, new in regressions:
+                    self.stdout.write(f"  {page}/{stage} {metric}: {old} -> {new} ({new / old - 1:+.0%})"
+                                      if old else f"  {page}/{stage} {metric}: {old} -> {new}")
+                raise CommandError(f'{len(regressions)} regression(s) beyond {options["tolerance"]:.0%}')
+            self.stdout.write(f"\nNo regressions beyond {options['tolerance']:.0%} of {options['baseline']}")
@@ -0,0 +1,61 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from api.keywords import BackgroundCorpus, extract_keywords
+
+from ._bench import summarize, synthetic_text, time_calls
+
+
+HEADINGS = ['Pricing and plans', 'Mobile performance guide', 'Structured data markup', 'Customer support']
+
+
+def corpus_document(seed, n_words=800, vocabulary=50000):
+    """Synthetic audited page mixing common words with a long tail of rare terms"""
+    rng = random.Random(seed)
+    rare = ' '.join(f'term{rng.randint(0, vocabulary)}' for _ in range(n_words // 4))
+    return synthetic_text(n_words, seed=seed) + ' ' + rare
+
+
+class Command(BaseCommand):
+    help = 'Benchmark local keyword extraction on large pages and growing background corpora'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='2000,20000,100000',
+                            help='Comma-separated page sizes in words')
+        parser.add_argument('--corpus-sizes', default='0,100,1000,5000',
+                            help='Comma-separated background corpus sizes in documents')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        corpus_sizes = [int(size) for size in options['corpus_sizes'].split(',')]
+        repeat = options['repeat']
+
+        self.stdout.write('Page size (corpus of 1000 documents)')
+        corpus = BackgroundCorpus()
+        for seed in range(1000):
+            corpus.add_document(corpus_document(seed))
+        self.stdout.write(f"{'words':>8} {'median':>10} {'p95':>10}")
+        for n_words in sizes:
+            text = synthetic_text(n_words, seed=n_words)
+            timing = summarize(time_calls(
+                lambda: extract_keywords(text, headings=HEADINGS, title='Example', corpus=corpus), repeat
+            ))
+            self.stdout.write(f"{n_words:>8} {timing['median_ms']:>8.2f}ms {timing['p95_ms']:>8.2f}ms")
+
+        self.stdout.write('')
+        self.stdout.write('Corpus size (20000-word page)')
+        self.stdout.write(f"{'documents':>10} {'vocabulary':>11} {'build':>10} {'median':>10} {'p95':>10}")
+        text = synthetic_text(20000, seed=1)
+        for n_docs in corpus_sizes:
+            documents = [corpus_document(seed) for seed in range(n_docs)]
+            corpus = BackgroundCorpus()
+            build = time_calls(lambda: [corpus.add_document(doc) for doc in documents], 1)[0]
+            timing = summarize(time_calls(
+                lambda: extract_keywords(text, headings=HEADINGS, title='Example', corpus=corpus), repeat
+            ))
+            self.stdout.write(
+                f"{n_docs:>10} {len(corpus.vocabulary):>11} {build:>8.1f}ms "
+                f"{timing['median_ms']:>8.2f}ms {timing['p95_ms']:>8.2f}ms"
+            )
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+
+from api.metrics import (
+    MetricsExporter, MetricsRegistry, RequestMetricsMiddleware, registry, render_prometheus, timed,
+)
+
+from ._bench import SAMPLE_PAGE, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the overhead of stage timers, the metrics middleware and /metrics rendering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20000)
+        parser.add_argument('--series', type=int, default=300, help='Histogram series in the rendered registry')
+        parser.add_argument('--workers', type=int, default=4, help='Worker snapshot files merged by /metrics')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        self.stdout.write(f"{'operation':<40} {'median':>10} {'p95':>10}")
+
+        def nothing():
+            pass
+
+        def with_timer():
+            with timed('bench_stage_seconds', stage='bench'):
+                pass
+
+        self.report('empty call (baseline)', time_calls(nothing, repeat), 'us')
+        self.report('registry.inc', time_calls(lambda: registry.inc('bench_total', stage='x'), repeat), 'us')
+        self.report('timed() block', time_calls(with_timer, repeat), 'us')
+
+        request = RequestFactory().get('/api/quota/')
+        middleware = RequestMetricsMiddleware(lambda request: HttpResponse())
+        self.report('metrics middleware, no-op view', time_calls(lambda: middleware(request), repeat), 'us')
+
+        body = {'scraped_data': SAMPLE_PAGE}
+        without = [m for m in settings.MIDDLEWARE if m != 'api.metrics.RequestMetricsMiddleware']
+        for label, middleware in (('POST /api/seo/score/ without middleware', without),
+                                  ('POST /api/seo/score/ with middleware', settings.MIDDLEWARE)):
+            with override_settings(ALLOWED_HOSTS=['testserver'], MIDDLEWARE=middleware, THROTTLE_ENABLED=False):
+                client = Client()
+                self.report(label, time_calls(
+                    lambda: client.post('/api/seo/score/', body, content_type='application/json'), repeat // 20
+                ), 'ms')
+
+        # A registry the size of a busy worker's: per-view request histograms plus counters
+        busy = MetricsRegistry()
+        for i in range(options['series']):
+            busy.observe('http_request_duration_seconds', 0.01 * (i % 50), view=f'view_{i}', method='POST')
+            busy.inc('llm_calls_total', i, endpoint=f'endpoint_{i}', outcome='success')
+        self.report(f"render {options['series']} histograms + counters",
+                    time_calls(lambda: render_prometheus(busy.snapshot()), 200), 'ms')
+
+        with tempfile.TemporaryDirectory() as directory:
+            exporter = MetricsExporter(directory, metrics_registry=busy)
+            self.report('flush snapshot (exporter thread)', time_calls(exporter.flush, 200), 'ms')
+            for pid in range(1, options['workers']):
+                # Stand-ins for the other workers' files
+                shutil.copy(exporter._path(os.getpid()), exporter._path(10 ** 7 + pid))
+            self.report(f"collect + render {options['workers']} workers",
+                        time_calls(lambda: render_prometheus(exporter.collect()), 200), 'ms')
+
+    def report(self, label, durations, unit):
+        timing = summarize(durations)
+        scale, suffix = (1000, 'us') if unit == 'us' else (1, 'ms')
+        self.stdout.write(f"{label:<40} {timing['median_ms'] * scale:>8.2f}{suffix} "
+                          f"{timing['p95_ms'] * scale:>8.2f}{suffix}")
@@ -0,0 +1,104 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from api.models import OTP
+
+from ._bench import summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = 'Benchmark OTP lookups and the expiry purge on a large otps table, with and without indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--emails', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            self.populate(options['rows'], options['emails'])
+            indexes = OTP._meta.indexes
+            self.stdout.write(f"{options['rows']} OTP rows, {options['emails']} emails ({connection.vendor})")
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(OTP, index)
+            without = self.run_queries(options)
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(OTP, index)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            with_indexes = self.run_queries(options)
+
+            self.stdout.write(f"{'query':<34} {'no index':>10} {'indexed':>10}")
+            for name in without:
+                self.stdout.write(f"{name:<34} {without[name]['median_ms']:>8.3f}ms "
+                                  f"{with_indexes[name]['median_ms']:>8.3f}ms")
+
+            plan = OTP.objects.filter(email='user1@example.com', otp_code='123456',
+                                      otp_type='registration', is_used=False).explain()
+            self.stdout.write(f'verify lookup plan: {plan}')
+
+            started = time.perf_counter()
+            deleted = batches = 0
+            while True:
+                batch = OTP.purge_expired(5000)
+                deleted += batch
+                batches += 1
+                if batch < 5000:
+                    break
+            self.stdout.write(f'purged {deleted} expired rows in {batches} batches of 5000: '
+                              f'{time.perf_counter() - started:.2f}s, {OTP.objects.count()} rows left')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def populate(self, rows, emails):
+        """Mostly used or expired history, with one live code for some emails"""
+        rng = random.Random(0)
+        now = timezone.now()
+        self.stdout.write(f'Inserting {rows} rows...')
+        batch = []
+        for i in range(rows):
+            created = now - timezone.timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+            live = i % 20 == 0
+            batch.append(OTP(
+                email=f'user{rng.randrange(emails)}@example.com',
+                otp_code=f'{rng.randrange(10 ** 6):06d}',
+                otp_type=rng.choice(['registration', 'password_reset']),
+                is_used=not live and rng.random() < 0.8,
+                expires_at=now + timezone.timedelta(minutes=10) if live else created + timezone.timedelta(minutes=10),
+            ))
+            if len(batch) == 10000:
+                OTP.objects.bulk_create(batch)
+                batch = []
+        OTP.objects.bulk_create(batch)
+
+    def run_queries(self, options):
+        rng = random.Random(1)
+
+        def email():
+            return f"user{rng.randrange(options['emails'])}@example.com"
+
+        def lookup():
+            # verify_otp / reset_password
+            OTP.objects.filter(email=email(), otp_code='123456', otp_type='registration', is_used=False).first()
+
+        def invalidate():
+            # create_otp invalidating earlier codes (writes is_used=False so runs see the same data)
+            OTP.objects.filter(email=email(), otp_type='password_reset', is_used=False).update(is_used=False)
+
+        def purge_batch():
+            list(OTP.objects.filter(expires_at__lte=timezone.now()).order_by('expires_at')
+                 .values_list('id', flat=True)[:500])
+
+        repeat = options['repeat']
+        return {
+            'verify lookup': summarize(time_calls(lookup, repeat)),
+            'invalidate previous codes': summarize(time_calls(invalidate, repeat)),
+            'select purge batch (500)': summarize(time_calls(purge_batch, max(repeat // 10, 5))),
+        }
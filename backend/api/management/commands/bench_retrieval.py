@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from api.retrieval import BM25Index, chunk_text
+
+from ._bench import summarize, synthetic_text, time_calls
+
+
+QUERIES = [
+    'How fast is the mobile landing page?',
+    'Does the blog have structured data markup?',
+    'What does the pricing page say about shipping and returns?',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark retrieval index build and query time on long pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='2000,20000,100000',
+                            help='Comma-separated page sizes in words')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+
+        self.stdout.write(f"{'words':>8} {'chunks':>7} {'build median':>13} {'build p95':>10} "
+                          f"{'query median':>13} {'query p95':>10}")
+        for n_words in sizes:
+            text = synthetic_text(n_words, seed=n_words)
+            build = summarize(time_calls(lambda: BM25Index(chunk_text(text)), repeat))
+
+            index = BM25Index(chunk_text(text))
+            query = summarize(time_calls(
+                lambda: [index.search(q) for q in QUERIES], repeat * 10
+            ))
+            per_query = {key: value / len(QUERIES) for key, value in query.items()}
+
+            self.stdout.write(
+                f"{n_words:>8} {len(index):>7} {build['median_ms']:>11.2f}ms {build['p95_ms']:>8.2f}ms "
+                f"{per_query['median_ms']:>11.3f}ms {per_query['p95_ms']:>8.3f}ms"
+            )
@@ -0,0 +1,138 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
+from django.test import override_settings
+from django.utils import timezone
+
+from api.models import AuditJob, AuditRecord, AuditSchedule, User
+from api.scheduler import jitter, tick
+
+from ._bench import summarize, time_calls
+
+# (interval in minutes, share of schedules): hourly, every 6 hours, nightly
+INTERVALS = [(60, 0.3), (360, 0.2), (1440, 0.5)]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the re-audit scheduler tick on a large audit_schedules table: idle ticks, a simulated '
+            'hour with every schedule created on the hour, and catching up after downtime')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedules', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--hosts', type=int, default=5000)
+        parser.add_argument('--rate', type=int, default=3000, help='SCHEDULER_MAX_ENQUEUE_PER_MINUTE')
+        parser.add_argument('--batch', type=int, default=1000, help='SCHEDULER_BATCH_SIZE')
+        parser.add_argument('--tick', type=int, default=10, help='Simulated seconds between ticks')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        overrides = override_settings(
+            SCHEDULER_MAX_ENQUEUE_PER_MINUTE=options['rate'],
+            SCHEDULER_BATCH_SIZE=options['batch'],
+            SCHEDULER_MAX_JITTER_SECONDS=600,
+            SCHEDULER_JITTER_FRACTION=0.1,
+            SCHEDULER_HOST_SPACING_SECONDS=30,
+            SCHEDULER_MISSED_GRACE_MINUTES=30,
+            SCHEDULER_CATCH_UP='once',
+        )
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            with overrides:
+                top_of_hour = timezone.now().replace(minute=0, second=0, microsecond=0) + timezone.timedelta(hours=1)
+                self.populate(top_of_hour, options)
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                self.stdout.write(f"{options['schedules']} schedules on {options['hosts']} hosts, all created on "
+                                  f"the hour; cap {options['rate']}/min, batches of {options['batch']} "
+                                  f"({connection.vendor})")
+                self.idle_ticks(top_of_hour, options)
+                self.simulate(top_of_hour, timezone.timedelta(hours=1), 'first hour', options)
+                self.catch_up(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def populate(self, slot, options):
+        rng = random.Random(0)
+        users = User.objects.bulk_create([User(email=f'user{i}@example.com') for i in range(options['users'])])
+        batch = []
+        for i in range(options['schedules']):
+            host = f'site{rng.randrange(options["hosts"])}.example.com'
+            url = f'https://{host}/page-{i}'
+            interval = rng.choices([minutes for minutes, _ in INTERVALS], [share for _, share in INTERVALS])[0]
+            batch.append(AuditSchedule(
+                user=rng.choice(users), url=url, url_hash=AuditRecord.hash_url(url), host=host,
+                interval_minutes=interval, scheduled_for=slot, next_run_at=slot + jitter(interval),
+            ))
+            if len(batch) == 10000:
+                AuditSchedule.objects.bulk_create(batch)
+                batch = []
+        AuditSchedule.objects.bulk_create(batch)
+
+    def idle_ticks(self, top_of_hour, options):
+        """Ticks with nothing due, with and without the partial due index"""
+        before = top_of_hour - timezone.timedelta(minutes=1)
+        indexed = summarize(time_calls(lambda: tick(before), options['repeat']))
+        index = next(index for index in AuditSchedule._meta.indexes if index.name == 'schedule_due_idx')
+        with connection.schema_editor() as editor:
+            editor.remove_index(AuditSchedule, index)
+        unindexed = summarize(time_calls(lambda: tick(before), max(options['repeat'] // 10, 5)))
+        with connection.schema_editor() as editor:
+            editor.add_index(AuditSchedule, index)
+        self.stdout.write(f"idle tick: {indexed['median_ms']:.3f}ms median, {indexed['p95_ms']:.3f}ms p95 "
+                          f"({unindexed['median_ms']:.3f}ms without schedule_due_idx)")
+
+    def simulate(self, start, duration, label, options):
+        """Tick every --tick simulated seconds; jobs finish as soon as they may start (instant workers)"""
+        step = timezone.timedelta(seconds=options['tick'])
+        durations, enqueued, now = [], 0, start
+        first_job = AuditJob.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        while now < start + duration:
+            started = time.perf_counter()
+            enqueued += tick(now)['enqueued']
+            durations.append((time.perf_counter() - started) * 1000)
+            AuditJob.objects.filter(status=AuditJob.STATUS_PENDING, available_at__lte=now).update(
+                status=AuditJob.STATUS_DONE, finished_at=now
+            )
+            now += step
+
+        jobs = AuditJob.objects.filter(id__gt=first_job)
+        per_minute = [row['n'] for row in jobs.annotate(minute=TruncMinute('created_at'))
+                      .values('minute').annotate(n=Count('id'))]
+        backlog = AuditSchedule.objects.filter(is_active=True, next_run_at__lte=now).count()
+        timing = summarize(durations)
+        self.stdout.write(
+            f"{label}: {len(durations)} ticks, {timing['median_ms']:.1f}ms median, {timing['p95_ms']:.1f}ms p95, "
+            f"{timing['max_ms']:.1f}ms max; {enqueued} jobs enqueued, busiest minute {max(per_minute, default=0)}, "
+            f"{backlog} schedules still due"
+        )
+        self.check_spacing(jobs)
+
+    def check_spacing(self, jobs):
+        closest = None
+        last = {}
+        for host, available_at in jobs.order_by('host', 'available_at').values_list('host', 'available_at'):
+            if host in last:
+                gap = (available_at - last[host]).total_seconds()
+                closest = gap if closest is None else min(closest, gap)
+            last[host] = available_at
+        self.stdout.write(f"  closest start of two audits of one host: "
+                          f"{'n/a' if closest is None else f'{closest:.0f}s'}")
+
+    def catch_up(self, options):
+        """Everything due six hours ago, as after a scheduler outage"""
+        AuditJob.objects.all().delete()
+        outage = timezone.timedelta(hours=6)
+        start = AuditSchedule.objects.order_by('next_run_at').values_list('next_run_at', flat=True).first() + outage
+        overdue = AuditSchedule.objects.filter(next_run_at__lte=start)
+        missed_slots = sum(
+            (start - schedule.scheduled_for) // timezone.timedelta(minutes=schedule.interval_minutes) + 1
+            for schedule in overdue.only('scheduled_for', 'interval_minutes')
+        )
+        self.stdout.write(f"after a 6 hour outage: {overdue.count()} schedules overdue, {missed_slots} slots missed")
+        minutes = -(-options['schedules'] // options['rate']) + 2
+        self.simulate(start, timezone.timedelta(minutes=minutes), f'  catch-up ({minutes} min)', options)
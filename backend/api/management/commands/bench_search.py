@@ -0,0 +1,124 @@
+import itertools
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from api.models import AuditRecord, User
+from api.search import get_search_backend
+
+from ._bench import summarize, time_calls
+
+SIZES = '10000,100000'
+
+
+def vocabulary(size, rng):
+    """Made-up words, used with Zipf-like frequencies (word i about 1/(i+1) as often as the first)"""
+    letters = 'abcdefghijklmnoprstuvwy'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    words = sorted(words)
+    rng.shuffle(words)
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(size)))
+    return words, cumulative
+
+
+class Command(BaseCommand):
+    help = ('Benchmark full-text search over stored audits: indexing throughput and query latency '
+            '(rare, common, multi-word, phrase and excluding queries) at growing corpus sizes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', default=SIZES, help='Comma-separated corpus sizes')
+        parser.add_argument('--words', type=int, default=600, help='Words of page text per document')
+        parser.add_argument('--vocabulary', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['documents'].split(','))
+        database_file = None
+        if connection.vendor == 'sqlite':
+            database_file = os.path.join(tempfile.mkdtemp(), 'bench_search.sqlite3')
+            connection.settings_dict['TEST']['NAME'] = database_file
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            with override_settings(SEARCH_ENABLED=True):
+                if get_search_backend() is None:
+                    self.stderr.write(f'Full-text search is not supported on {connection.vendor}')
+                    return
+                rng = random.Random(0)
+                words, cumulative = vocabulary(options['vocabulary'], rng)
+                user = User.objects.create(email='bench@example.com')
+                self.stdout.write(f"{options['words']} words per page, {len(words)} word vocabulary "
+                                  f"({connection.vendor})")
+                for size in sizes:
+                    self.grow(user, size, words, cumulative, rng, options)
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+                    self.report(size, words, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if database_file:
+                connection.settings_dict['TEST']['NAME'] = None
+
+    def grow(self, user, size, words, cumulative, rng, options):
+        """Store audits (indexed as record() does) until there are size of them"""
+        template = AuditRecord.build(user, {'url': 'https://example.com/', 'status_code': 200})
+        backend = get_search_backend()
+        count = AuditRecord.objects.count()
+        started = time.perf_counter()
+        indexing = 0.0
+        while count < size:
+            batch = min(1000, size - count)
+            audits = AuditRecord.objects.bulk_create([
+                AuditRecord(user=user, url=f'https://site{count + i}.example.com/', url_hash=template.url_hash,
+                            status_code=200, title='', payload_size=template.payload_size,
+                            section_hashes={}, payload=template.payload)
+                for i in range(batch)
+            ])
+            entries = []
+            for audit in audits:
+                text = rng.choices(words, cum_weights=cumulative, k=options['words'] + 30)
+                entries.append((audit.id, {
+                    'title': ' '.join(text[:8]),
+                    'description': ' '.join(text[8:22]),
+                    'headings': '\n'.join(' '.join(text[i:i + 4]) for i in range(22, 30, 4)),
+                    'content': ' '.join(text[30:]),
+                }))
+            indexing_started = time.perf_counter()
+            with transaction.atomic():
+                backend.index_many(entries)
+            indexing += time.perf_counter() - indexing_started
+            count += batch
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"\n{size} documents: indexed in {indexing:.1f}s "
+                          f"({elapsed:.1f}s with the audit rows)")
+
+    def report(self, size, words, options):
+        rng = random.Random(1)
+        # Ranks in the Zipf order: common words are near the front
+        common, frequent, rare = words[:20], words[100:400], words[20000:]
+        client = Client()
+        staff = User.objects.create(email=f'staff{size}@example.com', is_staff=True)
+        client.force_login(staff)
+        queries = [
+            ('rare word', lambda: AuditRecord.search(rng.choice(rare))),
+            ('frequent word', lambda: AuditRecord.search(rng.choice(frequent))),
+            ('very common word', lambda: AuditRecord.search(rng.choice(common))),
+            ('two frequent words', lambda: AuditRecord.search(' '.join(rng.sample(frequent, 2)))),
+            ('phrase of two common words', lambda: AuditRecord.search('"%s %s"' % tuple(rng.sample(common, 2)))),
+            ('common word -other word', lambda: AuditRecord.search('%s -%s' % tuple(rng.sample(common, 2)))),
+            ('common word, page 10', lambda: AuditRecord.search(rng.choice(common), offset=180)),
+            ('GET /api/search/', lambda: client.get('/api/search/', {'q': rng.choice(frequent)})),
+        ]
+        self.stdout.write(f"{'query':<30} {'median':>10} {'p95':>10} {'max':>10}")
+        with override_settings(ALLOWED_HOSTS=['testserver'], THROTTLE_ENABLED=False):
+            for name, query in queries:
+                query()
+                timing = summarize(time_calls(query, options['repeat']))
+                self.stdout.write(f"{name:<30} {timing['median_ms']:>8.3f}ms {timing['p95_ms']:>8.3f}ms "
+                                  f"{timing['max_ms']:>8.3f}ms")
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from api.models import EmailOutbox
+from api.stub_servers import FakeSMTPServer
+
+from ._bench import summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = 'Signup latency with inline SMTP sending vs the email outbox, against a local SMTP stand-in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=40)
+        parser.add_argument('--connect-delay', type=float, default=0.3,
+                            help='SMTP connection setup time (TLS handshake on a real relay)')
+        parser.add_argument('--message-delay', type=float, default=0.05, help='SMTP time per message')
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help='Use a cheap password hasher to isolate email cost')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            self.stdout.write(f"{'mode':<8} {'median':>9} {'p95':>9} {'max':>9} {'all delivered':>14} "
+                              f"{'smtp connections':>17}")
+            for mode in ('inline', 'thread'):
+                self.run_mode(mode, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_mode(self, mode, options):
+        hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if options['fast_hasher'] else None
+        with FakeSMTPServer(connect_delay=options['connect_delay'],
+                            message_delay=options['message_delay']) as smtp:
+            overrides = {
+                'ALLOWED_HOSTS': ['testserver'],
+                'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+                'EMAIL_HOST': '127.0.0.1',
+                'EMAIL_PORT': smtp.port,
+                'EMAIL_USE_TLS': False,
+                'EMAIL_HOST_USER': '',
+                'EMAIL_HOST_PASSWORD': '',
+                'EMAIL_OUTBOX_MODE': mode,
+                'EMAIL_OUTBOX_POLL_SECONDS': 0.2,
+            }
+            if hashers:
+                overrides['PASSWORD_HASHERS'] = hashers
+
+            with override_settings(**overrides):
+                client = Client()
+                counter = iter(range(options['signups']))
+                started = time.perf_counter()
+                durations = time_calls(lambda: client.post('/api/auth/register/', {
+                    'email': f'{mode}-{next(counter)}@example.com',
+                    'password': 'Bench-pass-123',
+                    'password2': 'Bench-pass-123',
+                }, content_type='application/json'), options['signups'])
+
+                # Wait for the background worker to deliver everything
+                deadline = time.monotonic() + 120
+                while len(smtp.messages) < options['signups'] and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                delivered = time.perf_counter() - started
+
+            EmailOutbox.objects.all().delete()
+
+        timing = summarize(durations)
+        self.stdout.write(
+            f"{mode:<8} {timing['median_ms']:>7.1f}ms {timing['p95_ms']:>7.1f}ms {timing['max_ms']:>7.1f}ms "
+            f"{delivered:>13.2f}s {smtp.connections:>17}"
+        )
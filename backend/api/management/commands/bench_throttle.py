@@ -0,0 +1,53 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from api.throttling import AdmissionController, TokenBucket
+
+from ._bench import SAMPLE_PAGE, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the per-request overhead of token-bucket throttling and admission control'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cache', default='default', help='Cache alias holding buckets and slots')
+        parser.add_argument('--clients', type=int, default=10000, help='Distinct client buckets')
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        alias, repeat = options['cache'], options['repeat']
+        caches[alias].clear()
+
+        bucket = TokenBucket('bench', capacity=1e9, refill_per_second=1e6, cache_alias=alias)
+        clients = [f'client-{i}' for i in range(options['clients'])]
+        counter = iter(range(10 ** 9))
+        consume = summarize(time_calls(lambda: bucket.consume(clients[next(counter) % len(clients)], 4), repeat))
+
+        controller = AdmissionController(max_in_flight=8, cache_alias=alias)
+        admission = summarize(time_calls(lambda: controller.release(controller.acquire()), repeat))
+
+        self.stdout.write(f"cache={alias} clients={options['clients']}")
+        self.stdout.write(f"{'operation':<34} {'median':>9} {'p95':>9}")
+        self.stdout.write(f"{'token bucket consume':<34} {consume['median_ms'] * 1000:>7.1f}us "
+                          f"{consume['p95_ms'] * 1000:>7.1f}us")
+        self.stdout.write(f"{'admission acquire + release':<34} {admission['median_ms'] * 1000:>7.1f}us "
+                          f"{admission['p95_ms'] * 1000:>7.1f}us")
+
+        # Whole request through the Django/DRF stack, limiter on vs off
+        body = {'scraped_data': SAMPLE_PAGE}
+        results = {}
+        for enabled in (False, True):
+            with override_settings(ALLOWED_HOSTS=['testserver'], THROTTLE_ENABLED=enabled,
+                                   ADMISSION_CONTROL_ENABLED=enabled, ADMISSION_MIN_COST=1,
+                                   THROTTLE_ANON_CAPACITY=10 ** 9, THROTTLE_CACHE_ALIAS=alias):
+                client = Client()
+                results[enabled] = summarize(time_calls(
+                    lambda: client.post('/api/seo/score/', body, content_type='application/json'), repeat // 4
+                ))
+        overhead = results[True]['median_ms'] - results[False]['median_ms']
+        self.stdout.write(f"{'POST /api/seo/score/ without limits':<34} {results[False]['median_ms']:>7.3f}ms "
+                          f"{results[False]['p95_ms']:>7.3f}ms")
+        self.stdout.write(f"{'POST /api/seo/score/ with limits':<34} {results[True]['median_ms']:>7.3f}ms "
+                          f"{results[True]['p95_ms']:>7.3f}ms")
+        self.stdout.write(f'limiter overhead per request: {overhead * 1000:.0f}us (median)')
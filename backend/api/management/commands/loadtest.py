@@ -0,0 +1,248 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from api.llm_providers import reset_llm_provider
+from api.resilience import reset_llm_callers
+from api.stub_servers import FakeLLMServer, FakePageSpeedServer, StaticSiteServer
+
+from ._bench import SAMPLE_PAGE, html_corpus, percentile, summarize
+from .bench_ai_endpoints import make_payload
+
+
+def scrape_payload(site_url, page):
+    def payload(n):
+        # A distinct URL per request, so coalescing doesn't merge them
+        return {'url': f'{site_url}/{page}?n={n}'}
+    return payload
+
+
+def score_payload(n):
+    return {'scraped_data': {**SAMPLE_PAGE, 'url': f'https://example.com/page-{n}'}}
+
+
+def scenarios(site_url):
+    """{name: (path, payload(n))}; every scenario is a JSON POST"""
+    return {
+        'scrape': ('/api/scrape/', scrape_payload(site_url, 'typical')),
+        'scrape-huge': ('/api/scrape/', scrape_payload(site_url, 'huge')),
+        'seo-score': ('/api/seo/score/', score_payload),
+        'keywords': ('/api/seo/keywords/', make_payload),
+        'ai-title': ('/api/ai/optimize-title/', make_payload),
+        'ai-keywords': ('/api/ai/generate-keywords/', make_payload),
+        'ai-analysis': ('/api/ai/comprehensive-analysis/', make_payload),
+        'ai-chat': ('/api/ai/chat/', make_payload),
+    }
+
+
+DEFAULT_SCENARIOS = 'scrape,seo-score,ai-title,ai-analysis,ai-chat'
+
+
+class Command(BaseCommand):
+    help = ('Load-test /api/scrape/ and /api/ai/* against local stand-ins for the audited sites, '
+            'PageSpeed Insights and the LLM; reports throughput, latency percentiles and errors per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS,
+                            help='Comma-separated: scrape, scrape-huge, seo-score, keywords, ai-title, '
+                                 'ai-keywords, ai-analysis, ai-chat')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per scenario and concurrency level')
+        parser.add_argument('--concurrency', default='8',
+                            help='Concurrent clients; a comma-separated list runs each level (e.g. 1,8,32)')
+        parser.add_argument('--site-latency', type=float, default=0.15, help='Audited site response time (s)')
+        parser.add_argument('--site-jitter', type=float, default=0.1)
+        parser.add_argument('--psi-latency', type=float, default=2.0, help='PageSpeed run time per strategy (s)')
+        parser.add_argument('--psi-jitter', type=float, default=1.0)
+        parser.add_argument('--psi-error-rate', type=float, default=0.0)
+        parser.add_argument('--llm-latency', type=float, default=1.5, help='Model reply time (s)')
+        parser.add_argument('--llm-jitter', type=float, default=1.0)
+        parser.add_argument('--llm-error-rate', type=float, default=0.0)
+        parser.add_argument('--throttle', action='store_true',
+                            help='Keep per-client quotas on (all load comes from one client)')
+        parser.add_argument('--base-url', default='',
+                            help='Drive a running server (e.g. gunicorn) instead of the app in-process; '
+                                 'start it with the environment printed by --serve-stubs')
+        parser.add_argument('--serve-stubs', action='store_true',
+                            help='Only run the stand-ins (on --stub-port..+2) until Ctrl+C')
+        parser.add_argument('--stub-port', type=int, default=8770,
+                            help='Site, PageSpeed and LLM stand-ins listen on this port and the next two')
+        parser.add_argument('--output', metavar='PATH', help='Save the results as JSON')
+        parser.add_argument('--compare', metavar='PATH', help='Show changes against a saved run')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        names = options['scenarios'].split(',')
+        site_port, psi_port, llm_port = (options['stub_port'] + i for i in range(3))
+
+        if options['base_url'] and not options['serve_stubs']:
+            # The server under test talks to stand-ins started by `loadtest --serve-stubs`
+            results = self.run(options['base_url'], f'http://127.0.0.1:{site_port}', names, levels, options)
+            self.finish(results, options)
+            return
+
+        # In-process runs take any free ports; a separate server under test needs known ones
+        if not options['serve_stubs']:
+            site_port = psi_port = llm_port = 0
+        site = StaticSiteServer({f'/{name}': html for name, html in html_corpus().items()}, port=site_port,
+                                latency=options['site_latency'], jitter=options['site_jitter'])
+        psi = FakePageSpeedServer(port=psi_port, latency=options['psi_latency'], jitter=options['psi_jitter'],
+                                  error_rate=options['psi_error_rate'])
+        llm = FakeLLMServer(port=llm_port, latency=options['llm_latency'], jitter=options['llm_jitter'],
+                            error_rate=options['llm_error_rate'])
+        with site, psi, llm:
+            environment = {
+                'LLM_PROVIDER': 'http',
+                'LLM_HTTP_BASE_URL': llm.url,
+                'PAGESPEED_API_URL': psi.api_url,
+                'PAGE_INSIGHTS_API_KEY': 'loadtest',
+            }
+            if not options['throttle']:
+                environment['THROTTLE_ENABLED'] = 'False'
+            if options['serve_stubs']:
+                self.serve(site, psi, llm, environment)
+                return
+            results = self.run_in_process(site.url, environment, names, levels, options)
+            self.stdout.write(f"stand-in requests: site {site.requests}, PageSpeed {psi.requests}, "
+                              f"LLM {llm.requests}")
+        self.finish(results, options)
+
+    def serve(self, site, psi, llm, environment):
+        self.stdout.write(f'Audited site:  {site.url}/typical (pages: {", ".join(sorted(site.pages))})')
+        self.stdout.write(f'PageSpeed API: {psi.api_url}')
+        self.stdout.write(f'LLM:           {llm.url}')
+        self.stdout.write('\nStart the server under test with:\n  '
+                          + ' '.join(f'{key}={value}' for key, value in environment.items())
+                          + '\nthen run: manage.py loadtest --base-url http://127.0.0.1:8000 (Ctrl+C to stop)')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+    def run_in_process(self, site_url, environment, names, levels, options):
+        overrides = override_settings(
+            LLM_PROVIDER='http',
+            LLM_HTTP_BASE_URL=environment['LLM_HTTP_BASE_URL'],
+            PAGESPEED_API_URL=environment['PAGESPEED_API_URL'],
+            THROTTLE_ENABLED=options['throttle'],
+            ALLOWED_HOSTS=['testserver'],
+        )
+        # A throwaway database keeps load test snapshots out of the real one
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            with overrides, mock.patch.dict(os.environ, {'PAGE_INSIGHTS_API_KEY': 'loadtest'}):
+                reset_llm_provider()
+                reset_llm_callers()
+                return self.run('', site_url, names, levels, options)
+        finally:
+            reset_llm_provider()
+            reset_llm_callers()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, base_url, site_url, names, levels, options):
+        available = scenarios(site_url)
+        unknown = set(names) - set(available)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        mode = f'server {base_url}' if base_url else 'in-process (one Django process; threads share the GIL)'
+        self.stdout.write(f"target: {mode}, {options['requests']} requests per scenario")
+        self.stdout.write(f"{'scenario':<14} {'conc':>5} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} "
+                          f"{'max':>8} {'errors':>7}  status codes")
+        results = []
+        for concurrency in levels:
+            for name in names:
+                path, payload = available[name]
+                result = self.drive(base_url, path, payload, options['requests'], concurrency)
+                result.update({'scenario': name, 'concurrency': concurrency})
+                results.append(result)
+                self.stdout.write(
+                    f"{name:<14} {concurrency:>5} {result['throughput']:>7.2f} {result['p50_ms']:>6.0f}ms "
+                    f"{result['p95_ms']:>6.0f}ms {result['p99_ms']:>6.0f}ms {result['max_ms']:>6.0f}ms "
+                    f"{result['error_rate']:>6.1%}  "
+                    + ' '.join(f'{code}x{count}' for code, count in sorted(result['status_codes'].items()))
+                )
+        return results
+
+    def drive(self, base_url, path, payload, total, concurrency):
+        """Send total requests from concurrency clients; latency and status of each"""
+        if base_url:
+            session = requests.Session()
+
+            def post(body):
+                return session.post(f'{base_url.rstrip("/")}{path}', json=body, timeout=120).status_code
+        else:
+            def post(body):
+                return Client(raise_request_exception=False).post(
+                    path, body, content_type='application/json'
+                ).status_code
+
+        def send(n):
+            body = payload(n)
+            started = time.perf_counter()
+            try:
+                code = str(post(body))
+            except requests.RequestException as e:
+                code = type(e).__name__
+            finally:
+                if not base_url:
+                    connection.close()
+            return (time.perf_counter() - started) * 1000, code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(send, range(total)))
+        elapsed = time.perf_counter() - started
+
+        durations = [duration for duration, _ in samples]
+        codes = {}
+        for _, code in samples:
+            codes[code] = codes.get(code, 0) + 1
+        errors = sum(count for code, count in codes.items() if not code.startswith('2'))
+        timing = summarize(durations)
+        return {
+            'requests': total,
+            'throughput': round(total / elapsed, 3),
+            'p50_ms': timing['median_ms'],
+            'p95_ms': timing['p95_ms'],
+            'p99_ms': round(percentile(durations, 99), 3),
+            'max_ms': timing['max_ms'],
+            'error_rate': round(errors / total, 4),
+            'status_codes': codes,
+        }
+
+    def finish(self, results, options):
+        if options['compare']:
+            with open(options['compare']) as handle:
+                previous = {(r['scenario'], r['concurrency']): r for r in json.load(handle)['results']}
+            self.stdout.write(f"\nChange against {options['compare']}:")
+            self.stdout.write(f"{'scenario':<14} {'conc':>5} {'req/s':>9} {'p95':>9} {'errors':>9}")
+            for result in results:
+                before = previous.get((result['scenario'], result['concurrency']))
+                if before is None:
+                    continue
+                self.stdout.write(
+                    f"{result['scenario']:<14} {result['concurrency']:>5} "
+                    f"{self.change(before['throughput'], result['throughput']):>9} "
+                    f"{self.change(before['p95_ms'], result['p95_ms']):>9} "
+                    f"{(result['error_rate'] - before['error_rate']) * 100:>+8.1f}%"
+                )
+        if options['output']:
+            settings_used = {key: options[key] for key in (
+                'requests', 'site_latency', 'psi_latency', 'llm_latency', 'llm_error_rate', 'psi_error_rate',
+                'throttle', 'base_url',
+            )}
+            with open(options['output'], 'w') as handle:
+                json.dump({'options': settings_used, 'results': results}, handle, indent=2)
+            self.stdout.write(f"\nResults saved to {options['output']}")
+
+    @staticmethod
+    def change(before, after):
+        return f'{after / before - 1:+.0%}' if before else 'n/a'
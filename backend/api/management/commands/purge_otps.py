@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import OTP
+
+
+class Command(BaseCommand):
+    help = 'Delete expired OTPs in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--max-batches', type=int, default=0, help='Stop after this many batches (0 = all)')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to sleep between batches to limit lock and I/O pressure')
+
+    def handle(self, *args, **options):
+        total = batches = 0
+        started = time.perf_counter()
+        while True:
+            deleted = OTP.purge_expired(options['batch_size'])
+            total += deleted
+            batches += 1
+            if deleted < options['batch_size'] or batches == options['max_batches']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(f'Deleted {total} expired OTP(s) in {batches} batch(es) '
+                          f'({time.perf_counter() - started:.2f}s)')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import AuditRecord
+from api.search import get_search_backend, search_document
+
+
+class Command(BaseCommand):
+    help = ('Add stored audits that are missing from the full-text search index (e.g. stored before search '
+            'existed). The full page text isn\'t kept, so they are indexed with their content excerpt.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true',
+                            help='Reindex every audit (replaces indexed page text with the excerpt)')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None:
+            raise CommandError('Search is disabled or not supported on this database')
+        last_id, total = 0, 0
+        while True:
+            ids = list(AuditRecord.objects.filter(id__gt=last_id).order_by('id')
+                       .values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            last_id = ids[-1]
+            if not options['all']:
+                ids = sorted(set(ids) - backend.indexed(ids))
+            # Payloads are only read for the audits being indexed
+            audits = AuditRecord.objects.filter(id__in=ids).only('id', 'payload')
+            with transaction.atomic():
+                backend.index_many([(audit.id, search_document(audit.get_data())) for audit in audits])
+            total += len(ids)
+        self.stdout.write(f'Indexed {total} audit(s)')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.scheduler import run_audit_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued scheduled audits and store them in the audit history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs due now and exit')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds to sleep when no job is due')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                done, failed = run_audit_jobs(options['batch_size'])
+                total += done
+                if done or failed:
+                    self.stdout.write(f'Audited {done}, failed {failed}')
+                    continue
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Ran {total} audit(s)')
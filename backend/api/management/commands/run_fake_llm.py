@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.stub_servers import FakeLLMServer
+
+
+class Command(BaseCommand):
+    help = 'Run the fake LLM server (point LLM_PROVIDER=http / LLM_HTTP_BASE_URL at it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds per reply')
+        parser.add_argument('--jitter', type=float, default=0.2, help='Extra random latency (seconds)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with 503')
+        parser.add_argument('--chunk-delay', type=float, default=0.02, help='Delay between streamed chunks')
+
+    def handle(self, *args, **options):
+        server = FakeLLMServer(
+            options['host'], options['port'],
+            latency=options['latency'], jitter=options['jitter'],
+            error_rate=options['error_rate'], chunk_delay=options['chunk_delay'],
+        ).start()
+        self.stdout.write(f'Fake LLM listening on {server.url} (Ctrl+C to stop)')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(f'Served {server.requests} requests')
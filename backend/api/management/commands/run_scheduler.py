@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.scheduler import purge_finished_jobs, tick
+
+
+class Command(BaseCommand):
+    help = 'Enqueue due scheduled re-audits as audit jobs (run one scheduler; jobs run in run_audit_jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single tick and exit')
+        parser.add_argument('--tick', type=float, default=None,
+                            help='Seconds between ticks (default SCHEDULER_TICK_SECONDS)')
+
+    def handle(self, *args, **options):
+        interval = options['tick'] or settings.SCHEDULER_TICK_SECONDS
+        try:
+            while True:
+                started = time.monotonic()
+                stats = tick()
+                purged = purge_finished_jobs()
+                if stats['due'] or purged:
+                    self.stdout.write(f"Enqueued {stats['enqueued']}, skipped {stats['skipped']}"
+                                      f"{' (rate limited)' if stats['rate_limited'] else ''}, "
+                                      f"purged {purged} finished job(s)")
+                if options['once']:
+                    break
+                close_old_connections()
+                # A rate-limited backlog waits for the next tick like everything else
+                time.sleep(max(interval - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            pass
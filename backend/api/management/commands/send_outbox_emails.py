@@ -0,0 +1,53 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.email_service import deliver_outbox, purge_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox in batches over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--linger', type=float, default=5.0,
+                            help='Seconds to keep an idle SMTP connection open for more mail')
+
+    def handle(self, *args, **options):
+        connection = None
+        idle_since = None
+        total_sent = 0
+        try:
+            while True:
+                if connection is None:
+                    connection = get_connection(fail_silently=False)
+                sent, failed = deliver_outbox(options['batch_size'], connection=connection)
+                total_sent += sent
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent}, failed {failed}')
+                    idle_since = None
+                    continue
+
+                purged = purge_outbox()
+                if purged:
+                    self.stdout.write(f'Purged {purged} old email(s)')
+                if options['once']:
+                    break
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since >= options['linger']:
+                    # Don't hold an idle SMTP connection (relays drop them anyway)
+                    connection.close()
+                    connection = None
+                close_old_connections()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if connection is not None:
+                connection.close()
+        self.stdout.write(f'Delivered {total_sent} email(s)')
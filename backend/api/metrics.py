@@ -0,0 +1,398 @@
+import atexit
+import contextvars
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters, gauges and histograms.
+
+    Metrics are identified by name plus a set of labels, e.g.
+    ``registry.inc('llm_calls_total', endpoint='chat')``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': buckets,
+                    'counts': [0] * len(buckets),
+                    'count': 0,
+                    'sum': 0.0,
+                }
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['count'] += 1
+            histogram['sum'] += value
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def gauge_value(self, name, **labels):
+        with self._lock:
+            return self._gauges.get((name, _label_key(labels)))
+
+    def snapshot(self):
+        """Copy of all metrics as plain data"""
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self._counters.items()
+            ]
+            gauges = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self._gauges.items()
+            ]
+            histograms = [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'buckets': list(histogram['buckets']),
+                    'counts': list(histogram['counts']),
+                    'count': histogram['count'],
+                    'sum': histogram['sum'],
+                }
+                for (name, labels), histogram in self._histograms.items()
+            ]
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+# ---- Per-request stage timings ----
+
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def begin_request_stages():
+    """Start collecting stage timings for the current request; returns a token for end_request_stages"""
+    return _request_stages.set([])
+
+
+def end_request_stages(token):
+    """Stop collecting and return the [(stage, seconds, started)] recorded since begin_request_stages"""
+    stages = _request_stages.get()
+    _request_stages.reset(token)
+    return stages or []
+
+
+def current_request_stages():
+    """The live list of stages recorded so far in this request, or None outside one"""
+    return _request_stages.get()
+
+
+def record_stage(stage, seconds, started=None):
+    """
+    Add a stage to the current request's breakdown (no-op outside a request).
+    started is its time.perf_counter() start; by default it just ended.
+    """
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((stage, seconds, time.perf_counter() - seconds if started is None else started))
+
+
+@contextmanager
+def timed(name, step=None, buckets=DEFAULT_BUCKETS, **labels):
+    """
+    Time the block into histogram name (seconds) and the request breakdown,
+    where it is called step (default: the label values joined by '_'):
+
+        with timed('scrape_stage_seconds', stage='parse'):
+            soup = BeautifulSoup(...)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe(name, elapsed, buckets=buckets, **labels)
+        record_stage(step or '_'.join(map(str, labels.values())) or name, elapsed, started)
+
+
+# ---- Prometheus text exposition, aggregated across worker processes ----
+
+def merge_snapshots(snapshots):
+    """
+    Combine registry snapshots from several processes: counters and
+    histograms are summed, gauges keep one series per process (pid label).
+    """
+    counters, histograms, gauges = {}, {}, []
+    for snapshot in snapshots:
+        pid = snapshot.get('pid')
+        for counter in snapshot['counters']:
+            key = (counter['name'], _label_key(counter['labels']))
+            counters[key] = counters.get(key, 0) + counter['value']
+        for histogram in snapshot['histograms']:
+            key = (histogram['name'], _label_key(histogram['labels']), tuple(histogram['buckets']))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = dict(histogram, counts=list(histogram['counts']))
+            else:
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+                merged['count'] += histogram['count']
+                merged['sum'] += histogram['sum']
+        for gauge in snapshot['gauges']:
+            labels = dict(gauge['labels'], pid=str(pid)) if pid is not None else gauge['labels']
+            gauges.append(dict(gauge, labels=labels))
+    return {
+        'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                     for (name, labels), value in counters.items()],
+        'gauges': gauges,
+        'histograms': list(histograms.values()),
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def render_prometheus(snapshot, prefix='sitescope_'):
+    """Render a registry snapshot in the Prometheus text exposition format (0.0.4)"""
+    lines = []
+    by_name = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for metric in snapshot[kind]:
+            by_name.setdefault((kind, metric['name']), []).append(metric)
+
+    types = {'counters': 'counter', 'gauges': 'gauge', 'histograms': 'histogram'}
+    for (kind, name), metrics in sorted(by_name.items(), key=lambda item: item[0][1]):
+        full_name = prefix + name
+        lines.append(f'# TYPE {full_name} {types[kind]}')
+        for metric in metrics:
+            labels = _label_text(metric['labels'])
+            braced = f'{{{labels}}}' if labels else ''
+            if kind != 'histograms':
+                lines.append(f'{full_name}{braced} {metric["value"]}')
+                continue
+            prefix_labels = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, count in zip(metric['buckets'], metric['counts']):
+                cumulative += count
+                lines.append(f'{full_name}_bucket{{{prefix_labels}le="{float(bound)!r}"}} {cumulative}')
+            lines.append(f'{full_name}_bucket{{{prefix_labels}le="+Inf"}} {metric["count"]}')
+            lines.append(f'{full_name}_sum{braced} {metric["sum"]}')
+            lines.append(f'{full_name}_count{braced} {metric["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """
+    Shares this process's metrics with the other workers on the node.
+
+    Once started, a daemon thread writes this process's snapshot to
+    <directory>/metrics-<pid>.json every interval seconds (and at exit), off
+    the request path; collect() merges the files of all processes. Exited
+    workers' counters and histograms (not their gauges) are folded into
+    metrics-exited.json and their own files deleted, so the directory
+    doesn't grow with every worker restart.
+    """
+    EXITED_FILENAME = 'metrics-exited.json'
+
+    def __init__(self, directory, interval=5.0, metrics_registry=None):
+        self.directory = directory
+        self.interval = interval
+        self.registry = metrics_registry or registry
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        snapshot = dict(self.registry.snapshot(), pid=os.getpid(), written_at=time.time())
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(os.getpid())
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as handle:
+            json.dump(snapshot, handle)
+        os.replace(temp_path, path)
+
+    def start(self):
+        """Start the flushing thread in this process (again after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+                self._thread.start()
+                atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        if _exporter is self:
+            self.flush()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if _exporter is not self:
+                return  # METRICS_DIR changed
+            try:
+                with self._lock:
+                    self.flush()
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.directory}: {e}")
+
+    def collect(self):
+        """Merged snapshot of every process that has written to the directory"""
+        with self._lock:
+            self.flush()
+        # One collector at a time, so exited workers are folded in exactly once
+        with open(os.path.join(self.directory, '.collect.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots, exited, folded = [], {}, None
+            for filename in os.listdir(self.directory):
+                if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename)) as handle:
+                        snapshot = json.load(handle)
+                except (OSError, ValueError):
+                    continue
+                if filename == self.EXITED_FILENAME:
+                    folded = snapshot
+                elif snapshot.get('pid') != os.getpid() and not _process_alive(snapshot.get('pid')):
+                    exited[filename] = dict(snapshot, gauges=[])
+                else:
+                    snapshots.append(snapshot)
+            if exited:
+                folded = self._fold_exited(folded, exited)
+            if folded is not None:
+                snapshots.append(folded)
+        return merge_snapshots(snapshots)
+
+    def _fold_exited(self, folded, exited):
+        previous = [folded] if folded is not None else []
+        merged = dict(merge_snapshots(previous + list(exited.values())), gauges=[])
+        path = os.path.join(self.directory, self.EXITED_FILENAME)
+        with open(f'{path}.tmp', 'w') as handle:
+            json.dump(merged, handle)
+        os.replace(f'{path}.tmp', path)
+        for filename in exited:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+        return merged
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """The exporter for settings.METRICS_DIR, or None when metrics are per process only"""
+    global _exporter
+    with _exporter_lock:
+        if not settings.METRICS_DIR:
+            _exporter = None
+        elif _exporter is None or _exporter.directory != settings.METRICS_DIR:
+            _exporter = MetricsExporter(settings.METRICS_DIR, settings.METRICS_FLUSH_SECONDS)
+        return _exporter
+
+
+def collect_metrics():
+    """All workers' metrics when METRICS_DIR is set, otherwise this process's"""
+    exporter = get_exporter()
+    if exporter is None:
+        return registry.snapshot()
+    return exporter.collect()
+
+
+def _server_timing_allowed(request):
+    """Stage timings describe the backend: only for staff unless METRICS_SERVER_TIMING is on"""
+    if settings.METRICS_SERVER_TIMING or settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+class RequestMetricsMiddleware:
+    """
+    Request latency per view, a Server-Timing header with the request's
+    stage breakdown (for staff, or everyone with METRICS_SERVER_TIMING) and
+    periodic export for /metrics
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = begin_request_stages()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stages = end_request_stages(token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        registry.observe('http_request_duration_seconds', elapsed,
+                         view=match.url_name if match and match.url_name else 'unmatched',
+                         method=request.method, status=f'{response.status_code // 100}xx')
+        if _server_timing_allowed(request):
+            timings = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds, _ in stages]
+            timings.append(f'total;dur={elapsed * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(timings)
+
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.start()
+        return response
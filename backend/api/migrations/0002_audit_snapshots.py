@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:03
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('session_key', models.CharField(blank=True, default='', max_length=40)),
+                ('url', models.URLField(max_length=2048)),
+                ('data', models.JSONField()),
+                ('chat_history', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed_at', models.DateTimeField(auto_now=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'audit_snapshots',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at'], name='snapshot_user_created_idx'), models.Index(fields=['session_key', '-created_at'], name='snapshot_session_created_idx')],
+            },
+        ),
+    ]
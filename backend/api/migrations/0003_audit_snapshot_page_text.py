@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_audit_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditsnapshot',
+            name='page_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:30
+
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    Like django.contrib.postgres.operations.AddIndexConcurrently: CREATE INDEX
+    CONCURRENTLY on PostgreSQL, so the otps table stays writable (OTPs keep
+    being issued and used) while the index builds. A plain AddIndex on other
+    databases, and importable without psycopg.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0004_email_outbox'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='otp',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['email', 'otp_type', '-created_at'], name='otp_active_lookup_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='otp',
+            index=models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ),
+    ]
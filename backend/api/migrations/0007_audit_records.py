@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_request_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='audits', to=settings.AUTH_USER_MODEL)),
+                ('url', models.URLField(max_length=2048)),
+                ('url_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('title', models.CharField(blank=True, default='', max_length=300)),
+                ('word_count', models.PositiveIntegerField(default=0)),
+                ('performance_mobile', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('performance_desktop', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('payload_size', models.PositiveIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+            ],
+            options={
+                'db_table': 'audit_records',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['user', '-id'], name='audit_user_id_idx'), models.Index(fields=['user', 'url_hash', '-id'], name='audit_user_url_id_idx')],
+            },
+        ),
+    ]
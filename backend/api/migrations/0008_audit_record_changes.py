@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_audit_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditrecord',
+            name='changes',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditrecord',
+            name='section_hashes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
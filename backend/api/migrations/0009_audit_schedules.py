@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_audit_record_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=2048)),
+                ('url_hash', models.CharField(max_length=64)),
+                ('host', models.CharField(max_length=255)),
+                ('interval_minutes', models.PositiveIntegerField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('scheduled_for', models.DateTimeField()),
+                ('next_run_at', models.DateTimeField()),
+                ('last_enqueued_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audit_schedules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'audit_schedules',
+                'ordering': ['next_run_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=2048)),
+                ('host', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('audit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.auditrecord')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('schedule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='api.auditschedule')),
+            ],
+            options={
+                'db_table': 'audit_jobs',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='auditschedule',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['next_run_at'], name='schedule_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='auditschedule',
+            constraint=models.UniqueConstraint(fields=('user', 'url_hash'), name='schedule_unique_user_url'),
+        ),
+        migrations.AddIndex(
+            model_name='auditjob',
+            index=models.Index(fields=['status', 'available_at'], name='audit_job_status_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditjob',
+            index=models.Index(fields=['host', 'available_at'], name='audit_job_host_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditjob',
+            index=models.Index(fields=['created_at'], name='audit_job_created_idx'),
+        ),
+    ]
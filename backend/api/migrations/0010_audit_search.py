@@ -0,0 +1,54 @@
+from django.db import migrations
+
+
+# The search index is backend-specific (api.search): a generated tsvector with a GIN index on
+# PostgreSQL, an FTS5 table on SQLite. Other databases get no index and search stays disabled.
+POSTGRES_SQL = [
+    """
+    CREATE TABLE audit_search (
+        audit_id bigint PRIMARY KEY REFERENCES audit_records (id) ON DELETE CASCADE,
+        title text NOT NULL,
+        description text NOT NULL,
+        headings text NOT NULL,
+        content text NOT NULL,
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', title), 'A') ||
+            setweight(to_tsvector('english', description), 'B') ||
+            setweight(to_tsvector('english', headings), 'C') ||
+            setweight(to_tsvector('english', content), 'D')
+        ) STORED
+    )
+    """,
+    'CREATE INDEX audit_search_document_idx ON audit_search USING GIN (document)',
+]
+SQLITE_SQL = [
+    "CREATE VIRTUAL TABLE audit_search USING fts5("
+    "title, description, headings, content, tokenize = 'porter unicode61 remove_diacritics 2')",
+    # Recreate this if a migration ever rebuilds audit_records (SQLite drops a table's triggers with it)
+    'CREATE TRIGGER audit_search_delete AFTER DELETE ON audit_records '
+    'BEGIN DELETE FROM audit_search WHERE rowid = old.id; END',
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_SQL, 'sqlite': SQLITE_SQL}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TRIGGER IF EXISTS audit_search_delete')
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP TABLE IF EXISTS audit_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_audit_schedules'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,8 +1,18 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
+import hashlib
 import random
 import string
+import uuid
+import zlib
+
+import orjson
+
+from .audit_changes import diff_sections, section_hashes
+from .coalescing import normalize_url
+from .search import get_search_backend, index_audit, parse_query
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -62,6 +72,16 @@ class OTP(models.Model):
     class Meta:
         db_table = 'otps'
         ordering = ['-created_at']
+        indexes = [
+            # create_otp, verify_otp and reset_password only look at unused codes for one
+            # email + type; a partial index keeps it small as used codes pile up
+            models.Index(
+                fields=['email', 'otp_type', '-created_at'],
+                condition=models.Q(is_used=False),
+                name='otp_active_lookup_idx',
+            ),
+            models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ]
 
     def __str__(self):
         return f"{self.email} - {self.otp_type} - {self.otp_code}"
@@ -75,12 +95,26 @@ class OTP(models.Model):
         """Generate a random 6-digit OTP"""
         return ''.join(random.choices(string.digits, k=6))
 
+    @staticmethod
+    def purge_expired(batch_size=500):
+        """Delete one bounded batch of expired (used or unused) OTPs"""
+        expired_ids = list(
+            OTP.objects.filter(expires_at__lte=timezone.now())
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if expired_ids:
+            OTP.objects.filter(id__in=expired_ids).delete()
+        return len(expired_ids)
+
     @staticmethod
     def create_otp(email, otp_type, expiry_minutes=10):
         """Create a new OTP for given email and type"""
         otp_code = OTP.generate_otp()
         expires_at = timezone.now() + timezone.timedelta(minutes=expiry_minutes)
         
+        OTP.purge_expired(settings.OTP_PURGE_BATCH_SIZE)
+
         # Invalidate all previous OTPs of same type for this email
         OTP.objects.filter(email=email, otp_type=otp_type, is_used=False).update(is_used=True)
         
@@ -92,3 +126,401 @@ class OTP(models.Model):
             expires_at=expires_at
         )
         return otp
+
+class AuditSnapshot(models.Model):
+    """Server-side copy of a scrape result and its chat session.
+
+    AI endpoints reference a snapshot by ID instead of having the client post
+    the full scraped payload (and a growing chat history) on every call.
+    """
+    MAX_PAGE_TEXT_LENGTH = 200000
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.CASCADE, related_name='snapshots'
+    )
+    session_key = models.CharField(max_length=40, blank=True, default='')
+    url = models.URLField(max_length=2048)
+    data = models.JSONField()
+    page_text = models.TextField(blank=True, default='')
+    chat_history = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'audit_snapshots'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='snapshot_user_created_idx'),
+            models.Index(fields=['session_key', '-created_at'], name='snapshot_session_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.url} - {self.id}"
+
+    def is_expired(self):
+        """Check if the snapshot has outlived its TTL"""
+        return timezone.now() >= self.expires_at
+
+    def is_owned_by(self, user, session_key):
+        """Snapshots belong to a user, or to an anonymous session"""
+        if self.user_id is not None:
+            return bool(user and user.is_authenticated and user.pk == self.user_id)
+        return bool(session_key) and session_key == self.session_key
+
+    def touch(self):
+        """Slide the expiry window forward on access"""
+        self.expires_at = timezone.now() + timezone.timedelta(
+            minutes=settings.AUDIT_SNAPSHOT_TTL_MINUTES
+        )
+
+    def append_chat(self, role, content):
+        """Append a chat message, keeping only the most recent messages"""
+        limit = settings.AUDIT_SNAPSHOT_CHAT_HISTORY_LIMIT
+        self.chat_history = (self.chat_history + [{'role': role, 'content': content}])[-limit:]
+
+    @staticmethod
+    def purge_expired(batch_size=500):
+        """Delete one bounded batch of expired snapshots"""
+        expired_ids = list(
+            AuditSnapshot.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if expired_ids:
+            AuditSnapshot.objects.filter(id__in=expired_ids).delete()
+        return len(expired_ids)
+
+    @staticmethod
+    def create_snapshot(data, user=None, session_key='', page_text=''):
+        """Store a scrape result, evicting expired and surplus snapshots"""
+        AuditSnapshot.purge_expired()
+
+        if user is not None and user.is_authenticated:
+            owner_filter = {'user': user}
+        else:
+            user = None
+            owner_filter = {'user__isnull': True, 'session_key': session_key}
+
+        # Keep at most AUDIT_SNAPSHOT_MAX_PER_OWNER snapshots per owner, including the new one
+        # (which is always stored, so 0 behaves like 1)
+        keep = max(settings.AUDIT_SNAPSHOT_MAX_PER_OWNER - 1, 0)
+        surplus_ids = list(
+            AuditSnapshot.objects.filter(**owner_filter)
+            .order_by('-created_at')
+            .values_list('id', flat=True)[keep:]
+        )
+        if surplus_ids:
+            AuditSnapshot.objects.filter(id__in=surplus_ids).delete()
+
+        return AuditSnapshot.objects.create(
+            user=user,
+            session_key='' if user else session_key,
+            url=data.get('url', ''),
+            data=data,
+            page_text=page_text[:AuditSnapshot.MAX_PAGE_TEXT_LENGTH],
+            expires_at=timezone.now() + timezone.timedelta(
+                minutes=settings.AUDIT_SNAPSHOT_TTL_MINUTES
+            ),
+        )
+
+class EmailOutbox(models.Model):
+    """Queued outgoing email, delivered in batches by api.email_service.deliver_outbox"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUSES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    to_email = models.EmailField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # Pending: earliest next attempt. Sending: when a crashed worker's claim lapses.
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'email_outbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
+
+
+class RequestProfile(models.Model):
+    """CPU profile and stage timeline of one sampled request (api.profiling)"""
+    TRIGGER_HEADER = 'header'
+    TRIGGER_SAMPLE = 'sample'
+    TRIGGERS = (
+        (TRIGGER_HEADER, 'Staff header'),
+        (TRIGGER_SAMPLE, 'Sampled'),
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGERS)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2048)
+    view_name = models.CharField(max_length=100, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    cpu_ms = models.FloatField()
+    # [{'name', 'start_ms', 'duration_ms'}] relative to the start of the request
+    stages = models.JSONField(default=list)
+    # Most expensive functions by cumulative time: [{'function', 'calls', 'total_ms', 'cumulative_ms'}]
+    top_functions = models.JSONField(default=list)
+    # zlib-compressed pstats data (what cProfile's dump_stats() writes)
+    profile_data = models.BinaryField()
+
+    class Meta:
+        db_table = 'request_profiles'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class AuditRecord(models.Model):
+    """One entry of a user's audit history: a scrape() result, PageSpeed included.
+
+    The full result is stored as zlib-compressed JSON in `payload`; listings
+    only read the summary columns next to it. Pages are fetched by id
+    (keyset pagination): ids grow with every insert, so "the next 20 older
+    than id N" is a short range scan of one index at any depth, unlike OFFSET.
+
+    Each record also keeps per-section content hashes (api.audit_changes) and
+    what changed since the user's previous audit of the same page, so the
+    change timeline never reads payloads.
+    """
+    COMPRESSION_LEVEL = 6
+    # What the listing returns; never includes the payload
+    SUMMARY_FIELDS = ('id', 'url', 'created_at', 'status_code', 'title', 'word_count',
+                      'performance_mobile', 'performance_desktop', 'payload_size')
+    TIMELINE_FIELDS = ('id', 'created_at', 'changes')
+
+    # Indexed by the composite indexes below; a separate user_id index would only slow inserts
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='audits', db_index=False)
+    url = models.URLField(max_length=2048)
+    # sha256 of the normalized URL: a fixed-width key for per-URL history instead of indexing URLs
+    url_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    title = models.CharField(max_length=300, blank=True, default='')
+    word_count = models.PositiveIntegerField(default=0)
+    performance_mobile = models.PositiveSmallIntegerField(null=True, blank=True)
+    performance_desktop = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Size of the uncompressed JSON, in bytes
+    payload_size = models.PositiveIntegerField(default=0)
+    # {section: hash}, compared with the next audit of the page
+    section_hashes = models.JSONField(default=dict, blank=True)
+    # Since the previous audit of the page: {'previous_id', 'sections': [changed], 'delta': {section: ...}};
+    # None for the first one
+    changes = models.JSONField(null=True, blank=True)
+    # Listings and the timeline select columns by name and never read this one
+    payload = models.BinaryField()
+
+    class Meta:
+        db_table = 'audit_records'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['user', '-id'], name='audit_user_id_idx'),
+            models.Index(fields=['user', 'url_hash', '-id'], name='audit_user_url_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.url} - {self.created_at}"
+
+    @staticmethod
+    def hash_url(url):
+        return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _performance(data, strategy):
+        result = (data.get('pagespeed_insights') or {}).get(strategy)
+        if not isinstance(result, dict):
+            return None
+        return (result.get('scores') or {}).get('performance')
+
+    @staticmethod
+    def build(user, data):
+        """An unsaved record for a scrape result"""
+        raw = orjson.dumps(data, default=str)
+        url = data.get('url', '')
+        return AuditRecord(
+            user=user,
+            url=url,
+            url_hash=AuditRecord.hash_url(url),
+            status_code=data.get('status_code'),
+            title=(data.get('meta_title') or '')[:300],
+            word_count=data.get('word_count') or 0,
+            performance_mobile=AuditRecord._performance(data, 'mobile'),
+            performance_desktop=AuditRecord._performance(data, 'desktop'),
+            payload_size=len(raw),
+            section_hashes=section_hashes(data),
+            payload=zlib.compress(raw, AuditRecord.COMPRESSION_LEVEL),
+        )
+
+    @staticmethod
+    def record(user, data, page_text=''):
+        """
+        Store a scrape result in the user's history, with what changed since the
+        last audit of the page, and add it to the search index
+        """
+        record = AuditRecord.build(user, data)
+        previous = (
+            AuditRecord.objects.filter(user=user, url_hash=record.url_hash)
+            .order_by('-id').only('id', 'section_hashes').first()
+        )
+        if previous is not None:
+            changed = [section for section, digest in record.section_hashes.items()
+                       if previous.section_hashes.get(section) != digest]
+            # Only a changed section needs the previous result itself
+            delta = diff_sections(previous.load_data(), data, changed) if changed else {}
+            record.changes = {'previous_id': previous.id, 'sections': list(delta), 'delta': delta}
+        with transaction.atomic():
+            record.save()
+            index_audit(record.id, data, page_text)
+        return record
+
+    @staticmethod
+    def _page(audits, fields, before, limit):
+        if before is not None:
+            audits = audits.filter(id__lt=before)
+        # One extra row tells whether there is a next page, without a COUNT
+        rows = list(audits.order_by('-id').values(*fields)[:limit + 1])
+        next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    @staticmethod
+    def history(user, url=None, before=None, limit=20):
+        """
+        One page of a user's history, newest first, as summary dicts, and the
+        cursor for the next page (None on the last one). url restricts it to
+        one page's audits; before is the cursor of the previous page.
+        """
+        audits = AuditRecord.objects.filter(user=user)
+        if url:
+            audits = audits.filter(url_hash=AuditRecord.hash_url(url))
+        return AuditRecord._page(audits, AuditRecord.SUMMARY_FIELDS, before, limit)
+
+    @staticmethod
+    def timeline(user, url, before=None, limit=20):
+        """One page of the changes between a user's audits of url, newest first, and the next cursor"""
+        audits = AuditRecord.objects.filter(user=user, url_hash=AuditRecord.hash_url(url))
+        return AuditRecord._page(audits, AuditRecord.TIMELINE_FIELDS, before, limit)
+
+    @staticmethod
+    def search(query, limit=20, offset=0):
+        """
+        Audits of every user whose text matches query (api.search syntax), best
+        match first: ([{'id', 'url', 'title', 'created_at', 'user_email', 'score',
+        'snippet'}], whether there are more)
+        """
+        backend = get_search_backend()
+        terms = parse_query(query)
+        if backend is None or not terms:
+            return [], False
+        hits = backend.search(terms, limit + 1, offset)
+        audits = {
+            audit['id']: audit
+            for audit in AuditRecord.objects.filter(id__in=[audit_id for audit_id, _, _ in hits[:limit]])
+            .values('id', 'url', 'title', 'created_at', 'user__email')
+        }
+        results = []
+        for audit_id, score, snippet in hits[:limit]:
+            audit = audits.get(audit_id)
+            if audit is not None:
+                audit['user_email'] = audit.pop('user__email')
+                results.append({**audit, 'score': round(score, 6), 'snippet': snippet})
+        return results, len(hits) > limit
+
+    def get_data(self):
+        """The stored scrape result"""
+        return orjson.loads(zlib.decompress(self.payload))
+
+    def load_data(self):
+        """get_data() for a record loaded without its payload"""
+        payload = AuditRecord.objects.filter(pk=self.pk).values_list('payload', flat=True).get()
+        return orjson.loads(zlib.decompress(payload))
+
+
+class AuditSchedule(models.Model):
+    """A page a user wants re-audited every interval_minutes (api.scheduler)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='audit_schedules')
+    url = models.URLField(max_length=2048)
+    url_hash = models.CharField(max_length=64)
+    # Normalized host[:port], for per-host spacing
+    host = models.CharField(max_length=255)
+    interval_minutes = models.PositiveIntegerField()
+    is_active = models.BooleanField(default=True)
+    # The nominal time of the next run; next_run_at is that plus this run's jitter
+    scheduled_for = models.DateTimeField()
+    next_run_at = models.DateTimeField()
+    last_enqueued_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'audit_schedules'
+        ordering = ['next_run_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'url_hash'], name='schedule_unique_user_url'),
+        ]
+        indexes = [
+            # The scheduler tick only looks at active schedules that are due
+            models.Index(fields=['next_run_at'], condition=models.Q(is_active=True), name='schedule_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.url} every {self.interval_minutes} min"
+
+
+class AuditJob(models.Model):
+    """A queued audit of a scheduled page, run by api.scheduler.run_audit_jobs"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    schedule = models.ForeignKey(AuditSchedule, null=True, blank=True, on_delete=models.SET_NULL,
+                                 related_name='jobs')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    url = models.URLField(max_length=2048)
+    host = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # Pending: earliest start (per-host spacing, retry backoff). Running: when a crashed worker's claim lapses.
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    audit = models.ForeignKey(AuditRecord, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+
+    class Meta:
+        db_table = 'audit_jobs'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='audit_job_status_available_idx'),
+            models.Index(fields=['host', 'available_at'], name='audit_job_host_available_idx'),
+            models.Index(fields=['created_at'], name='audit_job_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.url} ({self.status})"
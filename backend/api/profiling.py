@@ -0,0 +1,141 @@
+"""
+Opt-in request profiling.
+
+With PROFILING_ENABLED, ProfilingMiddleware profiles a request when a staff
+user sends the PROFILING_HEADER header, or for a random PROFILING_SAMPLE_RATE
+share of requests. It stores a RequestProfile with the CPU profile (cProfile),
+the top functions and the request's stage timeline (api.metrics stages:
+fetch, parse, extractors, PageSpeed, LLM calls). Staff download the raw
+profile from /api/profiles/<id>/download/ and open it with pstats or snakeviz.
+
+Disabled, the middleware removes itself at startup (MiddlewareNotUsed).
+Enabled, requests that aren't picked cost a header lookup and a random
+number. At most PROFILING_MAX_PER_MINUTE requests per process are profiled,
+one at a time, and only the newest PROFILING_MAX_STORED profiles are kept.
+"""
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import random
+import threading
+import time
+import zlib
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import begin_request_stages, current_request_stages, end_request_stages
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+
+def top_functions(stats, limit):
+    """The limit most expensive functions of a pstats.Stats by cumulative time"""
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f'{filename}:{line}({name})',
+            'calls': calls,
+            'total_ms': round(total * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self._recent = deque()
+        # cProfile profiles one thread, and overlapping profilers would distort each other
+        self._busy = threading.Lock()
+
+    def __call__(self, request):
+        trigger = self.trigger(request)
+        if trigger is None or not self._busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            if not self.admit():
+                return self.get_response(request)
+            return self.profile(request, trigger)
+        finally:
+            self._busy.release()
+
+    def trigger(self, request):
+        if settings.PROFILING_HEADER in request.headers:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated and user.is_staff:
+                return RequestProfile.TRIGGER_HEADER
+        sample_rate = settings.PROFILING_SAMPLE_RATE
+        if sample_rate and random.random() < sample_rate:
+            return RequestProfile.TRIGGER_SAMPLE
+        return None
+
+    def admit(self):
+        """Rate limit: at most PROFILING_MAX_PER_MINUTE profiles in any 60 seconds"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if len(self._recent) >= settings.PROFILING_MAX_PER_MINUTE:
+            return False
+        self._recent.append(now)
+        return True
+
+    def profile(self, request, trigger):
+        # Join the stage breakdown RequestMetricsMiddleware started, or start one
+        token = begin_request_stages() if current_request_stages() is None else None
+        stages = current_request_stages()
+        first_stage = len(stages)
+
+        profiler = cProfile.Profile()
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            duration, cpu = time.perf_counter() - started, time.thread_time() - cpu_started
+            if token is not None:
+                end_request_stages(token)
+
+        try:
+            saved = self.save(request, response, trigger, profiler, duration, cpu, stages[first_stage:], started)
+            if trigger == RequestProfile.TRIGGER_HEADER:
+                response['X-Profile-Id'] = str(saved.pk)
+        except Exception as e:
+            # Profiling must never break the request it observed
+            logger.error(f"Could not store request profile for {request.path}: {e}")
+        return response
+
+    def save(self, request, response, trigger, profiler, duration, cpu, stages, started):
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        profile = RequestProfile.objects.create(
+            trigger=trigger,
+            user=user if user is not None and user.is_authenticated else None,
+            method=request.method,
+            path=request.get_full_path()[:2048],
+            view_name=(match.url_name or '') if match else '',
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            cpu_ms=cpu * 1000,
+            stages=[
+                {'name': name, 'start_ms': round((stage_started - started) * 1000, 3),
+                 'duration_ms': round(seconds * 1000, 3)}
+                for name, seconds, stage_started in stages
+            ],
+            top_functions=top_functions(stats, settings.PROFILING_TOP_FUNCTIONS),
+            profile_data=zlib.compress(marshal.dumps(stats.stats)),
+        )
+        stale = RequestProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True)[
+            settings.PROFILING_MAX_STORED:settings.PROFILING_MAX_STORED + 100
+        ]
+        RequestProfile.objects.filter(id__in=list(stale)).delete()
+        return profile
@@ -0,0 +1,184 @@
+from .metrics import record_stage, registry
+
+
+# Gemini averages roughly four characters per token for English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for prompt sizing"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to about max_tokens, on a word boundary"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 0:
+        return ''
+    cut = text[:max_chars].rsplit(' ', 1)[0]
+    return cut + '...'
+
+
+class PromptSection:
+    """
+    One variable part of a prompt.
+
+    Sections with a lower priority are trimmed first. Item sections are
+    trimmed by dropping whole items (the oldest ones when keep='last') and
+    noting how many were left out; text sections are cut on a word boundary.
+    """
+
+    def __init__(self, name, text='', items=None, separator='\n', priority=0,
+                 min_tokens=0, keep='first', empty='None'):
+        self.name = name
+        self.text = text
+        self.items = list(items) if items is not None else None
+        self.separator = separator
+        self.priority = priority
+        self.min_tokens = min_tokens
+        self.keep = keep
+        self.empty = empty
+        self.trimmed = False
+
+    def render(self):
+        if self.items is None:
+            return self.text if self.text else self.empty
+        return self.separator.join(self.items) if self.items else self.empty
+
+    def tokens(self):
+        return estimate_tokens(self.render())
+
+    def shrink(self, target_tokens):
+        """Shrink the section to target_tokens (but not below min_tokens)"""
+        target_tokens = max(target_tokens, self.min_tokens)
+        if self.tokens() <= target_tokens:
+            return
+
+        self.trimmed = True
+        if self.items is None:
+            self.text = truncate_to_tokens(self.text, target_tokens)
+            return
+
+        total = len(self.items)
+        kept = list(self.items)
+        while kept and estimate_tokens(self.separator.join(kept)) > target_tokens:
+            if self.keep == 'last':
+                kept.pop(0)
+            else:
+                kept.pop()
+
+        omitted = total - len(kept)
+        note = f"[{omitted} more omitted]"
+        self.items = [note] + kept if self.keep == 'last' else kept + [note]
+
+
+class PromptBudget:
+    """
+    Fit the variable sections of a prompt into a token budget.
+
+    Usage:
+        budget = PromptBudget('chat', max_tokens=3000)
+        budget.add('history', items=messages, priority=1, keep='last')
+        budget.add('question', question, priority=10)
+        prompt = budget.render(lambda s: f"...{s['history']}...{s['question']}...")
+    """
+
+    def __init__(self, endpoint, max_tokens):
+        self.endpoint = endpoint
+        self.max_tokens = max_tokens
+        self.sections = {}
+
+    def add(self, name, text='', **options):
+        self.sections[name] = PromptSection(name, text=text, **options)
+        return self.sections[name]
+
+    def render(self, template):
+        """Trim sections to fit the budget, then render the prompt"""
+        overhead = estimate_tokens(template({name: '' for name in self.sections}))
+        available = self.max_tokens - overhead
+
+        # Trim the lowest-priority sections first until the prompt fits
+        for section in sorted(self.sections.values(), key=lambda s: s.priority):
+            excess = sum(s.tokens() for s in self.sections.values()) - available
+            if excess <= 0:
+                break
+            section.shrink(section.tokens() - excess)
+
+        for name, section in self.sections.items():
+            registry.inc('llm_prompt_section_tokens_total', section.tokens(),
+                         endpoint=self.endpoint, section=name)
+            if section.trimmed:
+                registry.inc('llm_prompt_sections_trimmed_total', endpoint=self.endpoint, section=name)
+
+        return template({name: section.render() for name, section in self.sections.items()})
+
+
+def record_llm_call(endpoint, prompt, response, latency, outcome):
+    """Record token counts and latency of one model call"""
+    usage = getattr(response, 'usage_metadata', None) if response is not None else None
+    input_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+    output_tokens = getattr(usage, 'candidates_token_count', None)
+    if output_tokens is None:
+        try:
+            output_tokens = estimate_tokens(response.text) if response is not None else 0
+        except Exception:
+            output_tokens = 0
+
+    registry.inc('llm_calls_total', endpoint=endpoint, outcome=outcome)
+    registry.inc('llm_input_tokens_total', input_tokens, endpoint=endpoint)
+    registry.inc('llm_output_tokens_total', output_tokens, endpoint=endpoint)
+    registry.observe('llm_call_latency_seconds', latency, endpoint=endpoint)
+    record_stage(f'llm_{endpoint}', latency)
+    registry.observe('llm_prompt_tokens', input_tokens,
+                     buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000), endpoint=endpoint)
+
+
+def llm_usage_summary():
+    """
+    Per-endpoint call counts, token totals, latency, JSON parse outcomes
+    (clean / repaired / invalid / failed) and user retries after a failure
+    """
+    summary = {}
+
+    def entry(endpoint):
+        return summary.setdefault(endpoint, {
+            'calls': 0, 'errors': 0, 'input_tokens': 0, 'output_tokens': 0,
+            'avg_latency_ms': 0.0, 'avg_prompt_tokens': 0.0, 'trimmed_sections': 0,
+            'json_parses': {}, 'json_retries': 0,
+        })
+
+    metrics = registry.snapshot()
+    for counter in metrics['counters']:
+        endpoint = counter['labels'].get('endpoint')
+        if endpoint is None:
+            continue
+        if counter['name'] == 'llm_calls_total':
+            entry(endpoint)['calls'] += counter['value']
+            if counter['labels'].get('outcome') != 'ok':
+                entry(endpoint)['errors'] += counter['value']
+        elif counter['name'] == 'llm_input_tokens_total':
+            entry(endpoint)['input_tokens'] += counter['value']
+        elif counter['name'] == 'llm_output_tokens_total':
+            entry(endpoint)['output_tokens'] += counter['value']
+        elif counter['name'] == 'llm_prompt_sections_trimmed_total':
+            entry(endpoint)['trimmed_sections'] += counter['value']
+        elif counter['name'] == 'llm_json_parse_total':
+            parses = entry(endpoint)['json_parses']
+            result = counter['labels'].get('result')
+            parses[result] = parses.get(result, 0) + counter['value']
+        elif counter['name'] == 'llm_json_retries_total':
+            entry(endpoint)['json_retries'] += counter['value']
+
+    for histogram in metrics['histograms']:
+        endpoint = histogram['labels'].get('endpoint')
+        if endpoint is None or not histogram['count']:
+            continue
+        average = histogram['sum'] / histogram['count']
+        if histogram['name'] == 'llm_call_latency_seconds':
+            entry(endpoint)['avg_latency_ms'] = round(average * 1000, 1)
+        elif histogram['name'] == 'llm_prompt_tokens':
+            entry(endpoint)['avg_prompt_tokens'] = round(average, 1)
+
+    return summary
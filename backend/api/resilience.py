@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from google.api_core import exceptions as google_exceptions
+
+from .metrics import registry
+
+
+# Errors worth retrying: timeouts, throttling and transient server failures
+RETRYABLE_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class LLMUnavailableError(Exception):
+    """The LLM cannot be called right now; clients should retry after retry_after seconds"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(int(round(retry_after)), 1)
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+class ConcurrencyLimitError(LLMUnavailableError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls pass through. After failure_threshold consecutive failures
+    the breaker opens and rejects calls for reset_timeout seconds, then goes
+    half-open and lets a single probe call through; its outcome closes or
+    re-opens the breaker.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        states = (self.CLOSED, self.HALF_OPEN, self.OPEN)
+        registry.set_gauge('circuit_breaker_state', states.index(self.state), breaker=self.name)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - self.clock()
+                if remaining > 0:
+                    raise CircuitOpenError(f'{self.name} circuit is open', retry_after=remaining)
+                self.state = self.HALF_OPEN
+                self._publish()
+
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError(f'{self.name} circuit is half-open', retry_after=1)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                self._publish()
+
+    def release_probe(self):
+        """The call ended without telling us anything about the dependency: leave the state alone"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                registry.inc('circuit_breaker_opened_total', breaker=self.name)
+                self._publish()
+
+
+class ResilientCaller:
+    """
+    Wraps calls to a remote dependency with a concurrency cap, a circuit
+    breaker, per-attempt timeouts inside an overall deadline, and bounded
+    retries with full-jitter exponential backoff.
+
+    The wrapped function receives the timeout (seconds) for the attempt.
+    """
+
+    def __init__(self, name, max_concurrent=4, concurrency_wait=2.0, attempt_timeout=20.0,
+                 deadline=45.0, max_retries=2, backoff_base=0.5, backoff_max=4.0,
+                 breaker=None, sleep=time.sleep, clock=time.monotonic):
+        self.name = name
+        self.concurrency_wait = concurrency_wait
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(name, clock=clock)
+        self.sleep = sleep
+        self.clock = clock
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def backoff(self, attempt):
+        """Full-jitter backoff before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def call(self, func):
+        if not self._slots.acquire(timeout=self.concurrency_wait):
+            registry.inc('llm_rejected_total', dependency=self.name, reason='concurrency')
+            raise ConcurrencyLimitError(f'Too many concurrent {self.name} calls', retry_after=2)
+        try:
+            return self._call_with_retries(func)
+        finally:
+            self._slots.release()
+
+    def _call_with_retries(self, func):
+        self.breaker.before_call()
+        give_up_at = self.clock() + self.deadline
+        attempt = 0
+        while True:
+            remaining = give_up_at - self.clock()
+            try:
+                if remaining <= 0:
+                    raise TimeoutError(f'{self.name} call exceeded its {self.deadline}s deadline')
+                result = func(min(self.attempt_timeout, remaining))
+            except RETRYABLE_ERRORS:
+                attempt += 1
+                delay = self.backoff(attempt)
+                if attempt > self.max_retries or self.clock() + delay >= give_up_at:
+                    self.breaker.record_failure()
+                    raise
+                registry.inc('llm_retries_total', dependency=self.name)
+                self.sleep(delay)
+            except Exception:
+                # Non-transient errors (bad request, auth) say nothing about availability
+                self.breaker.release_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+
+_callers = {}
+_callers_lock = threading.Lock()
+
+
+def get_llm_caller(name='gemini'):
+    """Process-wide ResilientCaller for LLM calls, configured from settings"""
+    with _callers_lock:
+        caller = _callers.get(name)
+        if caller is None:
+            caller = _callers[name] = ResilientCaller(
+                name,
+                max_concurrent=settings.AI_MAX_CONCURRENT_CALLS,
+                concurrency_wait=settings.AI_CONCURRENCY_WAIT_SECONDS,
+                attempt_timeout=settings.AI_CALL_TIMEOUT_SECONDS,
+                deadline=settings.AI_CALL_DEADLINE_SECONDS,
+                max_retries=settings.AI_RETRY_ATTEMPTS,
+                backoff_base=settings.AI_RETRY_BACKOFF_SECONDS,
+                backoff_max=settings.AI_RETRY_BACKOFF_MAX_SECONDS,
+                breaker=CircuitBreaker(
+                    name,
+                    failure_threshold=settings.AI_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=settings.AI_CIRCUIT_RESET_SECONDS,
+                ),
+            )
+        return caller
+
+
+def reset_llm_callers():
+    """Drop configured callers (e.g. after settings change in tests)"""
+    with _callers_lock:
+        _callers.clear()
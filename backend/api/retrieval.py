@@ -0,0 +1,147 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Letters and digits in any script (\w without the underscore)
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can did do does doing down during each few for from further had has have having
+he her here hers him his how i if in into is it its itself just me more most my no nor not now of off
+on once only or other our ours out over own same she should so some such than that the their theirs
+them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with you your yours
+""".split())
+
+
+def tokenize(text):
+    """Casefolded word tokens with stopwords removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.casefold()) if token not in STOPWORDS]
+
+
+def chunk_text(text, chunk_words=120, overlap=30):
+    """Split text into overlapping windows of words"""
+    words = text.split()
+    if not words:
+        return []
+
+    step = max(chunk_words - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(' '.join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over the chunks of a single page.
+
+    Postings are stored as flat NumPy arrays sorted by term id, so a query
+    touches only the postings of its own terms.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+
+        token_ids = []
+        chunk_ids = []
+        for chunk_id, chunk in enumerate(chunks):
+            ids = [self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokenize(chunk)]
+            token_ids.extend(ids)
+            chunk_ids.extend([chunk_id] * len(ids))
+
+        n_chunks = len(chunks)
+        n_terms = max(len(self.vocabulary), 1)
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+
+        # Collapse (chunk, term) pairs into term frequencies, ordered by term
+        keys, tf = np.unique(token_ids * n_chunks + chunk_ids, return_counts=True)
+        self.posting_terms = keys // n_chunks if n_chunks else keys
+        self.posting_chunks = keys % n_chunks if n_chunks else keys
+        self.posting_tf = tf.astype(np.float64)
+
+        doc_freq = np.bincount(self.posting_terms, minlength=n_terms)
+        self.idf = np.log1p((n_chunks - doc_freq + 0.5) / (doc_freq + 0.5))
+        self.chunk_lengths = np.bincount(chunk_ids, minlength=n_chunks).astype(np.float64)
+        self.average_length = self.chunk_lengths.mean() if n_chunks else 0.0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def score(self, query):
+        """BM25 score of every chunk for the query"""
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        term_ids = [self.vocabulary[token] for token in set(tokenize(query)) if token in self.vocabulary]
+        if not term_ids or not len(self.chunks):
+            return scores
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        starts = np.searchsorted(self.posting_terms, term_ids, side='left')
+        ends = np.searchsorted(self.posting_terms, term_ids, side='right')
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+        chunks = self.posting_chunks[positions]
+        tf = self.posting_tf[positions]
+        norm = self.k1 * (1 - self.b + self.b * self.chunk_lengths[chunks] / self.average_length)
+        contributions = self.idf[self.posting_terms[positions]] * tf * (self.k1 + 1) / (tf + norm)
+        np.add.at(scores, chunks, contributions)
+        return scores
+
+    def search(self, query, k=4):
+        """Return the top-k (chunk, score) pairs in page order"""
+        scores = self.score(query)
+        if not scores.any():
+            return []
+
+        k = min(k, int(np.count_nonzero(scores)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [(self.chunks[i], float(scores[i])) for i in sorted(top)]
+
+
+class IndexCache:
+    """Small thread-safe LRU of built indexes, keyed by snapshot ID"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, text):
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+
+        index = BM25Index(chunk_text(text))
+
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+index_cache = IndexCache()
+
+
+def get_snapshot_index(snapshot):
+    """Get the (cached) retrieval index of a snapshot's full page text"""
+    if not snapshot.page_text:
+        return None
+    return index_cache.get_or_build(str(snapshot.id), snapshot.page_text)
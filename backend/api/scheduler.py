@@ -0,0 +1,227 @@
+"""
+Scheduled re-audits.
+
+An AuditSchedule asks for a page to be audited every interval_minutes.
+tick() (run every SCHEDULER_TICK_SECONDS by `manage.py run_scheduler`)
+turns due schedules into AuditJob rows, and run_audit_jobs() (`manage.py
+run_audit_jobs`) claims and runs them like the email outbox does.
+
+Each schedule keeps its nominal slot (scheduled_for) and the jittered time
+it actually becomes due (next_run_at = slot + random jitter), so schedules
+created on the hour spread over the following minutes without drifting.
+A tick:
+
+- enqueues at most SCHEDULER_MAX_ENQUEUE_PER_MINUTE jobs per minute (counted
+  from the jobs table, so it holds across restarts); the rest stay due and
+  go first on the next tick,
+- starts jobs for one host at least SCHEDULER_HOST_SPACING_SECONDS apart by
+  giving them staggered available_at times,
+- doesn't enqueue a schedule whose previous job hasn't run yet,
+- handles downtime: a run more than SCHEDULER_MISSED_GRACE_MINUTES late runs
+  once (SCHEDULER_CATCH_UP='once') or not at all ('skip'), and the schedule
+  moves to its first slot after now either way, never replaying every slot.
+"""
+import logging
+import random
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .coalescing import normalize_url
+from .metrics import registry
+from .models import AuditJob, AuditRecord, AuditSchedule
+from .scraper import WebScraper
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED = (AuditJob.STATUS_PENDING, AuditJob.STATUS_RUNNING)
+
+
+def url_host(url):
+    return urlsplit(normalize_url(url)).netloc
+
+
+def jitter(interval_minutes):
+    """A random delay for one run of a schedule"""
+    limit = min(settings.SCHEDULER_MAX_JITTER_SECONDS, interval_minutes * 60 * settings.SCHEDULER_JITTER_FRACTION)
+    return timezone.timedelta(seconds=random.uniform(0, limit))
+
+
+def create_schedule(user, url, interval_minutes):
+    """Schedule url for user; the first run is due within the jitter window"""
+    now = timezone.now()
+    return AuditSchedule.objects.create(
+        user=user,
+        url=url,
+        url_hash=AuditRecord.hash_url(url),
+        host=url_host(url),
+        interval_minutes=interval_minutes,
+        scheduled_for=now,
+        next_run_at=now + jitter(interval_minutes),
+    )
+
+
+def set_interval(schedule, interval_minutes):
+    """Change the interval; the next run is one new interval after the last slot"""
+    last_slot = schedule.scheduled_for - timezone.timedelta(minutes=schedule.interval_minutes)
+    schedule.interval_minutes = interval_minutes
+    schedule.scheduled_for = last_slot
+    advance(schedule, timezone.now())
+
+
+def advance(schedule, now):
+    """Move a schedule to its first slot after now, keeping its phase"""
+    interval = timezone.timedelta(minutes=schedule.interval_minutes)
+    slot = schedule.scheduled_for + interval
+    if slot <= now:
+        slot += interval * ((now - slot) // interval + 1)
+    schedule.scheduled_for = slot
+    schedule.next_run_at = slot + jitter(schedule.interval_minutes)
+
+
+def missed(schedule, now):
+    """Whether a due run is so late it was missed (the scheduler wasn't running)"""
+    return now - schedule.next_run_at > timezone.timedelta(minutes=settings.SCHEDULER_MISSED_GRACE_MINUTES)
+
+
+def enqueue_budget(now):
+    """How many jobs this tick may enqueue under the per-minute cap"""
+    recent = AuditJob.objects.filter(created_at__gt=now - timezone.timedelta(minutes=1)).count()
+    return max(settings.SCHEDULER_MAX_ENQUEUE_PER_MINUTE - recent, 0)
+
+
+def tick(now=None):
+    """
+    Enqueue due schedules as audit jobs.
+
+    Returns {'due': schedules looked at, 'enqueued', 'skipped': missed or
+    still running, 'rate_limited': whether the cap cut this tick short}
+    """
+    now = now or timezone.now()
+    budget = enqueue_budget(now)
+    stats = {'due': 0, 'enqueued': 0, 'skipped': 0, 'rate_limited': False}
+    if budget == 0:
+        stats['rate_limited'] = True
+        return stats
+
+    spacing = timezone.timedelta(seconds=settings.SCHEDULER_HOST_SPACING_SECONDS)
+    with transaction.atomic():
+        limit = min(budget, settings.SCHEDULER_BATCH_SIZE)
+        due = list(
+            AuditSchedule.objects.select_for_update(skip_locked=True)
+            .filter(is_active=True, next_run_at__lte=now)
+            .order_by('next_run_at')[:limit]
+        )
+        if not due:
+            return stats
+        running = set(
+            AuditJob.objects.filter(schedule__in=due, status__in=UNFINISHED).values_list('schedule_id', flat=True)
+        )
+        # When each host may next start an audit, from the jobs already queued
+        host_free = {
+            row['host']: row['last'] + spacing
+            for row in AuditJob.objects.filter(host__in={schedule.host for schedule in due},
+                                               available_at__gt=now - spacing)
+            .values('host').annotate(last=Max('available_at'))
+        }
+
+        jobs = []
+        for schedule in due:
+            skip = schedule.id in running or (missed(schedule, now) and settings.SCHEDULER_CATCH_UP == 'skip')
+            if not skip:
+                available_at = max(now, host_free.get(schedule.host, now))
+                host_free[schedule.host] = available_at + spacing
+                jobs.append(AuditJob(schedule=schedule, user_id=schedule.user_id, url=schedule.url,
+                                     host=schedule.host, available_at=available_at, created_at=now))
+                schedule.last_enqueued_at = now
+            advance(schedule, now)
+        AuditJob.objects.bulk_create(jobs)
+        # Every row has its own jitter, so each field is a CASE per row; smaller batches compile faster
+        AuditSchedule.objects.bulk_update(due, ['scheduled_for', 'next_run_at', 'last_enqueued_at'],
+                                          batch_size=100)
+
+    stats.update({'due': len(due), 'enqueued': len(jobs), 'skipped': len(due) - len(jobs),
+                  'rate_limited': len(due) == budget})
+    registry.inc('scheduler_jobs_enqueued_total', len(jobs))
+    registry.inc('scheduler_runs_skipped_total', len(due) - len(jobs))
+    return stats
+
+
+def purge_finished_jobs(batch_size=500):
+    """Delete one bounded batch of finished jobs older than SCHEDULER_JOB_RETENTION_DAYS"""
+    cutoff = timezone.now() - timezone.timedelta(days=settings.SCHEDULER_JOB_RETENTION_DAYS)
+    ids = list(
+        AuditJob.objects.filter(created_at__lt=cutoff)
+        .exclude(status__in=UNFINISHED)
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if ids:
+        AuditJob.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def claim_jobs(batch_size):
+    """
+    Claim up to batch_size jobs that may start now, earliest first.
+
+    Claimed jobs are 'running' until SCHEDULER_JOB_CLAIM_SECONDS from now;
+    jobs whose claim lapsed (worker died mid-audit) are claimed again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            AuditJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=UNFINISHED, available_at__lte=now)
+            .order_by('available_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            AuditJob.objects.filter(id__in=ids).update(
+                status=AuditJob.STATUS_RUNNING,
+                attempts=F('attempts') + 1,
+                available_at=now + timezone.timedelta(seconds=settings.SCHEDULER_JOB_CLAIM_SECONDS),
+            )
+    return list(AuditJob.objects.filter(id__in=ids).select_related('user').order_by('available_at'))
+
+
+def run_audit_jobs(batch_size=None):
+    """
+    Run one batch of due audit jobs, storing each result in the user's
+    audit history. Failed audits are retried with exponential backoff up to
+    SCHEDULER_JOB_MAX_ATTEMPTS.
+
+    Returns (done, failed)
+    """
+    done = failed = 0
+    for job in claim_jobs(batch_size or settings.SCHEDULER_JOB_BATCH_SIZE):
+        try:
+            scraper = WebScraper(job.url)
+            audit = AuditRecord.record(job.user, scraper.scrape(), page_text=scraper.get_page_text())
+        except Exception as e:
+            failed += 1
+            _record_failure(job, e)
+            continue
+        done += 1
+        AuditJob.objects.filter(id=job.id).update(
+            status=AuditJob.STATUS_DONE, audit=audit, finished_at=timezone.now(), last_error=''
+        )
+
+    registry.inc('scheduler_audits_done_total', done)
+    registry.inc('scheduler_audits_failed_attempts_total', failed)
+    return done, failed
+
+
+def _record_failure(job, error):
+    logger.error(f"Scheduled audit of {job.url} failed (attempt {job.attempts}): {error}")
+    if job.attempts >= settings.SCHEDULER_JOB_MAX_ATTEMPTS:
+        job.status = AuditJob.STATUS_FAILED
+        job.finished_at = timezone.now()
+    else:
+        job.status = AuditJob.STATUS_PENDING
+        delay = settings.SCHEDULER_JOB_RETRY_SECONDS * 2 ** (job.attempts - 1)
+        job.available_at = timezone.now() + timezone.timedelta(seconds=delay)
+    job.last_error = str(error)[:1000]
+    job.save(update_fields=['status', 'available_at', 'finished_at', 'last_error'])
@@ -1,28 +1,139 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
 from urllib.parse import urljoin, urlparse
-import re
 import os
 
+from django.conf import settings
+
+from .metrics import timed
+from .structured_data import PageScan, extract_structured_data
+
+
+# Elements whose content is never visible page content (text, links, images)
+HIDDEN_TAGS = ('script', 'style', 'noscript', 'template')
+# Site chrome around the main content, skipped by boilerplate-free content excerpts
+BOILERPLATE_TAGS = ('nav', 'aside', 'footer')
+# Text nodes; comments, doctypes and script/style strings are other NavigableString subclasses
+TEXT_TYPES = (NavigableString, CData)
+
 
 class WebScraper:
-    def __init__(self, url):
+    """
+    Fetches one page and extracts its SEO data.
+
+    The parsed tree and the raw body are the bulk of a scrape's memory (the
+    tree is several times the page size), so scrape() releases both as soon
+    as extraction is done, before the slow PageSpeed calls; only the
+    extracted data and the page text are kept. Extractors never modify the
+    tree, so they can run in any order.
+    """
+    # (field, stage, method) in scrape() order
+    EXTRACTORS = (
+        ('meta_title', 'meta_title', 'get_meta_title'),
+        ('meta_description', 'meta_description', 'get_meta_description'),
+        ('meta_keywords', 'meta_keywords', 'get_meta_keywords'),
+        ('og_image', 'og_image', 'get_og_image'),
+        ('content', 'content', 'get_content'),
+        ('headings', 'headings', 'get_headings'),
+        ('internal_links', 'internal_links', 'get_internal_links'),
+        ('external_links', 'external_links', 'get_external_links'),
+        ('images', 'images', 'get_images'),
+        ('images_missing_alt_count', 'images_missing_alt', 'get_images_missing_alt_count'),
+        ('word_count', 'word_count', 'get_word_count'),
+        ('language', 'language', 'get_language'),
+        ('canonical_url', 'canonical_url', 'get_canonical_url'),
+        ('structured_data', 'structured_data', 'get_structured_data'),
+    )
+    COUNTED = ('internal_links', 'external_links', 'images')
+
+    def __init__(self, url, skip_boilerplate=None):
         self.url = url
+        # Whether the content excerpt leaves out nav/aside/footer text
+        if skip_boilerplate is None:
+            skip_boilerplate = settings.SCRAPE_CONTENT_SKIP_BOILERPLATE
+        self.skip_boilerplate = skip_boilerplate
         self.soup = None
-        self.response = None
-        
+        self.status_code = None
+        self.content_length = None
+        self._page_text = None
+        self._hidden = None
+        self._scan = None
+
     def fetch_page(self):
         """Fetch the webpage content"""
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-            self.response = requests.get(self.url, headers=headers, timeout=10)
-            self.response.raise_for_status()
-            self.soup = BeautifulSoup(self.response.content, 'lxml')
+            # Time to response headers covers DNS, connect, TLS and the server's first byte
+            with timed('scrape_stage_seconds', stage='fetch_headers'):
+                response = requests.get(self.url, headers=headers, timeout=10, stream=True)
+            try:
+                response.raise_for_status()
+                with timed('scrape_stage_seconds', stage='fetch_body'):
+                    content = response.content
+                self.status_code = response.status_code
+            finally:
+                response.close()
+            # The response isn't kept: after parsing, the bytes are freed as soon as this returns
+            self.load_html(content)
             return True
         except requests.exceptions.RequestException as e:
             raise Exception(f"Error fetching URL: {str(e)}")
+
+    def load_html(self, content):
+        """Parse already-fetched HTML (bytes or str), e.g. from a file, instead of fetching the URL"""
+        self.release()
+        self._page_text = None
+        self.content_length = len(content)
+        with timed('scrape_stage_seconds', stage='parse'):
+            self.soup = BeautifulSoup(content, 'lxml')
+
+    def release(self):
+        """Free the parsed tree; extracted results (and the page text, if computed) are kept"""
+        if self.soup is not None:
+            # Every node links to its parent and siblings, so an unreferenced tree is only freed by
+            # a (rare, full) cyclic GC pass. decompose() breaks the links so it is freed right away;
+            # it must start at the top-level nodes, as the BeautifulSoup object isn't linked to them.
+            for node in list(self.soup.contents):
+                node.decompose()
+            self.soup.decompose()
+        self.soup = None
+        self._hidden = None
+        self._scan = None
+
+    def _is_hidden(self, node):
+        """Whether node is inside script/style/noscript/template"""
+        if self._hidden is None:
+            self._hidden = {
+                id(descendant)
+                for tag in self.soup.find_all(HIDDEN_TAGS)
+                for descendant in tag.descendants
+            }
+        return id(node) in self._hidden
+
+    @property
+    def scan(self):
+        """Meta tags, JSON-LD scripts and microdata elements, from one walk over the tree"""
+        if self._scan is None:
+            self._scan = PageScan(self.soup)
+        return self._scan
+
+    def find_meta(self, attribute, value):
+        """The first <meta> tag whose name or property equals value"""
+        return self.scan.find_meta(attribute, value)
+
+    def _visible(self, tags):
+        return [tag for tag in tags if not self._is_hidden(tag)]
+
+    def extract_all(self):
+        """Run every extractor on the loaded page, in scrape() order"""
+        data = {}
+        for field, stage, method in self.EXTRACTORS:
+            data[field] = self._extract(stage, getattr(self, method))
+            if field in self.COUNTED:
+                data[f'{field}_count'] = len(data[field])
+        return data
     
     def get_meta_title(self):
         """Extract meta title"""
@@ -31,12 +142,12 @@ class WebScraper:
             return self.soup.title.string.strip()
         
         # Try og:title
-        og_title = self.soup.find('meta', property='og:title')
+        og_title = self.find_meta('property', 'og:title')
         if og_title and og_title.get('content'):
             return og_title['content'].strip()
         
         # Try twitter:title
-        twitter_title = self.soup.find('meta', attrs={'name': 'twitter:title'})
+        twitter_title = self.find_meta('name', 'twitter:title')
         if twitter_title and twitter_title.get('content'):
             return twitter_title['content'].strip()
         
@@ -45,17 +156,17 @@ class WebScraper:
     def get_meta_description(self):
         """Extract meta description"""
         # Try standard meta description
-        meta_desc = self.soup.find('meta', attrs={'name': 'description'})
+        meta_desc = self.find_meta('name', 'description')
         if meta_desc and meta_desc.get('content'):
             return meta_desc['content'].strip()
         
         # Try og:description
-        og_desc = self.soup.find('meta', property='og:description')
+        og_desc = self.find_meta('property', 'og:description')
         if og_desc and og_desc.get('content'):
             return og_desc['content'].strip()
         
         # Try twitter:description
-        twitter_desc = self.soup.find('meta', attrs={'name': 'twitter:description'})
+        twitter_desc = self.find_meta('name', 'twitter:description')
         if twitter_desc and twitter_desc.get('content'):
             return twitter_desc['content'].strip()
         
@@ -63,33 +174,65 @@ class WebScraper:
     
     def get_meta_keywords(self):
         """Extract meta keywords"""
-        meta_keywords = self.soup.find('meta', attrs={'name': 'keywords'})
+        meta_keywords = self.find_meta('name', 'keywords')
         if meta_keywords and meta_keywords.get('content'):
             return meta_keywords['content'].strip()
         return "No keywords found"
     
     def get_og_image(self):
         """Extract Open Graph image"""
-        og_image = self.soup.find('meta', property='og:image')
+        og_image = self.find_meta('property', 'og:image')
         if og_image and og_image.get('content'):
             return og_image['content'].strip()
         return None
     
-    def get_content(self):
-        """Extract main content from the page"""
-        # Remove script and style elements
-        for script in self.soup(['script', 'style', 'noscript']):
-            script.decompose()
-        
-        # Get text content
-        text = self.soup.get_text(separator=' ', strip=True)
-        
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+    def iter_text(self, skip_boilerplate=False):
+        """
+        Yield the visible text nodes of the page in document order, stripped
+        and with inner whitespace collapsed. Walks the tree lazily, so callers
+        that stop early don't pay for the rest of the page.
+
+        script/style/noscript/template subtrees are skipped, and with
+        skip_boilerplate so are nav, aside and footer (menus, sidebars, footers).
+        """
+        skip = BOILERPLATE_TAGS + HIDDEN_TAGS if skip_boilerplate else HIDDEN_TAGS
+        stack = [iter(self.soup.contents)]
+        while stack:
+            for node in stack[-1]:
+                if isinstance(node, Tag):
+                    if node.name not in skip and node.contents:
+                        stack.append(iter(node.contents))
+                        break
+                elif type(node) in TEXT_TYPES:
+                    text = ' '.join(node.split())
+                    if text:
+                        yield text
+            else:
+                stack.pop()
+
+    def get_page_text(self):
+        """Extract the full visible text of the page"""
+        if self._page_text is None:
+            self._page_text = ' '.join(self.iter_text())
+        return self._page_text
+    
+    def get_content(self, max_chars=1000):
+        """Extract main content from the page: the first max_chars characters of its text"""
+        if self._page_text is not None and not self.skip_boilerplate:
+            text = self._page_text[:max_chars + 1]
+        else:
+            # Stop walking the page as soon as there is more than max_chars of text
+            pieces, length = [], -1
+            for piece in self.iter_text(self.skip_boilerplate):
+                pieces.append(piece)
+                length += len(piece) + 1
+                if length > max_chars:
+                    break
+            text = ' '.join(pieces)
         
-        # Limit to first 1000 characters for display
-        if len(text) > 1000:
-            text = text[:1000] + "..."
+        # Limit to first max_chars characters for display
+        if len(text) > max_chars:
+            text = text[:max_chars] + "..."
         
         return text if text else "No content found"
     
@@ -98,7 +241,7 @@ class WebScraper:
         headings = {}
         for i in range(1, 7):
             tag = f'h{i}'
-            found_headings = self.soup.find_all(tag)
+            found_headings = self._visible(self.soup.find_all(tag))
             if found_headings:
                 headings[tag] = [h.get_text(strip=True) for h in found_headings if h.get_text(strip=True)]
         return headings
@@ -108,7 +251,7 @@ class WebScraper:
         base_domain = urlparse(self.url).netloc
         internal_links = set()
         
-        for link in self.soup.find_all('a', href=True):
+        for link in self._visible(self.soup.find_all('a', href=True)):
             href = link['href']
             # Convert relative URLs to absolute
             absolute_url = urljoin(self.url, href)
@@ -128,7 +271,7 @@ class WebScraper:
         base_domain = urlparse(self.url).netloc
         external_links = set()
         
-        for link in self.soup.find_all('a', href=True):
+        for link in self._visible(self.soup.find_all('a', href=True)):
             href = link['href']
             # Convert relative URLs to absolute
             absolute_url = urljoin(self.url, href)
@@ -143,7 +286,7 @@ class WebScraper:
     def get_images(self):
         """Extract all images"""
         images = []
-        for img in self.soup.find_all('img', src=True):
+        for img in self._visible(self.soup.find_all('img', src=True)):
             img_url = urljoin(self.url, img['src'])
             alt_text = img.get('alt', 'No alt text')
             images.append({
@@ -152,6 +295,16 @@ class WebScraper:
             })
         return images[:20]  # Limit to 20 images
     
+    def get_images_missing_alt_count(self):
+        """Count images without an alt attribute (alt="" marks decorative images)"""
+        return sum(1 for img in self._visible(self.soup.find_all('img', src=True)) if img.get('alt') is None)
+    
+    def get_word_count(self):
+        """Count words in the full visible text, one text node at a time"""
+        if self._page_text is not None:
+            return self._page_text.count(' ') + 1 if self._page_text else 0
+        return sum(piece.count(' ') + 1 for piece in self.iter_text())
+    
     def get_language(self):
         """Extract page language"""
         html_tag = self.soup.find('html')
@@ -166,6 +319,14 @@ class WebScraper:
             return canonical['href']
         return None
     
+    def get_structured_data(self):
+        """Extract JSON-LD, microdata and Open Graph / Twitter card properties"""
+        return extract_structured_data(
+            self.scan, self.url,
+            max_json_chars=settings.SCRAPE_JSON_LD_MAX_CHARS,
+            max_items=settings.SCRAPE_STRUCTURED_DATA_MAX_ITEMS,
+        )
+    
     def get_pagespeed_insights(self):
         """Get PageSpeed Insights data for both mobile and desktop"""
         try:
@@ -187,8 +348,9 @@ class WebScraper:
             
             # Fetch desktop metrics
             try:
-                psi_url_desktop = f"https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={self.url}&key={api_key}&strategy=desktop&category=PERFORMANCE&category=ACCESSIBILITY&category=BEST_PRACTICES&category=SEO"
-                desktop_response = requests.get(psi_url_desktop, timeout=30)
+                psi_url_desktop = f"{settings.PAGESPEED_API_URL}?url={self.url}&key={api_key}&strategy=desktop&category=PERFORMANCE&category=ACCESSIBILITY&category=BEST_PRACTICES&category=SEO"
+                with timed('psi_request_seconds', step='psi_desktop', strategy='desktop'):
+                    desktop_response = requests.get(psi_url_desktop, timeout=30)
                 
                 if desktop_response.status_code == 200:
                     desktop_data = desktop_response.json()
@@ -198,8 +360,9 @@ class WebScraper:
             
             # Fetch mobile metrics
             try:
-                psi_url_mobile = f"https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={self.url}&key={api_key}&strategy=mobile&category=PERFORMANCE&category=ACCESSIBILITY&category=BEST_PRACTICES&category=SEO"
-                mobile_response = requests.get(psi_url_mobile, timeout=30)
+                psi_url_mobile = f"{settings.PAGESPEED_API_URL}?url={self.url}&key={api_key}&strategy=mobile&category=PERFORMANCE&category=ACCESSIBILITY&category=BEST_PRACTICES&category=SEO"
+                with timed('psi_request_seconds', step='psi_mobile', strategy='mobile'):
+                    mobile_response = requests.get(psi_url_mobile, timeout=30)
                 
                 if mobile_response.status_code == 200:
                     mobile_data = mobile_response.json()
@@ -269,30 +432,28 @@ class WebScraper:
         except Exception as e:
             return {'error': f'Failed to parse PageSpeed data: {str(e)}'}
     
+    def _extract(self, stage, extractor):
+        with timed('scrape_stage_seconds', stage=stage):
+            return extractor()
+
     def scrape(self):
         """Main scraping method that returns all data"""
-        self.fetch_page()
-        
-        data = {
-            'url': self.url,
-            'status_code': self.response.status_code,
-            'meta_title': self.get_meta_title(),
-            'meta_description': self.get_meta_description(),
-            'meta_keywords': self.get_meta_keywords(),
-            'og_image': self.get_og_image(),
-            'content': self.get_content(),
-            'headings': self.get_headings(),
-            'internal_links': self.get_internal_links(),
-            'internal_links_count': len(self.get_internal_links()),
-            'external_links': self.get_external_links(),
-            'external_links_count': len(self.get_external_links()),
-            'images': self.get_images(),
-            'images_count': len(self.get_images()),
-            'language': self.get_language(),
-            'canonical_url': self.get_canonical_url(),
-            'content_length': len(self.response.content),
+        try:
+            self.fetch_page()
+            # The snapshot needs the full text anyway; with it cached, the content excerpt and
+            # word count don't walk the tree again, and get_page_text() works after release()
+            self.get_page_text()
+            data = {
+                'url': self.url,
+                'status_code': self.status_code,
+            }
+            data.update(self.extract_all())
+        finally:
+            self.release()
+
+        data.update({
+            'content_length': self.content_length,
             'pagespeed_insights': self.get_pagespeed_insights(),
-        }
+        })
         
         return data
-
@@ -0,0 +1,176 @@
+"""
+Full-text search over stored audits (staff search, /api/search/).
+
+Every AuditRecord gets a search document when it is stored: the page's
+title, meta description, headings and text. The index lives in the
+database, in an audit_search table created by migration 0010:
+
+- PostgreSQL: the text columns plus a weighted tsvector generated from them
+  (GIN index), queried with websearch_to_tsquery and ranked by ts_rank_cd.
+- SQLite (development): an FTS5 table with porter stemming, ranked by bm25.
+
+Both follow deletes from audit_records (foreign key cascade / trigger) and
+take the same query syntax: every word must appear, "quoted phrases" must
+appear as written and -word excludes pages containing word. Higher scores
+rank first on both backends.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+
+
+POSTGRES_CONFIG = 'english'
+# Title, description, headings, content
+BM25_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+HIGHLIGHT = ('**', '**')
+SNIPPET_WORDS = 24
+
+QUERY_TOKEN = re.compile(r'(-?)"([^"]*)"?|(-?)(\S+)')
+
+
+def search_document(data, page_text=''):
+    """The searchable text of a scrape result; page_text (when known) instead of the content excerpt"""
+    headings = data.get('headings') or {}
+    return {
+        'title': data.get('meta_title') or '',
+        'description': data.get('meta_description') or '',
+        'headings': '\n'.join(text for level in sorted(headings) for text in headings[level]),
+        'content': (page_text or data.get('content') or '')[:settings.SEARCH_CONTENT_MAX_CHARS],
+    }
+
+
+def parse_query(text):
+    """'shoes "free shipping" -boots' -> [('shoes', False), ('free shipping', False), ('boots', True)]"""
+    terms = []
+    for match in QUERY_TOKEN.finditer(text):
+        negated = bool(match.group(1) or match.group(3))
+        raw = match.group(2) if match.group(2) is not None else match.group(4)
+        phrase = ' '.join(raw.replace('"', ' ').split())
+        if phrase:
+            terms.append((phrase, negated))
+    return terms
+
+
+class PostgresSearch:
+    def index_many(self, entries):
+        """entries: [(audit_id, search_document(...))]"""
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO audit_search (audit_id, title, description, headings, content) '
+                'VALUES (%s, %s, %s, %s, %s) ON CONFLICT (audit_id) DO UPDATE SET '
+                'title = EXCLUDED.title, description = EXCLUDED.description, '
+                'headings = EXCLUDED.headings, content = EXCLUDED.content',
+                [(audit_id, doc['title'], doc['description'], doc['headings'], doc['content'])
+                 for audit_id, doc in entries],
+            )
+
+    def indexed(self, audit_ids):
+        """The ones of audit_ids that are in the index"""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT audit_id FROM audit_search WHERE audit_id = ANY(%s)', [list(audit_ids)])
+            return {row[0] for row in cursor.fetchall()}
+
+    def recent_texts(self, limit):
+        """Title, headings and content of the limit most recently stored audits, newest first"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT title || ' ' || headings || ' ' || content FROM audit_search "
+                           "ORDER BY audit_id DESC LIMIT %s", [limit])
+            for (text,) in cursor:
+                yield text
+
+    def search(self, terms, limit, offset):
+        """[(audit_id, score, snippet)] best first; snippets are only built for the returned page"""
+        query = ' '.join(('-' if negated else '') + f'"{phrase}"' for phrase, negated in terms)
+        start, stop = HIGHLIGHT
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT audit_id, score, ts_headline(%s, content, query, %s) FROM ("
+                "  SELECT audit_id, content, query, ts_rank_cd(document, query) AS score"
+                "  FROM audit_search, websearch_to_tsquery(%s, %s) AS query"
+                "  WHERE document @@ query ORDER BY score DESC, audit_id DESC LIMIT %s OFFSET %s"
+                ") page ORDER BY score DESC, audit_id DESC",
+                [POSTGRES_CONFIG, f'StartSel={start}, StopSel={stop}, MaxWords={SNIPPET_WORDS}, MinWords=8',
+                 POSTGRES_CONFIG, query, limit, offset],
+            )
+            return cursor.fetchall()
+
+
+class SQLiteSearch:
+    def index_many(self, entries):
+        with connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM audit_search WHERE rowid = %s', [(audit_id,) for audit_id, _ in entries])
+            cursor.executemany(
+                'INSERT INTO audit_search (rowid, title, description, headings, content) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                [(audit_id, doc['title'], doc['description'], doc['headings'], doc['content'])
+                 for audit_id, doc in entries],
+            )
+
+    def indexed(self, audit_ids):
+        audit_ids = list(audit_ids)
+        if not audit_ids:
+            return set()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid FROM audit_search WHERE rowid IN ({', '.join(['%s'] * len(audit_ids))})",
+                           audit_ids)
+            return {row[0] for row in cursor.fetchall()}
+
+    def recent_texts(self, limit):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT title || ' ' || headings || ' ' || content FROM audit_search "
+                           "ORDER BY rowid DESC LIMIT %s", [limit])
+            for (text,) in cursor:
+                yield text
+
+    @staticmethod
+    def match_expression(terms):
+        """FTS5 query syntax; every term quoted so user input can't inject operators"""
+        def quoted(phrase):
+            return '"' + phrase.replace('"', '""') + '"'
+
+        required = ' '.join(quoted(phrase) for phrase, negated in terms if not negated)
+        excluded = ''.join(f' NOT {quoted(phrase)}' for phrase, negated in terms if negated)
+        return f'({required}){excluded}' if required else ''
+
+    def search(self, terms, limit, offset):
+        expression = self.match_expression(terms)
+        if not expression:
+            return []
+        start, stop = HIGHLIGHT
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        with connection.cursor() as cursor:
+            # bm25() is lower for better matches
+            cursor.execute(
+                f"SELECT rowid, -bm25(audit_search, {weights}) AS score FROM audit_search "
+                "WHERE audit_search MATCH %s ORDER BY score DESC, rowid DESC LIMIT %s OFFSET %s",
+                [expression, limit, offset],
+            )
+            hits = cursor.fetchall()
+            if not hits:
+                return []
+            # A snippet in the ranking query would be built for every match before sorting
+            cursor.execute(
+                f"SELECT rowid, snippet(audit_search, -1, %s, %s, '…', {SNIPPET_WORDS}) FROM audit_search "
+                f"WHERE audit_search MATCH %s AND rowid IN ({', '.join(['%s'] * len(hits))})",
+                [start, stop, expression, *(audit_id for audit_id, _ in hits)],
+            )
+            snippets = dict(cursor.fetchall())
+        return [(audit_id, score, snippets.get(audit_id, '')) for audit_id, score in hits]
+
+
+def get_search_backend():
+    """The backend for the default database, or None where search isn't supported"""
+    if not settings.SEARCH_ENABLED:
+        return None
+    if connection.vendor == 'postgresql':
+        return PostgresSearch()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearch()
+    return None
+
+
+def index_audit(audit_id, data, page_text=''):
+    backend = get_search_backend()
+    if backend is not None:
+        backend.index_many([(audit_id, search_document(data, page_text))])
@@ -0,0 +1,172 @@
+"""
+Deterministic on-page SEO checks over WebScraper.scrape() output.
+
+Pages are turned into NumPy feature columns so every rule is evaluated for
+a whole batch of crawled pages with a single vectorized comparison.
+"""
+import numpy as np
+
+
+MISSING_TITLE = 'No title found'
+MISSING_DESCRIPTION = 'No description found'
+MISSING_LANGUAGE = 'Not specified'
+
+SEVERITY_ORDER = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+# The fields PageFeatures reads, by the type clean_page() accepts
+COUNT_FIELDS = ('word_count', 'images_missing_alt_count', 'internal_links_count', 'status_code')
+TEXT_FIELDS = ('url', 'meta_title', 'meta_description', 'language', 'canonical_url', 'og_image')
+MAX_COUNT = 2 ** 31 - 1
+
+
+def clean_page(page):
+    """
+    Check the fields the rules read in a client-supplied page, coercing
+    numeric strings to ints. Returns the cleaned copy; raises ValueError
+    naming the first bad field.
+    """
+    if not isinstance(page, dict):
+        raise ValueError('each page must be an object')
+    cleaned = dict(page)
+    for field in COUNT_FIELDS:
+        value = cleaned.get(field)
+        if value is None:
+            # Missing and null mean the same thing to the rules
+            cleaned.pop(field, None)
+            continue
+        if isinstance(value, str) and value.strip().isdigit():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= MAX_COUNT:
+            raise ValueError(f'{field} must be a non-negative integer')
+        cleaned[field] = value
+    for field in TEXT_FIELDS:
+        if cleaned.get(field) is not None and not isinstance(cleaned[field], str):
+            raise ValueError(f'{field} must be a string')
+    headings = cleaned.get('headings')
+    if headings is not None:
+        if not isinstance(headings, dict):
+            raise ValueError('headings must be an object of heading lists')
+        if not isinstance(headings.get('h1', []), list):
+            raise ValueError('headings.h1 must be a list')
+    return cleaned
+
+
+class PageFeatures:
+    """Column-oriented numeric features for a batch of scraped pages"""
+
+    def __init__(self, pages):
+        self.size = len(pages)
+
+        def column(func, dtype=np.int64):
+            return np.fromiter((func(page) for page in pages), dtype=dtype, count=self.size)
+
+        def text(page, key, missing):
+            value = page.get(key) or ''
+            return '' if value == missing else value
+
+        self.title_length = column(lambda p: len(text(p, 'meta_title', MISSING_TITLE)))
+        self.description_length = column(lambda p: len(text(p, 'meta_description', MISSING_DESCRIPTION)))
+        self.h1_count = column(lambda p: len((p.get('headings') or {}).get('h1', [])))
+        self.images_missing_alt = column(lambda p: p.get('images_missing_alt_count') or 0)
+        self.has_canonical = column(lambda p: bool(p.get('canonical_url')), dtype=bool)
+        self.has_language = column(lambda p: bool(text(p, 'language', MISSING_LANGUAGE)), dtype=bool)
+        self.has_og_image = column(lambda p: bool(p.get('og_image')), dtype=bool)
+        # -1 marks payloads scraped before word counts were recorded
+        self.word_count = column(lambda p: p.get('word_count', -1))
+        self.internal_links = column(lambda p: p.get('internal_links_count') or 0)
+        self.is_https = column(lambda p: (p.get('url') or '').startswith('https://'), dtype=bool)
+        self.status_code = column(lambda p: p.get('status_code') or 200)
+
+
+class Rule:
+    def __init__(self, rule_id, severity, weight, check, message):
+        self.id = rule_id
+        self.severity = severity
+        self.weight = weight
+        self.check = check          # PageFeatures -> bool array, True where the rule fails
+        self.message = message      # (PageFeatures, index) -> str
+
+
+RULES = [
+    Rule('status_not_ok', 'critical', 30,
+         lambda f: (f.status_code < 200) | (f.status_code >= 300),
+         lambda f, i: f'Page returned HTTP {f.status_code[i]}'),
+    Rule('title_missing', 'critical', 15,
+         lambda f: f.title_length == 0,
+         lambda f, i: 'Page has no <title>'),
+    Rule('title_too_short', 'medium', 5,
+         lambda f: (f.title_length > 0) & (f.title_length < 30),
+         lambda f, i: f'Title is {f.title_length[i]} characters (recommended 30-60)'),
+    Rule('title_too_long', 'medium', 5,
+         lambda f: f.title_length > 60,
+         lambda f, i: f'Title is {f.title_length[i]} characters and will be truncated (recommended 30-60)'),
+    Rule('description_missing', 'high', 10,
+         lambda f: f.description_length == 0,
+         lambda f, i: 'Page has no meta description'),
+    Rule('description_too_short', 'medium', 4,
+         lambda f: (f.description_length > 0) & (f.description_length < 70),
+         lambda f, i: f'Meta description is {f.description_length[i]} characters (recommended 70-160)'),
+    Rule('description_too_long', 'low', 3,
+         lambda f: f.description_length > 160,
+         lambda f, i: f'Meta description is {f.description_length[i]} characters and will be truncated (recommended 70-160)'),
+    Rule('h1_missing', 'high', 10,
+         lambda f: f.h1_count == 0,
+         lambda f, i: 'Page has no H1 heading'),
+    Rule('h1_multiple', 'medium', 5,
+         lambda f: f.h1_count > 1,
+         lambda f, i: f'Page has {f.h1_count[i]} H1 headings (use exactly one)'),
+    Rule('images_missing_alt', 'medium', 6,
+         lambda f: f.images_missing_alt > 0,
+         lambda f, i: f'{f.images_missing_alt[i]} image(s) have no alt text'),
+    Rule('canonical_missing', 'medium', 5,
+         lambda f: ~f.has_canonical,
+         lambda f, i: 'No canonical URL is declared'),
+    Rule('language_missing', 'low', 3,
+         lambda f: ~f.has_language,
+         lambda f, i: 'The <html> element has no lang attribute'),
+    Rule('thin_content', 'high', 10,
+         lambda f: (f.word_count >= 0) & (f.word_count < 300),
+         lambda f, i: f'Only {f.word_count[i]} words of content (aim for at least 300)'),
+    Rule('no_internal_links', 'medium', 5,
+         lambda f: f.internal_links == 0,
+         lambda f, i: 'Page has no internal links'),
+    Rule('not_https', 'high', 8,
+         lambda f: ~f.is_https,
+         lambda f, i: 'Page is not served over HTTPS'),
+    Rule('og_image_missing', 'low', 2,
+         lambda f: ~f.has_og_image,
+         lambda f, i: 'No Open Graph image for social sharing'),
+]
+
+
+def evaluate_pages(pages, rules=RULES):
+    """
+    Score a batch of scraped pages.
+
+    Returns one report per page:
+    {'score': 0-100, 'issues': [{'id', 'severity', 'message'}, ...]}
+    """
+    features = PageFeatures(pages)
+    failures = np.vstack([rule.check(features) for rule in rules]) if pages else np.zeros((len(rules), 0), bool)
+    weights = np.array([rule.weight for rule in rules], dtype=np.int64)
+    scores = np.clip(100 - weights @ failures, 0, 100)
+
+    reports = []
+    for page_index in range(features.size):
+        failed = np.flatnonzero(failures[:, page_index])
+        issues = [
+            {
+                'id': rules[r].id,
+                'severity': rules[r].severity,
+                'message': rules[r].message(features, page_index),
+            }
+            for r in failed
+        ]
+        issues.sort(key=lambda issue: SEVERITY_ORDER[issue['severity']])
+        reports.append({'score': int(scores[page_index]), 'issues': issues})
+    return reports
+
+
+def evaluate_page(page):
+    """Score a single scraped page"""
+    return evaluate_pages([page])[0]
@@ -0,0 +1,200 @@
+"""
+Structured data in a parsed page: JSON-LD blocks, microdata items and Open
+Graph / Twitter card properties. PageScan collects the tags involved in one
+walk over the tree; WebScraper's meta tag lookups use the same scan.
+
+    extract_structured_data(PageScan(soup)) -> {
+        'json_ld': [decoded blocks],
+        'microdata': [{'type': [...], 'id': ..., 'properties': {...}}],
+        'open_graph': {'og:title': ..., 'og:image': [..., ...]},
+        'twitter': {'twitter:card': ...},
+        'types': ['Article', 'BreadcrumbList'],   # schema types found anywhere
+        'errors': ['JSON-LD block 2: invalid JSON (...)'],
+    }
+
+Properties that occur more than once become lists; microdata URLs are
+resolved against base_url. Pages can embed huge
+blobs (whole product catalogues as JSON-LD), so blocks over max_json_chars
+are skipped, at most max_items blocks / items are kept and text values are
+cut to MAX_VALUE_CHARS.
+"""
+from urllib.parse import urljoin
+
+import orjson
+from bs4 import Tag
+
+
+MAX_VALUE_CHARS = 500
+MAX_TYPE_DEPTH = 8
+
+OPEN_GRAPH_PREFIXES = ('og:', 'article:', 'product:', 'profile:', 'book:', 'music:', 'video:', 'fb:')
+
+# Microdata: which attribute holds an itemprop's value, by element
+URL_VALUE_ATTRIBUTES = {
+    'a': 'href', 'area': 'href', 'link': 'href',
+    'img': 'src', 'audio': 'src', 'video': 'src', 'source': 'src', 'iframe': 'src', 'embed': 'src',
+    'track': 'src', 'object': 'data',
+}
+VALUE_ATTRIBUTES = {'time': 'datetime', 'data': 'value', 'meter': 'value'}
+
+
+def _add(properties, name, value):
+    """Store value under name; a repeated name collects its values in a list"""
+    if name not in properties:
+        properties[name] = value
+    elif isinstance(properties[name], list):
+        properties[name].append(value)
+    else:
+        properties[name] = [properties[name], value]
+
+
+def _short_type(value):
+    """'https://schema.org/Article' -> 'Article'"""
+    return value.rstrip('/').rsplit('/', 1)[-1].rsplit('#', 1)[-1]
+
+
+def _collect_types(node, types, depth=0):
+    if depth > MAX_TYPE_DEPTH:
+        return
+    if isinstance(node, dict):
+        found = node.get('@type')
+        for value in found if isinstance(found, list) else [found]:
+            if isinstance(value, str) and value:
+                types.add(_short_type(value))
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                _collect_types(value, types, depth + 1)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_types(value, types, depth + 1)
+
+
+def _decode_json_ld(raw):
+    text = raw.strip()
+    # CMSs still wrap scripts in HTML comments or CDATA sections
+    for start, end in (('<!--', '-->'), ('<![CDATA[', ']]>')):
+        if text.startswith(start) and text.endswith(end):
+            text = text[len(start):-len(end)].strip()
+    return orjson.loads(text)
+
+
+def _text_value(tag):
+    return ' '.join(tag.get_text(' ', strip=True).split())[:MAX_VALUE_CHARS]
+
+
+def _microdata_value(tag, items, base_url):
+    if 'itemscope' in tag.attrs:
+        return items[id(tag)]
+    attribute = URL_VALUE_ATTRIBUTES.get(tag.name)
+    if attribute and tag.get(attribute) is not None:
+        return urljoin(base_url, tag[attribute].strip())[:MAX_VALUE_CHARS]
+    # content="" on other elements isn't in the spec, but is widely used (and honoured by search engines)
+    attribute = VALUE_ATTRIBUTES.get(tag.name, 'content')
+    if tag.get(attribute) is not None:
+        return tag[attribute].strip()[:MAX_VALUE_CHARS]
+    return _text_value(tag)
+
+
+def _owner(tag):
+    """The nearest enclosing itemscope element of an itemprop element"""
+    parent = tag.parent
+    while parent is not None and 'itemscope' not in parent.attrs:
+        parent = parent.parent
+    return parent
+
+
+class PageScan:
+    """The tags that meta lookups and structured data need, collected in one walk over the tree"""
+
+    def __init__(self, soup):
+        self.meta = []
+        self.json_ld = []
+        self.scopes = []
+        self.props = []
+        self._first_meta = None
+        for tag in soup.descendants:
+            if not isinstance(tag, Tag):
+                continue
+            if tag.name == 'meta':
+                self.meta.append(tag)
+            elif tag.name == 'script':
+                if tag.attrs.get('type', '').split(';')[0].strip().lower() == 'application/ld+json':
+                    self.json_ld.append(tag)
+                continue
+            if 'itemscope' in tag.attrs:
+                self.scopes.append(tag)
+            if 'itemprop' in tag.attrs:
+                self.props.append(tag)
+
+    def find_meta(self, attribute, value):
+        """The first <meta> whose attribute equals value, like soup.find('meta', attrs={attribute: value})"""
+        if self._first_meta is None:
+            self._first_meta = {}
+            for tag in reversed(self.meta):
+                for name in ('name', 'property'):
+                    if isinstance(tag.attrs.get(name), str):
+                        self._first_meta[name, tag[name]] = tag
+        return self._first_meta.get((attribute, value))
+
+
+def extract_structured_data(scan, base_url='', max_json_chars=100000, max_items=50):
+    json_ld, open_graph, twitter, errors = [], {}, {}, []
+
+    for number, tag in enumerate(scan.json_ld, 1):
+        raw = tag.string or ''
+        if len(json_ld) >= max_items:
+            errors.append(f'JSON-LD block {number}: skipped, more than {max_items} blocks')
+        elif len(raw) > max_json_chars:
+            errors.append(f'JSON-LD block {number}: skipped, {len(raw)} characters (limit {max_json_chars})')
+        else:
+            try:
+                json_ld.append(_decode_json_ld(raw))
+            except orjson.JSONDecodeError as e:
+                errors.append(f'JSON-LD block {number}: invalid JSON ({e})')
+
+    for tag in scan.meta:
+        key = (tag.get('property') or tag.get('name') or '').strip().lower()
+        content = tag.get('content')
+        if content is not None and key:
+            if key.startswith('twitter:'):
+                _add(twitter, key, content.strip()[:MAX_VALUE_CHARS])
+            elif key.startswith(OPEN_GRAPH_PREFIXES):
+                _add(open_graph, key, content.strip()[:MAX_VALUE_CHARS])
+
+    # Microdata items, then their properties (an item's value may be a nested item)
+    items = {}
+    for tag in scan.scopes:
+        item_type = tag.get('itemtype', '')
+        item = {'type': item_type.split() if item_type else []}
+        if tag.get('itemid'):
+            item['id'] = tag['itemid']
+        item['properties'] = {}
+        items[id(tag)] = item
+    for tag in scan.props:
+        owner = _owner(tag)
+        if owner is None:
+            continue
+        value = _microdata_value(tag, items, base_url)
+        names = tag['itemprop'] if isinstance(tag['itemprop'], list) else tag['itemprop'].split()
+        for name in names:
+            _add(items[id(owner)]['properties'], name, value)
+
+    # Top-level items are the ones that aren't another item's property
+    microdata = [items[id(tag)] for tag in scan.scopes if 'itemprop' not in tag.attrs or _owner(tag) is None]
+    if len(microdata) > max_items:
+        errors.append(f'Microdata: kept {max_items} of {len(microdata)} items')
+        microdata = microdata[:max_items]
+
+    types = set()
+    _collect_types(json_ld, types)
+    for item in items.values():
+        types.update(_short_type(value) for value in item['type'])
+
+    return {
+        'json_ld': json_ld,
+        'microdata': microdata,
+        'open_graph': open_graph,
+        'twitter': twitter,
+        'types': sorted(types),
+        'errors': errors,
+    }
@@ -0,0 +1,296 @@
+"""
+Local stand-ins for external services, for load tests and benchmarks.
+
+Each server runs in a daemon thread on 127.0.0.1 (port 0 picks a free
+port) and can be used as a context manager:
+
+    with FakeLLMServer(latency=0.2) as server:
+        provider = HttpProvider(server.url)
+
+StaticSiteServer plays the sites being audited, FakePageSpeedServer the
+PageSpeed Insights API (PAGESPEED_API_URL) and FakeLLMServer the model.
+"""
+import json
+import random
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from .llm_providers import FakeLLM
+
+
+class StubServer:
+    """Base class: serve handler_class on a background thread"""
+    server_class = ThreadingHTTPServer
+    handler_class = None
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.httpd = self.server_class((host, port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self._thread = None
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def record(self):
+        with self._lock:
+            self.requests += 1
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; don't let Nagle delay the body
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Delays:
+    """latency (+ up to jitter) seconds per request; error_rate of requests fail"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def should_fail(self):
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+
+class StaticSiteHandler(QuietHandler):
+    def do_GET(self):
+        stub = self.server.stub
+        stub.record()
+        time.sleep(stub.delays.delay())
+        if stub.delays.should_fail():
+            self.send_body(503, b'<h1>Service Unavailable</h1>', 'text/html')
+            return
+        page = stub.pages.get(urlsplit(self.path).path)
+        if page is None:
+            self.send_body(404, b'<h1>Not Found</h1>', 'text/html')
+            return
+        self.send_body(200, page, 'text/html; charset=utf-8')
+
+
+class StaticSiteServer(StubServer):
+    """
+    A site to audit: serves pages ({path: HTML bytes}) after a configurable
+    latency; the query string is ignored, so /page?n=1 and /page?n=2 are
+    distinct URLs for the scraper with the same content.
+    """
+    handler_class = StaticSiteHandler
+
+    def __init__(self, pages, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+        super().__init__(host, port)
+        self.pages = pages
+        self.delays = Delays(latency, jitter, error_rate)
+
+
+PAGESPEED_REPORT = Path(__file__).resolve().parent / 'bench_pages' / 'pagespeed.json'
+
+
+class FakePageSpeedHandler(QuietHandler):
+    def do_GET(self):
+        stub = self.server.stub
+        stub.record()
+        query = parse_qs(urlsplit(self.path).query)
+        if not query.get('url') or not query.get('key'):
+            self.send_json(400, {'error': {'code': 400, 'message': 'url and key are required'}})
+            return
+        time.sleep(stub.delays.delay())
+        if stub.delays.should_fail():
+            self.send_json(500, {'error': {'code': 500, 'message': 'Lighthouse returned error: injected'}})
+            return
+        self.send_body(200, stub.report, 'application/json; charset=UTF-8')
+
+
+class FakePageSpeedServer(StubServer):
+    """
+    PageSpeed Insights stand-in: answers every runPagespeed request with a
+    recorded Lighthouse result (bench_pages/pagespeed.json) after latency
+    seconds (real runs take several seconds).
+    """
+    handler_class = FakePageSpeedHandler
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, report_path=PAGESPEED_REPORT):
+        super().__init__(host, port)
+        self.report = Path(report_path).read_bytes()
+        self.delays = Delays(latency, jitter, error_rate)
+
+    @property
+    def api_url(self):
+        return f'{self.url}/pagespeedonline/v5/runPagespeed'
+
+
+class FakeLLMHandler(QuietHandler):
+    def do_POST(self):
+        if self.path.rstrip('/') != '/generate':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        fake = self.server.stub.fake
+        request = self.read_json()
+        self.server.stub.record()
+        time.sleep(fake.delay())
+        if fake.should_fail():
+            self.send_json(503, {'error': 'injected failure'})
+            return
+
+        text = fake.reply(request.get('prompt', ''), request.get('response_schema'))
+        if not request.get('stream'):
+            self.send_json(200, {'text': text})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in fake.chunks(text):
+            if fake.chunk_delay:
+                time.sleep(fake.chunk_delay)
+            line = (json.dumps({'text': chunk}) + '\n').encode('utf-8')
+            self.wfile.write(f'{len(line):X}\r\n'.encode() + line + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class FakeLLMServer(StubServer):
+    """
+    HTTP fake LLM for HttpProvider: deterministic replies (valid JSON for the
+    requested response schema), with FakeLLM latency, streaming and error
+    injection options.
+    """
+    handler_class = FakeLLMHandler
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        super().__init__(host, port)
+        self.fake = FakeLLM(**options)
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib / Django's SMTP backend (no TLS, no AUTH)"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        stub = self.server.stub
+        stub.record_connection()
+        time.sleep(stub.connect_delay)
+        self.reply('220 fake-smtp ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode('ascii', 'replace').strip().split(' ')[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250-fake-smtp')
+                self.reply('250 8BITMIME')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(line.decode('ascii', 'replace').split(':', 1)[-1].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line)
+                time.sleep(stub.message_delay)
+                stub.record_message(recipients, b''.join(data))
+                self.reply('250 OK queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class FakeSMTPServer(StubServer):
+    """
+    SMTP stand-in that records messages. connect_delay simulates connection
+    setup (TCP + TLS handshake and greeting on a real relay), message_delay
+    the time a relay takes to accept each message.
+    """
+    server_class = socketserver.ThreadingTCPServer
+    handler_class = FakeSMTPHandler
+
+    def __init__(self, host='127.0.0.1', port=0, connect_delay=0.0, message_delay=0.0):
+        super().__init__(host, port)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.connections = 0
+        self.messages = []
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_message(self, recipients, data):
+        with self._lock:
+            self.messages.append({'recipients': recipients, 'data': data})
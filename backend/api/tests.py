@@ -1,8 +1,68 @@
+import io
+import json
 import logging
-from django.test import TestCase
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from google.api_core import exceptions as google_exceptions
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .ai_service import GeminiAIService
+from .audit_changes import diff_sections, section_hashes
+from .caching import TwoLevelCache, cache_summary
+from .keywords import BackgroundCorpus, CorpusProvider, corpus_provider, extract_keywords
+from .coalescing import CacheSingleFlight, SingleFlight, coalescing_summary, normalize_url
+from .llm_providers import FakeProvider, GeminiProvider, HttpProvider, LLMProvider, reset_llm_provider
+from .llm_json import RESPONSE_SCHEMAS, LLMResponseError, parse_llm_json
+from .metrics import MetricsExporter, MetricsRegistry, merge_snapshots, registry, render_prometheus
+from .email_service import EmailService, deliver_outbox, purge_outbox
+from .models import User, OTP, AuditSnapshot, AuditRecord, AuditSchedule, AuditJob, EmailOutbox, RequestProfile
+from .prompt_budget import PromptBudget, estimate_tokens, llm_usage_summary
+from .resilience import (
+    CircuitBreaker, ConcurrencyLimitError, ResilientCaller, reset_llm_callers
+)
+from .seo_rules import evaluate_page, evaluate_pages
+from .stub_servers import FakeLLMServer, FakePageSpeedServer, FakeSMTPServer, StaticSiteServer
+from .throttling import TokenBucket
+from .retrieval import BM25Index, chunk_text, get_snapshot_index, index_cache, tokenize
+from .scheduler import create_schedule, run_audit_jobs, tick
+from .scraper import WebScraper
+from .search import get_search_backend, parse_query
+from .management.commands._bench import BENCH_PAGE_URL, html_corpus
+from .management.commands.bench_extraction import find_regressions
 
 logger = logging.getLogger(__name__)
 
+SAMPLE_SCRAPE = {
+    'url': 'https://example.com',
+    'status_code': 200,
+    'meta_title': 'Example Domain',
+    'meta_description': 'An example page',
+    'meta_keywords': 'example, domain',
+    'content': 'Example content for testing.',
+    'headings': {'h1': ['Example Domain'], 'h2': ['About']},
+    'internal_links_count': 1,
+    'external_links_count': 1,
+    'images_count': 0,
+    'language': 'en',
+}
+
+
 class SimpleTest(TestCase):
     def test_example(self):
         """
@@ -11,3 +71,1658 @@ class SimpleTest(TestCase):
         logger.info("Running a simple test.")
         self.assertEqual(1 + 1, 2)
         logger.info("Simple test completed successfully.")
+
+
+class AuditSnapshotTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass12345', is_verified=True)
+
+    @mock.patch('api.views.WebScraper')
+    def test_scrape_returns_snapshot_id(self, scraper_cls):
+        scraper_cls.return_value.scrape.return_value = dict(SAMPLE_SCRAPE)
+        scraper_cls.return_value.get_page_text.return_value = 'Example content for testing.'
+        self.client.force_authenticate(self.user)
+
+        response = self.client.post('/api/scrape/', {'url': 'https://example.com'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        snapshot = AuditSnapshot.objects.get(id=response.data['snapshot_id'])
+        self.assertEqual(snapshot.user, self.user)
+        self.assertEqual(snapshot.data['meta_title'], 'Example Domain')
+        self.assertEqual(snapshot.page_text, 'Example content for testing.')
+
+    @mock.patch('api.views.GeminiAIService')
+    def test_chat_uses_snapshot_and_stores_history(self, service_cls):
+        service = service_cls.return_value
+        service.is_configured.return_value = True
+        service.chat_about_website.return_value = {'answer': 'Looks fine.'}
+        snapshot = AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=self.user)
+        self.client.force_authenticate(self.user)
+
+        response = self.client.post('/api/ai/chat/', {
+            'question': 'Any issues?',
+            'snapshot_id': str(snapshot.id),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        _, scraped_data, history, page_index = service.chat_about_website.call_args[0]
+        self.assertEqual(scraped_data['url'], 'https://example.com')
+        self.assertEqual(history, [])
+        self.assertIsNone(page_index)
+        snapshot.refresh_from_db()
+        self.assertEqual([m['role'] for m in snapshot.chat_history], ['user', 'assistant'])
+
+    @mock.patch('api.views.GeminiAIService')
+    def test_snapshot_of_other_user_is_forbidden(self, service_cls):
+        service_cls.return_value.is_configured.return_value = True
+        snapshot = AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=self.user)
+        other = User.objects.create_user(email='other@example.com', password='pass12345')
+        self.client.force_authenticate(other)
+
+        response = self.client.post('/api/ai/comprehensive-analysis/', {
+            'snapshot_id': str(snapshot.id),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 403)
+        service_cls.return_value.generate_comprehensive_analysis.assert_not_called()
+
+    @override_settings(AUDIT_SNAPSHOT_MAX_PER_OWNER=2)
+    def test_eviction_of_expired_and_surplus_snapshots(self):
+        expired = AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), session_key='anon')
+        AuditSnapshot.objects.filter(id=expired.id).update(expires_at=timezone.now())
+        first = AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=self.user)
+        AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=self.user)
+        AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=self.user)
+
+        self.assertFalse(AuditSnapshot.objects.filter(id=expired.id).exists())
+        self.assertFalse(AuditSnapshot.objects.filter(id=first.id).exists())
+        self.assertEqual(AuditSnapshot.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(AUDIT_SNAPSHOT_MAX_PER_OWNER=0)
+    def test_zero_limit_keeps_only_the_new_snapshot(self):
+        AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=self.user)
+        latest = AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=self.user)
+
+        self.assertEqual(list(AuditSnapshot.objects.filter(user=self.user)), [latest])
+
+
+class RetrievalTest(TestCase):
+    def test_bm25_ranks_relevant_chunk_first(self):
+        chunks = [
+            'Our bakery sells fresh bread and pastries every morning.',
+            'Shipping is free for orders over fifty dollars, returns within thirty days.',
+            'Contact the support team by email or phone.',
+        ]
+        index = BM25Index(chunks)
+
+        results = index.search('what is the returns and shipping policy', k=1)
+
+        self.assertEqual(results[0][0], chunks[1])
+        self.assertEqual(index.search('zebra', k=3), [])
+
+    def test_non_ascii_words_are_tokens(self):
+        self.assertEqual(tokenize('Café über naïve snake_case'), ['café', 'über', 'naïve', 'snake', 'case'])
+
+        chunks = ['Notre café ouvre à huit heures.', 'Die Straße ist über die Brücke.']
+        results = BM25Index(chunks).search('CAFÉ', k=1)
+        self.assertEqual(results[0][0], chunks[0])
+
+    def test_chunks_overlap_and_cover_text(self):
+        text = ' '.join(f'w{i}' for i in range(250))
+        chunks = chunk_text(text, chunk_words=100, overlap=20)
+
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[1].startswith('w80 '))
+        self.assertTrue(chunks[-1].endswith('w249'))
+
+    def test_snapshot_index_is_cached(self):
+        index_cache.clear()
+        snapshot = AuditSnapshot.create_snapshot(
+            dict(SAMPLE_SCRAPE), session_key='anon', page_text='Deep in the page we talk about canonical tags.'
+        )
+
+        index = get_snapshot_index(snapshot)
+
+        self.assertIs(get_snapshot_index(snapshot), index)
+        self.assertEqual(len(index.search('canonical')), 1)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModel:
+    """
+    Stand-in for a Gemini GenerativeModel that returns canned text, with
+    optional injected latency (honouring the request timeout) and errors.
+    """
+
+    def __init__(self, text='[]', delay=0.0, errors=()):
+        self.text = text
+        self.delay = delay
+        self.errors = list(errors)
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        self.kwargs = kwargs
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.delay:
+            timeout = kwargs.get('request_options', {}).get('timeout')
+            if timeout is not None and self.delay > timeout:
+                time.sleep(timeout)
+                raise google_exceptions.DeadlineExceeded('fake model timed out')
+            time.sleep(self.delay)
+        return FakeResponse(self.text)
+
+
+def make_ai_service(model):
+    return GeminiAIService(provider=GeminiProvider(model=model))
+
+
+class PromptBudgetTest(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_low_priority_sections_are_trimmed_first(self):
+        budget = PromptBudget('chat', max_tokens=60)
+        budget.add('history', items=[f'user: message {i} ' + 'x' * 40 for i in range(10)],
+                   priority=1, keep='last')
+        budget.add('question', 'What is the title?', priority=5)
+
+        prompt = budget.render(lambda s: f"History:\n{s['history']}\nQ: {s['question']}")
+
+        self.assertIn('Q: What is the title?', prompt)
+        self.assertIn('message 9', prompt)
+        self.assertNotIn('message 0 ', prompt)
+        self.assertIn('more omitted]', prompt)
+        self.assertLessEqual(estimate_tokens(prompt), 70)
+        self.assertEqual(registry.counter_value(
+            'llm_prompt_sections_trimmed_total', endpoint='chat', section='history'), 1)
+
+    @override_settings(AI_PROMPT_TOKEN_BUDGET=400)
+    def test_calls_record_tokens_and_latency(self):
+        model = FakeModel('[{"title": "Example", "length": 7, "reason": "short"}]')
+        service = make_ai_service(model)
+
+        service.generate_meta_title('Title', 'Description', 'word ' * 2000, 'kw')
+
+        self.assertLessEqual(estimate_tokens(model.prompts[0]), 400)
+        usage = llm_usage_summary()['meta_title']
+        self.assertEqual(usage['calls'], 1)
+        self.assertEqual(usage['input_tokens'], estimate_tokens(model.prompts[0]))
+        self.assertGreater(usage['output_tokens'], 0)
+        self.assertEqual(model.kwargs['generation_config']['response_mime_type'], 'application/json')
+
+    @override_settings(AI_PROMPT_TOKEN_BUDGET=600, AI_QUESTION_MAX_TOKENS=100)
+    def test_question_and_analysis_prompts_are_budgeted(self):
+        model = FakeModel('Which pages need a meta description?')
+        service = make_ai_service(model)
+        page = {**SAMPLE_SCRAPE, 'meta_description': 'description ' * 2000, 'meta_keywords': 'keyword ' * 2000}
+
+        service.chat_about_website('why ' * 5000, page)
+
+        optimize_prompt, chat_prompt = model.prompts
+        self.assertLessEqual(estimate_tokens(optimize_prompt), 600)
+        self.assertLessEqual(estimate_tokens(chat_prompt), 600)
+        self.assertLess(optimize_prompt.count('why'), 120)
+
+        model.text = '{"quick_wins": [], "strategy": [], "technical": [], "content_quality": "ok"}'
+        service.generate_comprehensive_analysis(page)
+
+        self.assertLessEqual(estimate_tokens(model.prompts[-1]), 600)
+        usage = llm_usage_summary()
+        for endpoint in ('optimize_question', 'chat', 'comprehensive_analysis'):
+            self.assertEqual(usage[endpoint]['calls'], 1)
+            self.assertGreater(usage[endpoint]['input_tokens'], 0)
+        self.assertGreater(usage['comprehensive_analysis']['trimmed_sections'], 0)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/ai/metrics/').status_code, 403)
+
+        staff = User.objects.create_superuser(email='admin@example.com', password='pass12345')
+        client.force_authenticate(staff)
+        response = client.get('/api/ai/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('endpoints', response.data)
+
+
+class LLMJsonTest(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_repairs_common_malformations(self):
+        cases = [
+            '```json\n{"h1": ["A"], "h2": [], "h3": [], "recommendations": []}\n```',
+            'Here you go: {"h1": ["A",], "h2": [], "h3": [], "recommendations": [],} Hope it helps',
+            '{"h1": [“A”], "h2": [], "h3": [], "recommendations": ["cut off',
+        ]
+        for text in cases:
+            value = parse_llm_json(text, 'heading_suggestions')
+            self.assertEqual(value['h1'], ['A'])
+        self.assertEqual(registry.counter_value(
+            'llm_json_parse_total', endpoint='heading_suggestions', result='repaired'), 3)
+
+    def test_validation_coerces_scalars_and_rejects_missing_fields(self):
+        value = parse_llm_json('[{"title": "T", "length": "55", "reason": "r"}]', 'meta_title')
+        self.assertEqual(value[0]['length'], 55)
+
+        with self.assertRaises(LLMResponseError):
+            parse_llm_json('{"score": 80}', 'comprehensive_analysis')
+
+        # Infinite and NaN numbers are invalid answers, not a crash
+        for length in ('Infinity', '1e999', '"-inf"', 'NaN'):
+            with self.assertRaises(LLMResponseError):
+                parse_llm_json(f'[{{"title": "T", "length": {length}, "reason": "r"}}]', 'meta_title')
+
+    def test_json_mode_and_user_retry_tracking(self):
+        model = FakeModel('not json at all')
+        service = make_ai_service(model)
+
+        first = service.generate_keywords('Title', 'Description', 'content', ['Heading'])
+        second = service.generate_keywords('Title', 'Description', 'content', ['Heading'])
+
+        self.assertIn('error', first)
+        self.assertIn('error', second)
+        self.assertEqual(registry.counter_value('llm_json_retries_total', endpoint='keywords'), 1)
+        self.assertEqual(registry.counter_value('llm_json_parse_total', endpoint='keywords', result='failed'), 2)
+
+
+class ResilienceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        reset_llm_callers()
+
+    def tearDown(self):
+        reset_llm_callers()
+
+    def test_transient_errors_are_retried(self):
+        model = FakeModel('ok', errors=[google_exceptions.ServiceUnavailable('busy')] * 2)
+        caller = ResilientCaller('fake', max_retries=2, sleep=lambda delay: None)
+
+        response = caller.call(lambda timeout: model.generate_content('p', request_options={'timeout': timeout}))
+
+        self.assertEqual(response.text, 'ok')
+        self.assertEqual(registry.counter_value('llm_retries_total', dependency='fake'), 2)
+
+    def test_slow_model_is_bounded_by_deadline(self):
+        model = FakeModel('ok', delay=5.0)
+        caller = ResilientCaller('fake', attempt_timeout=0.05, deadline=0.2, max_retries=10,
+                                 backoff_base=0.01, backoff_max=0.02)
+
+        start = time.monotonic()
+        with self.assertRaises(google_exceptions.DeadlineExceeded):
+            caller.call(lambda timeout: model.generate_content('p', request_options={'timeout': timeout}))
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_breaker_opens_and_half_open_probe_closes_it(self):
+        now = [0.0]
+        breaker = CircuitBreaker('fake', failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        now[0] = 11
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_non_transient_errors_leave_breaker_state_alone(self):
+        now = [0.0]
+        breaker = CircuitBreaker('fake', failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        caller = ResilientCaller('fake', breaker=breaker, clock=lambda: now[0])
+
+        def bad_request(timeout):
+            raise google_exceptions.InvalidArgument('bad prompt')
+
+        breaker.record_failure()
+        with self.assertRaises(google_exceptions.InvalidArgument):
+            caller.call(bad_request)
+        self.assertEqual((breaker.state, breaker.failures), (CircuitBreaker.CLOSED, 1))
+
+        breaker.record_failure()
+        now[0] = 11
+        # The half-open probe fails with a bad request: still half-open, and the next call may probe
+        with self.assertRaises(google_exceptions.InvalidArgument):
+            caller.call(bad_request)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(caller.call(lambda timeout: 'ok'), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_concurrency_cap_sheds_excess_calls(self):
+        caller = ResilientCaller('fake', max_concurrent=1, concurrency_wait=0.01)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_call(timeout):
+            started.set()
+            release.wait(2)
+
+        worker = threading.Thread(target=caller.call, args=(slow_call,))
+        worker.start()
+        started.wait(2)
+        try:
+            with self.assertRaises(ConcurrencyLimitError):
+                caller.call(lambda timeout: None)
+        finally:
+            release.set()
+            worker.join()
+
+    @override_settings(AI_CIRCUIT_FAILURE_THRESHOLD=2, AI_RETRY_ATTEMPTS=0)
+    @mock.patch('api.views.GeminiAIService')
+    def test_open_circuit_returns_503_with_retry_after(self, service_cls):
+        model = FakeModel(errors=[google_exceptions.ServiceUnavailable('down')] * 5)
+        service_cls.return_value = make_ai_service(model)
+        client = APIClient()
+        body = {'meta_title': 'T', 'meta_description': 'D', 'content_preview': 'C', 'headings': []}
+
+        statuses = [client.post('/api/ai/generate-keywords/', body, format='json').status_code for _ in range(2)]
+        response = client.post('/api/ai/generate-keywords/', body, format='json')
+
+        self.assertEqual(statuses, [500, 500])
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(len(model.prompts), 2)
+
+
+class CoalescingTest(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_concurrent_duplicates_share_one_execution(self):
+        flight = SingleFlight('test')
+        calls = []
+        gate = threading.Event()
+        results = []
+
+        def work():
+            calls.append(1)
+            gate.wait(2)
+            return {'value': 42}
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', work))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        gate.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], [{'value': 42}] * 5)
+        self.assertEqual(sum(shared for _, shared in results), 4)
+        self.assertEqual(coalescing_summary()['test'], {'executions': 1, 'duplicates_avoided': 4})
+
+    def test_errors_are_shared_and_not_cached(self):
+        flight = SingleFlight('test')
+
+        with self.assertRaises(ValueError):
+            flight.do('k', lambda: (_ for _ in ()).throw(ValueError('boom')))
+        self.assertEqual(flight.do('k', lambda: 'fresh'), ('fresh', False))
+
+    def test_cache_variant_followers_read_leader_result(self):
+        flight = CacheSingleFlight('test', poll_interval=0.01)
+        gate = threading.Event()
+        results = []
+
+        def leader_work():
+            gate.wait(2)
+            return 'leader result'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', leader_work)))
+        leader.start()
+        time.sleep(0.05)
+        follower = threading.Thread(target=lambda: results.append(flight.do('k', lambda: 'follower ran')))
+        follower.start()
+        time.sleep(0.05)
+        gate.set()
+        leader.join()
+        follower.join()
+
+        self.assertIn(('leader result', True), results)
+        self.assertIn(('leader result', False), results)
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_scrape_callers_get_their_own_copy_of_shared_data(self):
+        shared = (dict(SAMPLE_SCRAPE, headings={'h1': ['Example']}), 'Page text')
+        create_snapshot = AuditSnapshot.create_snapshot
+
+        def mutating_create_snapshot(data, **kwargs):
+            data['headings']['h1'].append('Changed by a caller')
+            return create_snapshot(data, **kwargs)
+
+        with mock.patch('api.views.coalesce', return_value=(shared, True)), \
+                mock.patch.object(AuditSnapshot, 'create_snapshot', side_effect=mutating_create_snapshot):
+            for _ in range(2):
+                response = APIClient().post('/api/scrape/', {'url': 'https://example.com'}, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['data']['headings']['h1'], ['Example', 'Changed by a caller'])
+
+        self.assertEqual(shared[0]['headings'], {'h1': ['Example']})
+
+    def test_normalize_url(self):
+        self.assertEqual(normalize_url('HTTPS://Example.COM:443#top'), 'https://example.com/')
+        self.assertEqual(normalize_url('http://example.com:8080/a?b=1'), 'http://example.com:8080/a?b=1')
+
+
+class SeoRulesTest(TestCase):
+    def good_page(self, **overrides):
+        page = dict(
+            SAMPLE_SCRAPE,
+            meta_title='Example Domain - Illustrative Examples for Documents',
+            meta_description='This domain is for use in illustrative examples in documents. '
+                             'You may use it in literature without prior coordination.',
+            canonical_url='https://example.com/',
+            og_image='https://example.com/og.png',
+            images_missing_alt_count=0,
+            word_count=850,
+        )
+        page.update(overrides)
+        return page
+
+    def test_clean_page_scores_100(self):
+        self.assertEqual(evaluate_page(self.good_page()), {'score': 100, 'issues': []})
+
+    def test_mechanical_checks(self):
+        report = evaluate_page(self.good_page(
+            meta_title='No title found',
+            headings={'h1': ['One', 'Two']},
+            images_missing_alt_count=3,
+            canonical_url=None,
+            language='Not specified',
+            word_count=120,
+        ))
+
+        ids = [issue['id'] for issue in report['issues']]
+        self.assertEqual(ids[0], 'title_missing')
+        self.assertEqual(set(ids), {
+            'title_missing', 'h1_multiple', 'images_missing_alt', 'canonical_missing',
+            'language_missing', 'thin_content',
+        })
+        self.assertEqual(report['score'], 100 - 15 - 5 - 6 - 5 - 3 - 10)
+
+    def test_batch_evaluation_matches_single_page(self):
+        pages = [self.good_page(), self.good_page(headings={}), self.good_page(url='http://example.com')]
+
+        reports = evaluate_pages(pages)
+
+        self.assertEqual(reports, [evaluate_page(page) for page in pages])
+        self.assertEqual(reports[1]['issues'][0]['id'], 'h1_missing')
+
+    def test_score_endpoint(self):
+        client = APIClient()
+
+        single = client.post('/api/seo/score/', {'scraped_data': self.good_page(headings={})}, format='json')
+        batch = client.post('/api/seo/score/', {'pages': [self.good_page(), {}]}, format='json')
+
+        self.assertEqual(single.status_code, 200)
+        self.assertEqual(single.data['report']['score'], 90)
+        self.assertEqual([report['score'] for report in batch.data['reports']][0], 100)
+
+    @override_settings(SEO_SCORE_MAX_PAGES=3, THROTTLE_ENABLED=False)
+    def test_score_endpoint_rejects_malformed_pages(self):
+        client = APIClient()
+        for bad in ({'word_count': 'twelve'}, {'word_count': 2 ** 70}, {'status_code': -1},
+                    {'headings': {'h1': 5}}, {'headings': []}, {'meta_title': ['x']}, 'page'):
+            response = client.post('/api/seo/score/', {'pages': [self.good_page(), bad]}, format='json')
+            self.assertEqual(response.status_code, 400, bad)
+        response = client.post('/api/seo/score/', {'scraped_data': {'images_missing_alt_count': {}}}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.post('/api/seo/score/', {'pages': [{}] * 4}, format='json').status_code, 400)
+
+        # Numeric strings and nulls are accepted
+        response = client.post('/api/seo/score/', {'pages': [
+            self.good_page(word_count='120'), self.good_page(word_count=None, status_code=None),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('thin_content', [issue['id'] for issue in response.data['reports'][0]['issues']])
+        self.assertEqual(response.data['reports'][1]['score'], 100)
+
+    def test_comprehensive_analysis_adds_narrative_to_rule_score(self):
+        model = FakeModel('{"quick_wins": ["Add an H1"], "strategy": [], "technical": [], "content_quality": "Fine"}')
+        service = make_ai_service(model)
+
+        analysis = service.generate_comprehensive_analysis(self.good_page(headings={}))
+
+        self.assertEqual(analysis['score'], 90)
+        self.assertEqual(analysis['critical_issues'], ['Page has no H1 heading'])
+        self.assertEqual(analysis['quick_wins'], ['Add an H1'])
+        self.assertIn('Automated SEO Score: 90/100', model.prompts[0])
+
+
+class KeywordExtractionTest(TestCase):
+    PAGE = (
+        'Trail running shoes for rocky terrain. Our trail running shoes are lightweight and waterproof. '
+        'Privacy policy. Terms of service. Free shipping on trail running shoes.'
+    )
+
+    def setUp(self):
+        corpus_provider.reset()
+
+    def boilerplate_corpus(self, n_docs):
+        corpus = BackgroundCorpus()
+        for i in range(n_docs):
+            corpus.add_document(f'Privacy policy. Terms of service. Contact page number{i} about topic{i % 7}.')
+        return corpus
+
+    def test_page_specific_terms_outrank_boilerplate(self):
+        result = extract_keywords(self.PAGE, headings=['Trail running shoes'], corpus=self.boilerplate_corpus(20))
+
+        phrases = [item['phrase'] for item in result['phrases']]
+        terms = [item['term'] for item in result['unigrams']]
+        self.assertEqual(phrases[0], 'trail running shoes')
+        self.assertLess(phrases.index('trail running shoes'), phrases.index('privacy policy'))
+        self.assertLess(terms.index('running'), terms.index('privacy'))
+
+    def test_rankings_are_stable_as_corpus_grows(self):
+        # The corpus only shifts IDF; extraction cost depends on the page, not corpus size
+        small, large = self.boilerplate_corpus(10), self.boilerplate_corpus(2000)
+        self.assertGreater(len(large.vocabulary), len(small.doc_freq))
+
+        def best_time(corpus):
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                result = extract_keywords(self.PAGE * 50, corpus=corpus)
+                timings.append(time.perf_counter() - start)
+            return min(timings), result
+
+        small_time, small_result = best_time(small)
+        large_time, large_result = best_time(large)
+        self.assertEqual(small_result['phrases'][0]['phrase'], large_result['phrases'][0]['phrase'])
+        self.assertLess(large_time, small_time * 5 + 0.01)
+
+    def test_endpoint_reads_full_snapshot_text(self):
+        user = User.objects.create_user(email='kw@example.com', password='pass12345', is_verified=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        page_text = 'filler words here. ' * 200 + 'Quantum widget calibration. Quantum widget calibration.'
+        snapshot = AuditSnapshot.create_snapshot(dict(SAMPLE_SCRAPE), user=user, page_text=page_text)
+
+        response = client.post('/api/seo/keywords/', {'snapshot_id': str(snapshot.id)}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('quantum widget calibration', [item['phrase'] for item in response.data['keywords']['phrases']])
+
+    def test_non_ascii_pages_have_keywords(self):
+        result = extract_keywords('Привет мир. Привет мир снова. Это тест.')
+
+        self.assertEqual(result['unigrams'][0]['term'], 'привет')
+        self.assertIn('привет мир', [item['phrase'] for item in result['phrases']])
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_malformed_fields_are_rejected(self):
+        client = APIClient()
+        for body in ({'content': 'Some page text', 'headings': 5},
+                     {'content': 'Some page text', 'headings': ['ok', {'h2': 'x'}]},
+                     {'content': ['not', 'text']},
+                     {'content': 'Some page text', 'meta_title': {'x': 1}}):
+            response = client.post('/api/seo/keywords/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertFalse(response.data['success'])
+
+        response = client.post('/api/seo/keywords/', {
+            'content': 'Trail running shoes. Trail running shoes.',
+            'headings': {'h1': ['Trail running'], 'h2': ['Shoes']},
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        with mock.patch('api.views.GeminiAIService.is_configured', return_value=True), \
+                mock.patch('api.views.GeminiAIService.generate_keywords') as generate:
+            response = client.post('/api/ai/generate-keywords/', {'content': 'Text', 'headings': 5}, format='json')
+        self.assertEqual(response.status_code, 400)
+        generate.assert_not_called()
+
+    def test_corpus_is_built_from_stored_audits_off_the_request_path(self):
+        user = User.objects.create_user(email='kw@example.com', password='pass12345', is_verified=True)
+        for i in range(3):
+            AuditRecord.record(user, {**SAMPLE_SCRAPE, 'url': f'https://example.com/{i}'},
+                               page_text=f'Privacy policy. Widget number{i}.')
+        provider = CorpusProvider(refresh_seconds=60)
+
+        # Nothing built yet: an empty corpus right away, the build starts after commit
+        with self.captureOnCommitCallbacks() as callbacks, mock.patch.object(provider, 'build') as build:
+            self.assertEqual(len(provider.get()), 0)
+            provider.get()
+        self.assertEqual(len(callbacks), 1)
+        build.assert_not_called()
+
+        provider.refresh()
+        corpus = provider.get()
+        self.assertEqual(len(corpus), 3)
+        self.assertEqual(corpus.doc_freq[corpus.vocabulary['privacy']], 3)
+
+        # A due refresh keeps serving the current corpus until the new one is swapped in
+        with mock.patch('api.keywords.time.monotonic', return_value=time.monotonic() + 120), \
+                self.captureOnCommitCallbacks() as callbacks:
+            self.assertIs(provider.get(), corpus)
+        self.assertEqual(len(callbacks), 1)
+
+        with override_settings(SEARCH_ENABLED=False):
+            provider.refresh()
+        self.assertEqual(len(provider.get()), 3)
+
+    def test_generate_keywords_includes_local_hints(self):
+        model = FakeModel('{"primary": ["a"], "secondary": [], "long_tail": [], "lsi": []}')
+        service = make_ai_service(model)
+
+        service.generate_keywords('Title', 'Description', 'Content', ['Heading'], hints=['trail running shoes'])
+
+        self.assertIn('Candidate Terms Ranked From The Full Page Text: trail running shoes', model.prompts[0])
+
+
+class LLMProviderTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        reset_llm_callers()
+
+    def test_fake_provider_replies_satisfy_every_response_schema(self):
+        service = GeminiAIService(provider=FakeProvider())
+
+        for endpoint, schema in RESPONSE_SCHEMAS.items():
+            reply = service.provider.generate(f'prompt for {endpoint}', 5, {'response_schema': schema})
+            self.assertTrue(parse_llm_json(reply.text, endpoint))
+            self.assertEqual(registry.counter_value('llm_json_parse_total', endpoint=endpoint, result='clean'), 1)
+
+        analysis = service.generate_comprehensive_analysis(dict(SAMPLE_SCRAPE))
+        self.assertNotIn('error', analysis)
+        self.assertEqual(len(analysis['quick_wins']), 3)
+
+    def test_fake_provider_is_deterministic_and_injects_errors(self):
+        provider = FakeProvider()
+        self.assertEqual(provider.generate('same', 5).text, provider.generate('same', 5).text)
+        self.assertEqual(''.join(provider.stream('same', 5)), provider.generate('same', 5).text)
+
+        with self.assertRaises(google_exceptions.ServiceUnavailable):
+            FakeProvider(error_rate=1.0).generate('x', 5)
+        with self.assertRaises(google_exceptions.DeadlineExceeded):
+            FakeProvider(latency=0.2).generate('x', 0.01)
+
+    def test_provider_interface_and_gemini_configuration_errors(self):
+        with self.assertRaises(TypeError):
+            LLMProvider()
+
+        with mock.patch('api.llm_providers.genai.configure', side_effect=ValueError('bad key')), \
+                self.assertLogs('api.llm_providers', 'ERROR') as logs:
+            provider = GeminiProvider(api_key='not-a-key')
+        self.assertFalse(provider.is_configured())
+        self.assertIn('bad key', logs.output[0])
+
+    def test_http_provider_against_fake_server(self):
+        with FakeLLMServer() as server:
+            provider = HttpProvider(server.url)
+            schema = RESPONSE_SCHEMAS['keywords']
+
+            reply = provider.generate('prompt', 5, {'response_schema': schema})
+            streamed = ''.join(provider.stream('chat prompt', 5))
+
+            self.assertEqual(reply.text, FakeProvider().generate('prompt', 5, {'response_schema': schema}).text)
+            self.assertEqual(streamed, FakeProvider().generate('chat prompt', 5).text)
+            self.assertEqual(server.requests, 2)
+
+        with FakeLLMServer(error_rate=1.0) as server:
+            with self.assertRaises(google_exceptions.ServiceUnavailable):
+                HttpProvider(server.url).generate('prompt', 5)
+
+    @override_settings(LLM_PROVIDER='fake')
+    def test_ai_endpoint_uses_configured_provider(self):
+        reset_llm_provider()
+        self.addCleanup(reset_llm_provider)
+
+        response = APIClient().post('/api/ai/generate-keywords/', {
+            'meta_title': 'Trail shoes', 'content_preview': 'Trail running shoes for rocky terrain.'
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['keywords']['primary']), 3)
+
+
+class ThrottlingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_token_bucket_spends_and_refills(self):
+        now = [1000.0]
+        bucket = TokenBucket('test', capacity=10, refill_per_second=1, clock=lambda: now[0])
+
+        self.assertEqual(bucket.consume('client', 8)[:2], (True, 2))
+        allowed, remaining, retry_after = bucket.consume('client', 5)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 3)
+
+        now[0] += 3
+        self.assertTrue(bucket.consume('client', 5)[0])
+        self.assertTrue(bucket.consume('other-client', 10)[0])
+        self.assertFalse(bucket.consume('client', 11)[0])
+
+    @override_settings(THROTTLE_ANON_CAPACITY=2, THROTTLE_ANON_REFILL_PER_MINUTE=6)
+    def test_spoofed_forwarded_for_does_not_reset_the_bucket(self):
+        client = APIClient()
+        body = {'scraped_data': dict(SAMPLE_SCRAPE)}
+
+        def post(forwarded_for, remote_addr='203.0.113.7'):
+            return client.post('/api/seo/score/', body, format='json', REMOTE_ADDR=remote_addr,
+                               HTTP_X_FORWARDED_FOR=forwarded_for).status_code
+
+        self.assertEqual([post(f'198.51.100.{i}') for i in range(3)], [200, 200, 429])
+        self.assertEqual(post('198.51.100.9', remote_addr='203.0.113.8'), 200)
+
+        # Behind one proxy: the entry it appended counts, not what the client sent before it
+        rest_framework = dict(settings.REST_FRAMEWORK, NUM_PROXIES=1)
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            self.assertEqual([post(f'198.51.100.{i}, 192.0.2.1', remote_addr='10.0.0.2') for i in range(3)],
+                             [200, 200, 429])
+
+    @override_settings(THROTTLE_ANON_CAPACITY=2, THROTTLE_ANON_REFILL_PER_MINUTE=6)
+    def test_endpoint_returns_429_with_retry_after(self):
+        client = APIClient()
+        body = {'scraped_data': dict(SAMPLE_SCRAPE)}
+
+        codes = [client.post('/api/seo/score/', body, format='json').status_code for _ in range(3)]
+        response = client.post('/api/seo/score/', body, format='json')
+
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertFalse(response.data['success'])
+        self.assertEqual(registry.counter_value(
+            'throttle_decisions_total', endpoint='seo_score', scope='anon', result='throttled'), 2)
+
+        user = User.objects.create_user(email='quota@example.com', password='pass12345', is_verified=True)
+        client.force_authenticate(user)
+        self.assertEqual(client.post('/api/seo/score/', body, format='json').status_code, 200)
+        self.assertEqual(client.get('/api/quota/').data['tokens'], 79)
+
+    @override_settings(ADMISSION_MAX_IN_FLIGHT=1, ADMISSION_MIN_COST=1)
+    def test_admission_control_sheds_load_when_slots_are_taken(self):
+        client = APIClient()
+        body = {'scraped_data': dict(SAMPLE_SCRAPE)}
+        cache.add('admission:slot:0', 'another-request', 60)
+
+        response = client.post('/api/seo/score/', body, format='json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(registry.counter_value('admission_rejected_total', endpoint='seo_score'), 1)
+
+        cache.delete('admission:slot:0')
+        self.assertEqual(client.post('/api/seo/score/', body, format='json').status_code, 200)
+        self.assertIsNone(cache.get('admission:slot:0'))
+
+
+class EmailOutboxTest(TestCase):
+    def test_register_queues_email_instead_of_sending(self):
+        response = APIClient().post('/api/auth/register/', {
+            'email': 'new@example.com', 'password': 'Str0ng-pass-123', 'password2': 'Str0ng-pass-123'
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.to_email, 'new@example.com')
+
+        self.assertEqual(deliver_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(OTP.objects.get(email='new@example.com').otp_code, mail.outbox[0].body)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, EmailOutbox.STATUS_SENT)
+        self.assertEqual(queued.body, '')
+        self.assertEqual(deliver_outbox(), (0, 0))
+
+    def test_web_processes_start_the_dispatcher_when_ready(self):
+        app_config = apps.get_app_config('api')
+        for argv, mode, started in ((['gunicorn', 'core.wsgi:application'], 'thread', True),
+                                    (['manage.py', 'runserver'], 'thread', True),
+                                    (['manage.py', 'send_outbox_emails'], 'thread', False),
+                                    (['manage.py', 'migrate'], 'thread', False),
+                                    (['gunicorn', 'core.wsgi:application'], 'worker', False)):
+            with mock.patch.object(sys, 'argv', argv), override_settings(EMAIL_OUTBOX_MODE=mode), \
+                    mock.patch('api.email_service.outbox_dispatcher.wake') as wake:
+                app_config.ready()
+            self.assertEqual(wake.called, started, argv)
+
+    @override_settings(EMAIL_OUTBOX_RETENTION_DAYS=7)
+    def test_purge_keeps_recent_and_undelivered_mail(self):
+        for email in ('user0@example.com', 'user1@example.com', 'recent@example.com'):
+            EmailService.queue_otp_email(email, '123456', 'registration')
+        deliver_outbox()
+        EmailService.queue_otp_email('user2@example.com', '123456', 'registration')
+        EmailOutbox.objects.exclude(to_email='recent@example.com').update(
+            created_at=timezone.now() - timezone.timedelta(days=8)
+        )
+
+        self.assertEqual(purge_outbox(batch_size=1), 1)
+        self.assertEqual(purge_outbox(), 1)
+        self.assertEqual(purge_outbox(), 0)
+        # Still pending (old), and delivered but recent
+        self.assertEqual(sorted(EmailOutbox.objects.values_list('to_email', 'status')),
+                         [('recent@example.com', EmailOutbox.STATUS_SENT),
+                          ('user2@example.com', EmailOutbox.STATUS_PENDING)])
+
+    def test_batch_reuses_one_smtp_connection(self):
+        for i in range(5):
+            EmailService.queue_otp_email(f'user{i}@example.com', '123456', 'registration')
+
+        with FakeSMTPServer() as smtp, override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=smtp.port, EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        ):
+            self.assertEqual(deliver_outbox(), (5, 0))
+
+        self.assertEqual(smtp.connections, 1)
+        self.assertEqual(sorted(m['recipients'][0] for m in smtp.messages),
+                         [f'user{i}@example.com' for i in range(5)])
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_SECONDS=60)
+    def test_failed_sends_back_off_then_give_up(self):
+        EmailService.queue_otp_email('flaky@example.com', '123456', 'password_reset')
+        connection = mock.Mock()
+        connection.send_messages.side_effect = OSError('relay down')
+
+        self.assertEqual(deliver_outbox(connection=connection), (0, 1))
+        queued = EmailOutbox.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (EmailOutbox.STATUS_PENDING, 1))
+        self.assertGreater(queued.available_at, timezone.now() + timezone.timedelta(seconds=50))
+        self.assertEqual(deliver_outbox(connection=connection), (0, 0))
+
+        EmailOutbox.objects.update(available_at=timezone.now())
+        deliver_outbox(connection=connection)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.last_error), (EmailOutbox.STATUS_FAILED, 'relay down'))
+
+
+class OTPMaintenanceTest(TestCase):
+    def make_otp(self, email, minutes_left, is_used=False):
+        return OTP.objects.create(
+            email=email, otp_code='123456', otp_type='registration', is_used=is_used,
+            expires_at=timezone.now() + timezone.timedelta(minutes=minutes_left),
+        )
+
+    def test_purge_deletes_only_expired_in_batches(self):
+        for i in range(5):
+            self.make_otp(f'old{i}@example.com', -30, is_used=i % 2 == 0)
+        live = self.make_otp('live@example.com', 5)
+
+        self.assertEqual(OTP.purge_expired(batch_size=3), 3)
+        self.assertEqual(OTP.purge_expired(batch_size=3), 2)
+        self.assertEqual(list(OTP.objects.all()), [live])
+
+    def test_purge_command_and_create_otp_trim_expired_rows(self):
+        for i in range(7):
+            self.make_otp(f'old{i}@example.com', -30)
+
+        with override_settings(OTP_PURGE_BATCH_SIZE=5):
+            OTP.create_otp('new@example.com', 'registration')
+        self.assertEqual(OTP.objects.count(), 3)
+
+        call_command('purge_otps', batch_size=1, pause=0, stdout=io.StringIO())
+        self.assertEqual(list(OTP.objects.values_list('email', flat=True)), ['new@example.com'])
+
+    @skipUnless(connection.vendor == 'sqlite', "Postgres may prefer a sequential scan on a tiny table")
+    def test_lookups_use_the_partial_index(self):
+        plan = OTP.objects.filter(
+            email='a@example.com', otp_code='123456', otp_type='registration', is_used=False
+        ).explain()
+        self.assertIn('otp_active_lookup_idx', plan)
+
+
+class CachedAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='cached@example.com', password='pass12345', is_verified=True)
+        self.client.post('/api/auth/login/', {'email': 'cached@example.com', 'password': 'pass12345'},
+                         content_type='application/json')
+
+    def test_authenticated_requests_skip_session_and_user_queries(self):
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/user/')
+        self.assertEqual(response.json()['user']['email'], 'cached@example.com')
+
+    def test_saving_the_user_invalidates_the_cached_copy(self):
+        self.client.get('/api/auth/user/')
+
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/user/').json()['user']['first_name'], 'Renamed')
+
+        # A password change ends existing sessions right away, not when the cache entry expires
+        self.user.set_password('new-pass-456')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 403)
+
+    def test_logout_ends_the_cached_session(self):
+        self.client.get('/api/auth/user/')
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 403)
+
+    def test_sessions_from_the_plain_model_backend_stay_signed_in(self):
+        client = Client()
+        client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+
+        response = client.get('/api/auth/user/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['email'], 'cached@example.com')
+
+
+class TwoLevelCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_local_level_serves_repeat_reads_and_counts_hits(self):
+        first = TwoLevelCache('psi', ttl=60)
+        other_worker = TwoLevelCache('psi', ttl=60)
+
+        first.set('https://example.com/', {'score': 90})
+        self.assertEqual(first.get('https://example.com/'), {'score': 90})
+        self.assertEqual(other_worker.get('https://example.com/'), {'score': 90})
+        self.assertEqual(other_worker.get('https://example.com/'), {'score': 90})
+        self.assertIsNone(other_worker.get('https://missing.example/'))
+
+        stats = cache_summary()['psi']
+        self.assertEqual(stats['local'], {'hit': 2, 'miss': 2})
+        self.assertEqual(stats['shared'], {'hit': 1, 'miss': 1})
+
+    def test_lru_evicts_least_recently_used_and_namespaces_are_separate(self):
+        lru = TwoLevelCache('links', ttl=60, max_local_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(len(lru.local), 2)
+        self.assertEqual(cache_summary()['links']['evictions'], 1)
+        # 'b' was evicted locally but is still in the shared level
+        self.assertEqual(lru.get('b'), 2)
+        self.assertIsNone(TwoLevelCache('other', ttl=60).get('a'))
+
+    def test_invalidate_bumps_the_version_for_every_process(self):
+        first = TwoLevelCache('ai', ttl=60, local_ttl=0)
+        second = TwoLevelCache('ai', ttl=60, local_ttl=0)
+        first.set('prompt', 'old answer')
+        self.assertEqual(second.get('prompt'), 'old answer')
+
+        first.invalidate()
+
+        self.assertIsNone(second.get('prompt'))
+        self.assertEqual(second.get_or_set('prompt', lambda: 'new answer'), 'new answer')
+        self.assertEqual(first.get('prompt'), 'new answer')
+
+    def test_get_or_set_computes_once_under_concurrency(self):
+        two_level = TwoLevelCache('stampede', ttl=60)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'report'
+
+        threads = [threading.Thread(target=two_level.get_or_set, args=('key', compute)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(two_level.get('key'), 'report')
+
+    def test_waits_for_another_process_holding_the_lock(self):
+        two_level = TwoLevelCache('locked', ttl=60, poll_interval=0.01)
+        cache.set(f"{two_level.make_key('key')}:lock", 'other-process', 5)
+        threading.Timer(0.05, lambda: two_level.shared.set(two_level.make_key('key'), 'from leader', 60)).start()
+
+        self.assertEqual(two_level.get_or_set('key', lambda: 'computed here'), 'from leader')
+        self.assertEqual(cache_summary()['locked']['stampede_waits'], 1)
+
+
+class MetricsExportTest(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_scrape_records_stage_timings_and_server_timing_header(self):
+        html = b'<html><head><title>Stages</title></head><body><h1>Hi</h1><a href="/about">About</a></body></html>'
+        fake_response = mock.Mock(status_code=200, content=html, raise_for_status=mock.Mock())
+
+        with mock.patch('api.scraper.requests.get', return_value=fake_response):
+            anonymous = APIClient().post('/api/scrape/', {'url': 'https://stages.example.com/'}, format='json')
+            with override_settings(METRICS_SERVER_TIMING=True):
+                response = APIClient().post('/api/scrape/', {'url': 'https://stages.example.com/'}, format='json')
+
+        self.assertFalse(anonymous.has_header('Server-Timing'))
+        self.assertEqual(response.status_code, 200)
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        for stage in ('fetch_headers', 'fetch_body', 'parse', 'meta_title', 'internal_links', 'total'):
+            self.assertIn(stage, stages)
+        histograms = {(h['name'], tuple(h['labels'].items())) for h in registry.snapshot()['histograms']}
+        self.assertIn(('scrape_stage_seconds', (('stage', 'parse'),)), histograms)
+        self.assertIn(('http_request_duration_seconds', (('method', 'POST'), ('status', '2xx'),
+                                                         ('view', 'scrape_website'))), histograms)
+
+    def test_render_prometheus_merges_workers(self):
+        worker_a = MetricsRegistry()
+        worker_a.inc('llm_calls_total', 2, endpoint='chat')
+        worker_a.observe('llm_call_latency_seconds', 0.3, buckets=(0.1, 1.0), endpoint='chat')
+        worker_a.set_gauge('admission_in_flight', 1)
+        worker_b = MetricsRegistry()
+        worker_b.inc('llm_calls_total', 3, endpoint='chat')
+        worker_b.observe('llm_call_latency_seconds', 5.0, buckets=(0.1, 1.0), endpoint='chat')
+
+        text = render_prometheus(merge_snapshots([
+            dict(worker_a.snapshot(), pid=1), dict(worker_b.snapshot(), pid=2),
+        ]))
+
+        self.assertIn('# TYPE sitescope_llm_calls_total counter', text)
+        self.assertIn('sitescope_llm_calls_total{endpoint="chat"} 5', text)
+        self.assertIn('sitescope_llm_call_latency_seconds_bucket{endpoint="chat",le="1.0"} 1', text)
+        self.assertIn('sitescope_llm_call_latency_seconds_bucket{endpoint="chat",le="+Inf"} 2', text)
+        self.assertIn('sitescope_llm_call_latency_seconds_sum{endpoint="chat"} 5.3', text)
+        self.assertIn('sitescope_admission_in_flight{pid="1"} 1', text)
+
+    def test_metrics_endpoint_requires_token_and_reads_every_worker(self):
+        registry.inc('llm_calls_total', 4, endpoint='chat')
+        with tempfile.TemporaryDirectory() as directory:
+            other = MetricsRegistry()
+            other.inc('llm_calls_total', 6, endpoint='chat')
+            MetricsExporter(directory, metrics_registry=other).flush()
+            os.replace(os.path.join(directory, f'metrics-{os.getpid()}.json'),
+                       os.path.join(directory, 'metrics-999999999.json'))
+
+            with override_settings(METRICS_DIR=directory, METRICS_TOKEN='scrape-secret'):
+                self.assertEqual(self.client.get('/metrics').status_code, 403)
+                response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('sitescope_llm_calls_total{endpoint="chat"} 10', response.content.decode())
+
+
+    def test_server_timing_is_sent_to_staff(self):
+        staff = User.objects.create_user(email='staff@example.com', password='pass12345', is_staff=True)
+        self.client.force_login(staff)
+        self.assertTrue(self.client.get('/api/quota/').has_header('Server-Timing'))
+
+    def test_exited_workers_are_folded_into_one_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for pid in (999999991, 999999992):
+                other = MetricsRegistry()
+                other.inc('llm_calls_total', 5, endpoint='chat')
+                other.set_gauge('admission_in_flight', 3)
+                with open(os.path.join(directory, f'metrics-{pid}.json'), 'w') as handle:
+                    json.dump(dict(other.snapshot(), pid=pid), handle)
+            exporter = MetricsExporter(directory, metrics_registry=MetricsRegistry())
+
+            for _ in range(2):
+                snapshot = exporter.collect()
+                self.assertEqual([c['value'] for c in snapshot['counters'] if c['name'] == 'llm_calls_total'], [10])
+                self.assertEqual(snapshot['gauges'], [])
+            self.assertEqual({name for name in os.listdir(directory) if name.endswith('.json')},
+                             {'metrics-exited.json', f'metrics-{os.getpid()}.json'})
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0, PROFILING_MAX_PER_MINUTE=100)
+class RequestProfilingTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(email='staff@example.com', password='pass12345', is_staff=True)
+        self.body = {'scraped_data': dict(SAMPLE_SCRAPE)}
+
+    def test_staff_header_stores_profile_with_stages_and_download(self):
+        self.client.force_login(self.staff)
+        html = b'<html><head><title>Profiled</title></head><body><h1>Slow page</h1></body></html>'
+        fake_response = mock.Mock(status_code=200, content=html, raise_for_status=mock.Mock())
+
+        with mock.patch('api.scraper.requests.get', return_value=fake_response):
+            response = self.client.post('/api/scrape/', {'url': 'https://profiled.example.com/'},
+                                        content_type='application/json', HTTP_X_PROFILE_REQUEST='1')
+        self.assertEqual(response.status_code, 200)
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.trigger, profile.view_name, profile.user), ('header', 'scrape_website', self.staff))
+        stage_names = [stage['name'] for stage in profile.stages]
+        self.assertEqual(stage_names[:3], ['fetch_headers', 'fetch_body', 'parse'])
+        self.assertTrue(all(stage['start_ms'] >= 0 for stage in profile.stages))
+        self.assertTrue(any('fetch_page' in row['function'] for row in profile.top_functions))
+
+        download = self.client.get(f'/api/profiles/{profile.pk}/download/')
+        self.assertEqual(download.status_code, 200)
+        with tempfile.NamedTemporaryFile(suffix='.prof') as handle:
+            handle.write(download.content)
+            handle.flush()
+            self.assertGreater(pstats.Stats(handle.name, stream=io.StringIO()).total_calls, 0)
+
+    def test_header_from_non_staff_is_ignored_and_sampling_profiles_anyone(self):
+        self.client.post('/api/seo/score/', self.body, content_type='application/json',
+                         HTTP_X_PROFILE_REQUEST='1')
+        self.assertEqual(RequestProfile.objects.count(), 0)
+        self.assertEqual(self.client.get('/api/profiles/1/download/').status_code, 403)
+
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            self.client.post('/api/seo/score/', self.body, content_type='application/json')
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.trigger, profile.user), ('sample', None))
+
+    def test_rate_limit_and_retention(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_PER_MINUTE=3, PROFILING_MAX_STORED=2):
+            for _ in range(5):
+                self.client.post('/api/seo/score/', self.body, content_type='application/json')
+        # 3 profiled within the minute, of which the newest 2 are kept
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_middleware_is_not_loaded(self):
+        response = self.client.get('/api/quota/', HTTP_X_PROFILE_REQUEST='1')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertNotIn('ProfilingMiddleware', repr(self.client.handler._middleware_chain))
+
+
+class ExtractionBenchmarkTest(TestCase):
+    @mock.patch('api.scraper.requests.get', side_effect=AssertionError('network access'))
+    def test_every_corpus_page_extracts_offline(self, _):
+        corpus = html_corpus()
+        self.assertEqual(set(corpus), {'tiny', 'typical', 'huge', 'link_heavy', 'image_heavy', 'badly_encoded', 'structured'})
+        results = {}
+        for name, html in corpus.items():
+            scraper = WebScraper(BENCH_PAGE_URL)
+            scraper.load_html(html)
+            results[name] = scraper.extract_all()
+            self.assertEqual(list(results[name])[:2], ['meta_title', 'meta_description'])
+
+        self.assertEqual(results['typical']['canonical_url'], 'https://example.com/guides/seo-audit/')
+        self.assertEqual(results['link_heavy']['internal_links_count'], 50)
+        self.assertEqual(results['image_heavy']['images_missing_alt_count'], 1000)
+        self.assertIn('Caf', results['badly_encoded']['meta_title'])
+        self.assertGreater(results['huge']['word_count'], 100000)
+
+    def test_find_regressions_ignores_jitter(self):
+        baseline = {'typical': {
+            'parse': {'median_ms': 3.0, 'peak_kb': 160.0},
+            'language': {'median_ms': 0.02, 'peak_kb': 1.3},
+        }}
+        report = {'typical': {
+            'parse': {'median_ms': 4.5, 'peak_kb': 170.0},
+            'language': {'median_ms': 0.04, 'peak_kb': 1.5},
+            'new_stage': {'median_ms': 9.0, 'peak_kb': 9.0},
+        }}
+        self.assertEqual(find_regressions(report, baseline, tolerance=0.25),
+                         [('typical', 'parse', 'median_ms', 3.0, 4.5)])
+        self.assertEqual(find_regressions(report, baseline, tolerance=0.6), [])
+
+    def test_missing_baseline_skips_the_check(self):
+        out = io.StringIO()
+        call_command('bench_extraction', pages='tiny', repeat=1, baseline='/nonexistent/baseline.json', stdout=out)
+        self.assertIn('No baseline at /nonexistent/baseline.json; skipping', out.getvalue())
+
+
+class LoadTestStubsTest(TestCase):
+    def test_scrape_against_local_site_and_pagespeed(self):
+        pages = {'/typical': html_corpus()['typical']}
+        with StaticSiteServer(pages) as site, FakePageSpeedServer() as psi, \
+                override_settings(PAGESPEED_API_URL=psi.api_url), \
+                mock.patch.dict(os.environ, {'PAGE_INSIGHTS_API_KEY': 'loadtest'}):
+            data = WebScraper(f'{site.url}/typical?n=1').scrape()
+            with self.assertRaises(Exception):
+                WebScraper(f'{site.url}/missing').scrape()
+
+        self.assertEqual(data['meta_title'], 'The Complete SEO Audit Guide | Example Blog')
+        self.assertEqual(data['content_length'], len(pages['/typical']))
+        for strategy in ('desktop', 'mobile'):
+            self.assertEqual(data['pagespeed_insights'][strategy]['scores']['performance'], 74)
+            self.assertEqual(data['pagespeed_insights'][strategy]['metrics']['largest_contentful_paint'], 2987)
+        self.assertEqual((site.requests, psi.requests), (2, 2))
+
+    def test_pagespeed_stub_injects_errors(self):
+        with FakePageSpeedServer(error_rate=1.0) as psi, override_settings(PAGESPEED_API_URL=psi.api_url), \
+                mock.patch.dict(os.environ, {'PAGE_INSIGHTS_API_KEY': 'loadtest'}):
+            results = WebScraper('https://example.com/').get_pagespeed_insights()
+        self.assertEqual((results['desktop'], results['mobile']), (None, None))
+
+
+class ScrapeMemoryTest(TestCase):
+    # Peak traced allocation per scrape; the parsed tree is 13-30x the page size
+    PEAK_BUDGET_MB = {'huge': 16, 'link_heavy': 12, 'image_heavy': 10}
+
+    def scrape(self, html):
+        response = mock.Mock(status_code=200, content=html)
+        with mock.patch('api.scraper.requests.get', return_value=response), \
+                mock.patch.dict(os.environ, {'PAGE_INSIGHTS_API_KEY': ''}):
+            scraper = WebScraper(BENCH_PAGE_URL)
+            tracemalloc.start()
+            try:
+                data = scraper.scrape()
+                retained, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        return scraper, data, retained, peak
+
+    def test_large_pages_stay_within_budget_and_release_the_tree(self):
+        corpus = html_corpus()
+        for name, budget in self.PEAK_BUDGET_MB.items():
+            with self.subTest(page=name):
+                scraper, data, retained, peak = self.scrape(corpus[name])
+                self.assertLess(peak, budget * 1024 * 1024)
+                # Only the results and the page text outlive the scrape (no GC pass needed)
+                self.assertIsNone(scraper.soup)
+                self.assertLess(retained, sys.getsizeof(scraper.get_page_text()) + 256 * 1024)
+                self.assertEqual(data['content_length'], len(corpus[name]))
+
+    def test_extractors_are_order_independent(self):
+        html = html_corpus()['typical']
+        in_order = WebScraper(BENCH_PAGE_URL)
+        in_order.load_html(html)
+        expected = in_order.extract_all()
+
+        reversed_order = WebScraper(BENCH_PAGE_URL)
+        reversed_order.load_html(html)
+        results = {field: getattr(reversed_order, method)() for field, _, method in reversed(WebScraper.EXTRACTORS)}
+        for field, _, _ in WebScraper.EXTRACTORS:
+            self.assertEqual(results[field], expected[field])
+        # script, style and the noscript tracking pixel are not page content
+        self.assertNotIn('dataLayer', reversed_order.get_page_text())
+        self.assertNotIn('https://tracker.example.net/pixel.gif', [image['src'] for image in expected['images']])
+
+
+class ContentExtractionTest(TestCase):
+    def load(self, name, **options):
+        scraper = WebScraper(BENCH_PAGE_URL, **options)
+        scraper.load_html(html_corpus()[name])
+        return scraper
+
+    def test_streaming_excerpt_and_count_match_the_full_text(self):
+        for name in ('typical', 'huge', 'badly_encoded'):
+            with self.subTest(page=name):
+                scraper = self.load(name)
+                content, word_count = scraper.get_content(), scraper.get_word_count()
+                self.assertIsNone(scraper._page_text)
+                text = scraper.get_page_text()
+                self.assertEqual(content, text[:1000] + '...' if len(text) > 1000 else text)
+                self.assertEqual(word_count, len(text.split()))
+                self.assertEqual(scraper.get_word_count(), word_count)
+
+    def test_excerpt_stops_walking_early(self):
+        scraper = self.load('huge')
+        pieces = []
+        real_iter_text = scraper.iter_text
+
+        def counting_iter_text(*args):
+            for piece in real_iter_text(*args):
+                pieces.append(piece)
+                yield piece
+
+        with mock.patch.object(scraper, 'iter_text', counting_iter_text):
+            self.assertEqual(len(scraper.get_content()), 1003)
+        self.assertLess(len(pieces), 10)
+
+    def test_boilerplate_mode_skips_navigation_and_footer(self):
+        full = self.load('typical').get_content(max_chars=100000)
+        main = self.load('typical', skip_boilerplate=True).get_content(max_chars=100000)
+        self.assertTrue(full.startswith('The Complete SEO Audit Guide | Example Blog Pricing Blog'))
+        self.assertTrue(main.startswith('The Complete SEO Audit Guide | Example Blog The Complete SEO Audit Guide'))
+        self.assertNotIn('github.com', main)
+        self.assertIn('github.com', full)
+        # The word count always covers the whole page
+        self.assertEqual(self.load('typical', skip_boilerplate=True).get_word_count(),
+                         self.load('typical').get_word_count())
+
+
+class StructuredDataTest(TestCase):
+    def extract(self, html):
+        scraper = WebScraper('https://example.com/shoes/trail-runner-2/')
+        scraper.load_html(html)
+        return scraper.get_structured_data()
+
+    def test_json_ld_microdata_and_social_tags(self):
+        data = self.extract(html_corpus()['structured'])
+
+        self.assertEqual([block.get('@type') for block in data['json_ld']], [None, 'FAQPage'])
+        self.assertEqual(len(data['errors']), 1)
+        self.assertTrue(data['errors'][0].startswith('JSON-LD block 3: invalid JSON'))
+        self.assertTrue({'Organization', 'BreadcrumbList', 'FAQPage', 'Product', 'Offer', 'Review'} <= set(data['types']))
+
+        product, review = data['microdata']
+        self.assertEqual(product['id'], 'https://example.com/shoes/trail-runner-2/#product')
+        properties = product['properties']
+        self.assertEqual(properties['image'], 'https://example.com/media/trail-runner-2-side.jpg')
+        self.assertEqual(properties['description'], 'A 240 g trail shoe with a grippy outsole for wet rock.')
+        self.assertEqual(properties['offers']['properties'], {
+            'priceCurrency': 'USD', 'price': '129.00', 'availability': 'https://schema.org/InStock',
+            'priceValidUntil': '2026-12-31',
+        })
+        self.assertEqual(properties['keywords'], ['trail', 'running'])
+        self.assertEqual(review['properties']['author'], 'Sam')
+
+        self.assertEqual(data['open_graph']['og:image'], [
+            'https://example.com/media/trail-runner-2-side.jpg', 'https://example.com/media/trail-runner-2-sole.jpg',
+        ])
+        self.assertEqual(data['open_graph']['product:price:amount'], '129.00')
+        self.assertEqual(data['twitter'], {'twitter:card': 'summary_large_image', 'twitter:site': '@examplestore'})
+
+    @override_settings(SCRAPE_JSON_LD_MAX_CHARS=200, SCRAPE_STRUCTURED_DATA_MAX_ITEMS=2)
+    def test_size_limits(self):
+        blob = '{"@type": "ItemList", "items": [%s]}' % ', '.join(['"item"'] * 100)
+        blocks = ''.join(f'<script type="application/ld+json">{{"@type": "Thing{i}"}}</script>' for i in range(3))
+        items = '<div itemscope itemtype="https://schema.org/Place"></div>' * 3
+        data = self.extract(f'<html><head><script type="application/ld+json">{blob}</script>{blocks}</head>'
+                            f'<body>{items}</body></html>')
+        self.assertEqual(data['json_ld'], [{'@type': 'Thing0'}, {'@type': 'Thing1'}])
+        self.assertEqual(len(data['microdata']), 2)
+        self.assertEqual(data['errors'], [
+            f'JSON-LD block 1: skipped, {len(blob)} characters (limit 200)',
+            'JSON-LD block 4: skipped, more than 2 blocks',
+            'Microdata: kept 2 of 3 items',
+        ])
+
+    def test_meta_lookups_match_find(self):
+        html = ('<html><head><meta name="description"><meta name="description" content="second">'
+                '<meta property="og:description" content=" From OG "></head><body></body></html>')
+        scraper = WebScraper('https://example.com/')
+        scraper.load_html(html)
+        # The first description tag has no content, so (as before) the OG description is used
+        self.assertEqual(scraper.get_meta_description(), 'From OG')
+        self.assertIs(scraper.find_meta('name', 'description'), scraper.soup.find('meta', attrs={'name': 'description'}))
+
+
+class AuditHistoryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass12345', is_verified=True)
+        self.client.force_authenticate(self.user)
+
+    def record(self, url, user=None):
+        return AuditRecord.record(user or self.user, {**SAMPLE_SCRAPE, 'url': url})
+
+    @mock.patch('api.views.WebScraper')
+    def test_scrape_is_stored_compressed(self, scraper_cls):
+        psi = {'mobile': {'scores': {'performance': 74}}, 'desktop': {'scores': {'performance': 91}}}
+        result = {**SAMPLE_SCRAPE, 'word_count': 650, 'pagespeed_insights': psi}
+        scraper_cls.return_value.scrape.return_value = result
+        scraper_cls.return_value.get_page_text.return_value = 'Example content for testing.'
+
+        response = self.client.post('/api/scrape/', {'url': 'https://example.com'}, format='json')
+
+        audit = AuditRecord.objects.get(id=response.data['audit_id'])
+        self.assertEqual((audit.title, audit.status_code, audit.word_count), ('Example Domain', 200, 650))
+        self.assertEqual((audit.performance_mobile, audit.performance_desktop), (74, 91))
+        self.assertLess(len(audit.payload), audit.payload_size)
+        self.assertEqual(audit.get_data(), result)
+
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/scrape/', {'url': 'https://example.com'}, format='json')
+        self.assertNotIn('audit_id', response.data)
+        self.assertEqual(AuditRecord.objects.count(), 1)
+
+    def test_listing_pages_by_cursor_without_payloads(self):
+        other = User.objects.create_user(email='other@example.com', password='pass12345')
+        self.record('https://example.com/', user=other)
+        ids = [self.record(url).id for url in ['https://example.com/', 'https://example.com/pricing'] * 3]
+
+        seen, cursor = [], None
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                response = self.client.get('/api/audits/', {'limit': 4, **({'cursor': cursor} if cursor else {})})
+                self.assertEqual(response.status_code, 200)
+                seen += [audit['id'] for audit in response.data['audits']]
+                cursor = response.data['next_cursor']
+                if cursor is None:
+                    break
+        self.assertEqual(seen, ids[::-1])
+        self.assertNotIn('"payload"', ' '.join(query['sql'] for query in queries.captured_queries
+                                               if 'audit_records' in query['sql']))
+        self.assertNotIn('payload', response.data['audits'][0])
+
+        # Another spelling of the same page
+        response = self.client.get('/api/audits/', {'url': 'HTTPS://Example.com:443/pricing'})
+        self.assertEqual([audit['id'] for audit in response.data['audits']], ids[1::2][::-1])
+        self.assertIsNone(response.data['next_cursor'])
+
+        self.assertEqual(self.client.get('/api/audits/', {'cursor': 'abc'}).status_code, 400)
+
+    def test_detail_and_delete_are_limited_to_the_owner(self):
+        audit = self.record('https://example.com/')
+        response = self.client.get(f'/api/audits/{audit.id}/')
+        self.assertEqual(response.data['data']['meta_title'], 'Example Domain')
+
+        other = User.objects.create_user(email='other@example.com', password='pass12345')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/audits/{audit.id}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/audits/{audit.id}/').status_code, 404)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(f'/api/audits/{audit.id}/').status_code, 200)
+        self.assertFalse(AuditRecord.objects.exists())
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/audits/').status_code, 403)
+
+
+class AuditChangesTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass12345', is_verified=True)
+        self.client.force_authenticate(self.user)
+        self.before = {
+            **SAMPLE_SCRAPE,
+            'internal_links': ['https://example.com/a', 'https://example.com/b'],
+            'pagespeed_insights': {'mobile': {'scores': {'performance': 74, 'seo': 90},
+                                              'metrics': {'largest_contentful_paint': 2987}}},
+        }
+
+    def test_only_changed_sections_are_reported(self):
+        after = {
+            **self.before,
+            'meta_title': 'Example Domain, Renamed',
+            'internal_links': ['https://example.com/b', 'https://example.com/c'],
+            # Timings differ on every run; only the scores count
+            'pagespeed_insights': {'mobile': {'scores': {'performance': 74, 'seo': 90},
+                                              'metrics': {'largest_contentful_paint': 3120}}},
+        }
+        old_hashes, new_hashes = section_hashes(self.before), section_hashes(after)
+        changed = [section for section in new_hashes if old_hashes[section] != new_hashes[section]]
+        self.assertEqual(changed, ['meta', 'links'])
+
+        self.assertEqual(diff_sections(self.before, after, changed), {
+            'meta': {'meta_title': {'before': 'Example Domain', 'after': 'Example Domain, Renamed'}},
+            'links': {'internal_links': {'added': ['https://example.com/c'], 'removed': ['https://example.com/a']}},
+        })
+
+    def test_reaudit_stores_delta_and_timeline_reads_no_payloads(self):
+        first = AuditRecord.record(self.user, self.before)
+        unchanged = AuditRecord.record(self.user, dict(self.before))
+        after = {**self.before, 'headings': {'h1': ['Example Domain'], 'h2': ['About', 'Pricing']}}
+        after['pagespeed_insights'] = {'mobile': {'scores': {'performance': 81, 'seo': 90}}}
+        changed = AuditRecord.record(self.user, after)
+        AuditRecord.record(self.user, {**self.before, 'url': 'https://example.com/other'})
+
+        self.assertIsNone(first.changes)
+        self.assertEqual(unchanged.changes, {'previous_id': first.id, 'sections': [], 'delta': {}})
+        self.assertEqual(changed.changes['sections'], ['headings', 'pagespeed'])
+        self.assertEqual(changed.changes['delta']['pagespeed'],
+                         {'mobile': {'performance': {'before': 74, 'after': 81}}})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/audits/timeline/', {'url': 'https://example.com', 'limit': 2})
+        self.assertNotIn('"payload"', ' '.join(query['sql'] for query in queries.captured_queries))
+        self.assertEqual([entry['id'] for entry in response.data['timeline']], [changed.id, unchanged.id])
+        self.assertEqual(response.data['timeline'][0]['changes']['delta']['headings'],
+                         {'headings': {'h2': {'added': ['Pricing'], 'removed': []}}})
+
+        response = self.client.get('/api/audits/timeline/', {'url': 'https://example.com',
+                                                              'cursor': response.data['next_cursor']})
+        self.assertEqual([entry['id'] for entry in response.data['timeline']], [first.id])
+        self.assertEqual(self.client.get('/api/audits/timeline/').status_code, 400)
+
+
+@override_settings(SCHEDULER_MAX_JITTER_SECONDS=0, SCHEDULER_HOST_SPACING_SECONDS=30,
+                   SCHEDULER_MAX_ENQUEUE_PER_MINUTE=100, SCHEDULER_MISSED_GRACE_MINUTES=30)
+class AuditSchedulerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass12345', is_verified=True)
+        self.now = timezone.now()
+
+    def schedule(self, url, interval_minutes=60, due_minutes_ago=0):
+        schedule = create_schedule(self.user, url, interval_minutes)
+        slot = self.now - timezone.timedelta(minutes=due_minutes_ago)
+        AuditSchedule.objects.filter(pk=schedule.pk).update(scheduled_for=slot, next_run_at=slot)
+        return schedule
+
+    def test_schedules_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/schedules/', {'url': 'example.com', 'interval_minutes': 1440}, format='json')
+        self.assertEqual(response.status_code, 201)
+        schedule_id = response.data['schedule']['id']
+        self.assertEqual(client.post('/api/schedules/', {'url': 'https://EXAMPLE.com/', 'interval_minutes': 60},
+                                     format='json').status_code, 400)
+        self.assertEqual(client.post('/api/schedules/', {'url': 'https://example.org', 'interval_minutes': 5},
+                                     format='json').status_code, 400)
+
+        response = client.patch(f'/api/schedules/{schedule_id}/', {'is_active': False}, format='json')
+        self.assertFalse(response.data['schedule']['is_active'])
+        self.assertEqual([s['url'] for s in client.get('/api/schedules/').data['schedules']], ['https://example.com'])
+        self.assertEqual(tick(self.now + timezone.timedelta(days=2))['due'], 0)
+
+    @override_settings(SCHEDULER_MAX_JITTER_SECONDS=600, SCHEDULER_JITTER_FRACTION=0.1)
+    def test_runs_created_together_are_spread_out(self):
+        schedules = [create_schedule(self.user, f'https://site{i}.example.com/', 60) for i in range(30)]
+        offsets = [(s.next_run_at - s.scheduled_for).total_seconds() for s in schedules]
+        # At most 10% of an hourly interval
+        self.assertTrue(all(0 <= offset <= 360 for offset in offsets))
+        self.assertGreater(len({round(offset) for offset in offsets}), 20)
+
+    @override_settings(SCHEDULER_MAX_ENQUEUE_PER_MINUTE=3)
+    def test_rate_cap_and_host_spacing(self):
+        for i in range(4):
+            self.schedule(f'https://example.com/page-{i}')
+        self.schedule('https://other.example.org/', due_minutes_ago=1)
+
+        stats = tick(self.now)
+        self.assertEqual((stats['enqueued'], stats['rate_limited']), (3, True))
+        self.assertEqual(tick(self.now + timezone.timedelta(seconds=30))['enqueued'], 0)
+        self.assertEqual(tick(self.now + timezone.timedelta(seconds=61))['enqueued'], 2)
+
+        starts = [job.available_at for job in AuditJob.objects.filter(host='example.com').order_by('available_at')]
+        self.assertEqual(len(starts), 4)
+        self.assertTrue(all(later - earlier >= timezone.timedelta(seconds=30)
+                            for earlier, later in zip(starts, starts[1:])))
+        self.assertEqual(AuditJob.objects.get(host='other.example.org').available_at, self.now)
+
+    def test_catch_up_after_downtime(self):
+        # Due five hours ago: four hourly slots were missed
+        schedule = self.schedule('https://example.com/', due_minutes_ago=5 * 60 + 10)
+        self.assertEqual(tick(self.now)['enqueued'], 1)
+        schedule.refresh_from_db()
+        # Still on the old phase (10 past), first slot after now
+        self.assertEqual(schedule.scheduled_for, self.now + timezone.timedelta(minutes=50))
+
+        # The queued job hasn't run yet: the next slot is skipped rather than queued twice
+        stats = tick(self.now + timezone.timedelta(minutes=51))
+        self.assertEqual((stats['due'], stats['enqueued']), (1, 0))
+
+        with override_settings(SCHEDULER_CATCH_UP='skip'):
+            AuditJob.objects.update(status=AuditJob.STATUS_DONE)
+            self.assertEqual(tick(self.now + timezone.timedelta(hours=6))['enqueued'], 0)
+            self.assertEqual(tick(self.now + timezone.timedelta(hours=6, minutes=50))['enqueued'], 1)
+
+    @mock.patch('api.scheduler.WebScraper')
+    def test_jobs_run_into_the_audit_history(self, scraper_cls):
+        self.schedule('https://example.com/')
+        self.schedule('https://example.org/')
+        tick(self.now)
+        scraper_cls.return_value.scrape.side_effect = [dict(SAMPLE_SCRAPE), Exception('timeout')]
+        scraper_cls.return_value.get_page_text.return_value = 'Example page text'
+
+        self.assertEqual(run_audit_jobs(), (1, 1))
+        done = AuditJob.objects.get(status=AuditJob.STATUS_DONE)
+        self.assertEqual(done.audit.user, self.user)
+        retry = AuditJob.objects.get(status=AuditJob.STATUS_PENDING)
+        self.assertEqual((retry.attempts, retry.last_error), (1, 'timeout'))
+        self.assertGreater(retry.available_at, timezone.now())
+
+
+class AuditSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass12345', is_verified=True)
+        self.staff = User.objects.create_user(email='support@example.com', password='pass12345', is_staff=True)
+        self.client.force_authenticate(self.staff)
+
+    def record(self, url, title, page_text='', **fields):
+        data = {**SAMPLE_SCRAPE, 'url': url, 'meta_title': title, **fields}
+        return AuditRecord.record(self.user, data, page_text=page_text)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [result['url'] for result in response.data['results']], response.data
+
+    def test_query_syntax(self):
+        self.assertEqual(parse_query('shoes "free  shipping" -boots -"gift card'),
+                         [('shoes', False), ('free shipping', False), ('boots', True), ('gift card', True)])
+
+    def test_ranking_phrases_and_exclusions(self):
+        self.record('https://a.example.com/', 'Running shoes on sale', page_text='Our range of trail gear.')
+        self.record('https://b.example.com/', 'Trail gear', page_text='We sell running shoes and boots.')
+        self.record('https://c.example.com/', 'Shoes', page_text='Running late? Free shipping on all shoes.',
+                    headings={'h1': ['Shoes'], 'h2': ['Free shipping']})
+
+        urls, data = self.search('running shoes')
+        # A title match outranks the same words in the page text
+        self.assertEqual(urls[0], 'https://a.example.com/')
+        self.assertEqual(set(urls), {'https://a.example.com/', 'https://b.example.com/', 'https://c.example.com/'})
+        self.assertEqual(data['results'][0]['user_email'], 'owner@example.com')
+
+        self.assertEqual(self.search('"running shoes" -boots')[0], ['https://a.example.com/'])
+        self.assertEqual(self.search('"free shipping"')[0], ['https://c.example.com/'])
+        self.assertIn('**', self.search('boots')[1]['results'][0]['snippet'])
+        # Operators typed by the user are searched for, not interpreted
+        self.assertEqual(self.search('shoes OR NEAR(gear')[0], [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'websearch_to_tsquery and ts_headline are PostgreSQL-only')
+    def test_postgres_query_parsing_and_highlighting(self):
+        shoes = self.record('https://a.example.com/', 'Trail gear', page_text='We sell running shoes for trails.')
+        boots = self.record('https://b.example.com/', 'Trail gear', page_text='Running shoes and hiking boots.')
+        backend = get_search_backend()
+
+        # Stemmed words, quoted phrases and exclusions go through websearch_to_tsquery
+        self.assertEqual([row[0] for row in backend.search(parse_query('"running shoes" -boots'), 10, 0)],
+                         [shoes.id])
+        self.assertEqual({row[0] for row in backend.search(parse_query('run shoe'), 10, 0)}, {shoes.id, boots.id})
+        # Operator characters are dropped by the parser instead of raising a tsquery syntax error
+        self.assertEqual({row[0] for row in backend.search(parse_query('shoes & | !( <->'), 10, 0)},
+                         {shoes.id, boots.id})
+
+        (audit_id, score, snippet), = backend.search(parse_query('boots'), 10, 0)
+        self.assertEqual(audit_id, boots.id)
+        self.assertGreater(score, 0)
+        self.assertIn('**boots**', snippet)
+
+    def test_index_follows_inserts_and_deletes(self):
+        first = self.record('https://a.example.com/', 'Pricing plans')
+        second = self.record('https://b.example.com/', 'Pricing for teams')
+
+        urls, data = self.search('pricing', limit=1)
+        self.assertEqual(len(urls), 1)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(len(self.search('pricing', limit=1, page=2)[0]), 1)
+
+        first.delete()
+        self.assertEqual(self.search('pricing')[0], ['https://b.example.com/'])
+        self.assertEqual(get_search_backend().indexed([first.id, second.id]), {second.id})
+
+    def test_rebuild_adds_missing_audits_and_access_is_staff_only(self):
+        audit = self.record('https://a.example.com/', 'Pricing plans')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM audit_search')
+        self.assertEqual(self.search('pricing')[0], [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('pricing')[0], [audit.url])
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'pricing'}).status_code, 403)
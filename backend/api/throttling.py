@@ -0,0 +1,261 @@
+"""
+Per-client quotas and admission control for the expensive endpoints.
+
+- TokenBucketThrottle (DRF throttle): each user (or anonymous IP) has a
+  token bucket in the cache; every request spends THROTTLE_ENDPOINT_COSTS
+  tokens for its URL name, so scrapes (page fetch + PageSpeed) and LLM
+  calls drain it faster than cheap local endpoints.
+- AdmissionControlMiddleware: caps expensive requests in flight across all
+  workers sharing the cache and sheds the excess with 503 + Retry-After
+  before workers saturate.
+
+Both use the Django cache, so limits are per process with the default
+local-memory cache and global once a shared cache is configured.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework import exceptions
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import registry
+
+
+FILL_BUCKETS = (0.0, 0.1, 0.25, 0.5, 0.75, 1.0)
+
+
+class TokenBucket:
+    """
+    Token bucket kept in a Django cache as (tokens, updated_at).
+
+    Updates are read-modify-write without a lock, so concurrent requests
+    from the same client in different workers can occasionally both spend
+    the same tokens; the bucket still bounds the sustained rate.
+    """
+
+    def __init__(self, name, capacity, refill_per_second, cache_alias='default', clock=time.time):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.cache_alias = cache_alias
+        self.clock = clock
+        # Idle buckets expire once they would have refilled anyway
+        self.ttl = int(self.capacity / self.refill_per_second) + 60 if self.refill_per_second else None
+
+    def _key(self, ident):
+        return f'throttle:{self.name}:{ident}'
+
+    def _current(self, cache, ident, now):
+        state = cache.get(self._key(ident))
+        if state is None:
+            return self.capacity
+        tokens, updated_at = state
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+
+    def peek(self, ident):
+        """Tokens currently available to ident"""
+        return self._current(caches[self.cache_alias], ident, self.clock())
+
+    def consume(self, ident, cost):
+        """
+        Spend cost tokens if available.
+
+        Returns (allowed, remaining_tokens, retry_after_seconds)
+        """
+        cache = caches[self.cache_alias]
+        now = self.clock()
+        tokens = self._current(cache, ident, now)
+        if tokens >= cost:
+            tokens -= cost
+            cache.set(self._key(ident), (tokens, now), self.ttl)
+            return True, tokens, 0.0
+        if not self.refill_per_second or cost > self.capacity:
+            return False, tokens, None
+        return False, tokens, (cost - tokens) / self.refill_per_second
+
+
+_buckets = {}
+
+
+def get_bucket(scope):
+    """The configured bucket for 'user' or 'anon' clients"""
+    if scope == 'user':
+        capacity, per_minute = settings.THROTTLE_USER_CAPACITY, settings.THROTTLE_USER_REFILL_PER_MINUTE
+    else:
+        capacity, per_minute = settings.THROTTLE_ANON_CAPACITY, settings.THROTTLE_ANON_REFILL_PER_MINUTE
+    config = (capacity, per_minute, settings.THROTTLE_CACHE_ALIAS)
+    bucket = _buckets.get(scope)
+    if bucket is None or bucket.config != config:
+        bucket = _buckets[scope] = TokenBucket(scope, capacity, per_minute / 60.0, settings.THROTTLE_CACHE_ALIAS)
+        bucket.config = config
+    return bucket
+
+
+def endpoint_cost(request):
+    match = getattr(request, 'resolver_match', None)
+    return settings.THROTTLE_ENDPOINT_COSTS.get(match.url_name, 0) if match else 0
+
+
+def client_scope(request, ident_func):
+    """('user', user id) for signed-in users, ('anon', client IP) otherwise"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user', str(user.pk)
+    return 'anon', ident_func(request)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Spend the endpoint's cost from the client's token bucket (429 when empty)"""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        cost = endpoint_cost(request)
+        if not settings.THROTTLE_ENABLED or cost <= 0:
+            return True
+
+        scope, ident = client_scope(request, self.get_ident)
+        bucket = get_bucket(scope)
+        allowed, remaining, self.retry_after = bucket.consume(ident, cost)
+
+        endpoint = request.resolver_match.url_name
+        registry.inc('throttle_decisions_total', endpoint=endpoint, scope=scope,
+                     result='allowed' if allowed else 'throttled')
+        registry.observe('throttle_bucket_fill', remaining / bucket.capacity, buckets=FILL_BUCKETS, scope=scope)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+def api_exception_handler(exc, context):
+    """DRF's handler, with throttling errors in the API's {'success', 'error'} shape"""
+    # rest_framework.views imports the throttle classes above at import time
+    from rest_framework.views import exception_handler
+
+    response = exception_handler(exc, context)
+    if isinstance(exc, exceptions.Throttled) and response is not None:
+        retry_after = math.ceil(exc.wait) if exc.wait is not None else None
+        response.data = {
+            'success': False,
+            'error': 'Rate limit exceeded. Please slow down.',
+            'retry_after': retry_after,
+        }
+    return response
+
+
+class AdmissionController:
+    """
+    Cross-worker cap on concurrent expensive requests.
+
+    Each admitted request leases one of max_in_flight slot keys with
+    cache.add(); leases expire after slot_ttl so a crashed worker cannot
+    leak capacity.
+    """
+
+    def __init__(self, max_in_flight, slot_ttl=120, cache_alias='default'):
+        self.max_in_flight = max_in_flight
+        self.slot_ttl = slot_ttl
+        self.cache_alias = cache_alias
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _count(self, delta):
+        with self._lock:
+            self.in_flight += delta
+            registry.set_gauge('admission_in_flight', self.in_flight)
+
+    def acquire(self):
+        """Return a lease (slot key, token) or None when every slot is taken"""
+        cache = caches[self.cache_alias]
+        token = uuid.uuid4().hex
+        slots = list(range(self.max_in_flight))
+        # Random order spreads concurrent acquirers over the free slots
+        random.shuffle(slots)
+        for slot in slots:
+            key = f'admission:slot:{slot}'
+            if cache.add(key, token, self.slot_ttl):
+                self._count(1)
+                return key, token
+        return None
+
+    def release(self, lease):
+        cache = caches[self.cache_alias]
+        key, token = lease
+        if cache.get(key) == token:
+            cache.delete(key)
+        self._count(-1)
+
+
+class AdmissionControlMiddleware:
+    """Shed expensive requests with 503 + Retry-After once ADMISSION_MAX_IN_FLIGHT are running"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.controller = None
+
+    def get_controller(self):
+        config = (settings.ADMISSION_MAX_IN_FLIGHT, settings.ADMISSION_SLOT_TTL_SECONDS, settings.THROTTLE_CACHE_ALIAS)
+        if self.controller is None or self.controller.config != config:
+            self.controller = AdmissionController(*config)
+            self.controller.config = config
+        return self.controller
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            admission = getattr(request, '_admission', None)
+            if admission is not None:
+                controller, lease = admission
+                controller.release(lease)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.ADMISSION_CONTROL_ENABLED or endpoint_cost(request) < settings.ADMISSION_MIN_COST:
+            return None
+
+        controller = self.get_controller()
+        lease = controller.acquire()
+        if lease is None:
+            registry.inc('admission_rejected_total', endpoint=request.resolver_match.url_name)
+            response = JsonResponse({
+                'success': False,
+                'error': 'The server is busy. Please retry shortly.',
+                'retry_after': settings.ADMISSION_RETRY_AFTER_SECONDS,
+            }, status=503)
+            response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER_SECONDS)
+            return response
+        request._admission = (controller, lease)
+        return None
+
+
+def throttling_summary():
+    """Throttle decisions per endpoint, bucket fill distribution and admission state"""
+    metrics = registry.snapshot()
+    decisions = {}
+    rejected = {}
+    for counter in metrics['counters']:
+        labels = counter['labels']
+        if counter['name'] == 'throttle_decisions_total':
+            entry = decisions.setdefault(labels['endpoint'], {'allowed': 0, 'throttled': 0})
+            entry[labels['result']] += counter['value']
+        elif counter['name'] == 'admission_rejected_total':
+            rejected[labels['endpoint']] = counter['value']
+    fill = {
+        histogram['labels']['scope']: dict(zip(map(str, histogram['buckets']), histogram['counts']))
+        for histogram in metrics['histograms'] if histogram['name'] == 'throttle_bucket_fill'
+    }
+    return {
+        'decisions': decisions,
+        'bucket_fill': fill,
+        'admission': {
+            'in_flight': registry.gauge_value('admission_in_flight') or 0,
+            'max_in_flight': settings.ADMISSION_MAX_IN_FLIGHT,
+            'rejected': rejected,
+        },
+    }
@@ -6,6 +6,16 @@ urlpatterns = [
     path('csrf/', views.get_csrf_token, name='get_csrf_token'),
     path('hello/', views.hello_world, name='hello_world'),
     path('scrape/', views.scrape_website, name='scrape_website'),
+    path('snapshots/<uuid:snapshot_id>/', views.audit_snapshot, name='audit_snapshot'),
+    path('snapshots/<uuid:snapshot_id>/chat/', views.clear_snapshot_chat, name='clear_snapshot_chat'),
+    path('audits/', views.audit_history, name='audit_history'),
+    path('audits/timeline/', views.audit_timeline, name='audit_timeline'),
+    path('audits/<int:audit_id>/', views.audit_record, name='audit_record'),
+    path('search/', views.search_audits, name='search_audits'),
+    path('schedules/', views.audit_schedules, name='audit_schedules'),
+    path('schedules/<int:schedule_id>/', views.audit_schedule, name='audit_schedule'),
+    path('seo/score/', views.seo_score, name='seo_score'),
+    path('seo/keywords/', views.local_keywords, name='local_keywords'),
     
     # AI Optimization endpoints
     path('ai/optimize-title/', views.ai_optimize_title, name='ai_optimize_title'),
@@ -15,6 +25,9 @@ urlpatterns = [
     path('ai/heading-suggestions/', views.ai_heading_suggestions, name='ai_heading_suggestions'),
     path('ai/comprehensive-analysis/', views.ai_comprehensive_analysis, name='ai_comprehensive_analysis'),
     path('ai/chat/', views.ai_chat_about_website, name='ai_chat_about_website'),
+    path('ai/metrics/', views.ai_usage_metrics, name='ai_usage_metrics'),
+    path('quota/', views.quota_status, name='quota_status'),
+    path('profiles/<int:profile_id>/download/', views.download_request_profile, name='download_request_profile'),
     
     # Authentication endpoints
     path('auth/register/', views.register, name='register'),
@@ -1,19 +1,175 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth import login, logout
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import csrf_exempt
 from .scraper import WebScraper
 from .ai_service import GeminiAIService
-from .models import User, OTP
+from .retrieval import get_snapshot_index
+from .scheduler import create_schedule, set_interval
+from .prompt_budget import llm_usage_summary
+from .coalescing import coalesce, coalescing_summary, normalize_url, request_key
+from .caching import cache_summary
+from .metrics import collect_metrics, render_prometheus
+from .resilience import LLMUnavailableError
+from .seo_rules import clean_page, evaluate_page, evaluate_pages
+from .throttling import TokenBucketThrottle, client_scope, get_bucket, throttling_summary
+from .keywords import corpus_provider, extract_keywords
+from .models import User, OTP, AuditSnapshot, AuditRecord, AuditSchedule, RequestProfile
 from .serializers import (
     UserSerializer, RegisterSerializer, VerifyOTPSerializer,
     LoginSerializer, ForgotPasswordSerializer, ResetPasswordSerializer
 )
 from .email_service import EmailService
+import copy
+import hmac
+import zlib
+
+
+def _get_session_key(request, create=False):
+    """Return the session key, optionally creating a session for anonymous users"""
+    if create and not request.session.session_key:
+        request.session.save()
+    return request.session.session_key or ''
+
+
+def _get_owned_snapshot(request, snapshot_id):
+    """
+    Load a snapshot owned by the current user (or anonymous session)
+    and slide its expiry forward.
+
+    Returns (snapshot, error_response)
+    """
+    try:
+        snapshot = AuditSnapshot.objects.get(id=snapshot_id)
+    except (AuditSnapshot.DoesNotExist, ValidationError, ValueError):
+        return None, Response({
+            'success': False,
+            'error': 'Snapshot not found. Please analyze the website again.'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    if snapshot.is_expired():
+        snapshot.delete()
+        return None, Response({
+            'success': False,
+            'error': 'Snapshot has expired. Please analyze the website again.'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    if not snapshot.is_owned_by(request.user, _get_session_key(request)):
+        return None, Response({
+            'success': False,
+            'error': 'You do not have access to this snapshot.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    snapshot.touch()
+    snapshot.save(update_fields=['expires_at', 'last_accessed_at'])
+    return snapshot, None
+
+
+def _get_page_params(request):
+    """(before, limit, error_response) from the cursor and limit query parameters"""
+    try:
+        cursor = request.query_params.get('cursor')
+        before = int(cursor) if cursor else None
+        limit = int(request.query_params.get('limit', settings.AUDIT_HISTORY_PAGE_SIZE))
+    except ValueError:
+        return None, None, Response({
+            'success': False,
+            'error': 'cursor and limit must be integers.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return before, min(max(limit, 1), settings.AUDIT_HISTORY_MAX_PAGE_SIZE), None
+
+
+def _llm_unavailable_response(error):
+    """503 with Retry-After when the LLM circuit is open or calls are saturated"""
+    response = Response({
+        'success': False,
+        'error': str(error),
+        'message': 'The AI service is temporarily unavailable. Please try again shortly.'
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _snapshot_ai_fields(data):
+    """Map stored scrape data onto the request fields used by the AI endpoints"""
+    headings = data.get('headings') or {}
+    return {
+        'current_title': data.get('meta_title', ''),
+        'meta_title': data.get('meta_title', ''),
+        'current_description': data.get('meta_description', ''),
+        'meta_description': data.get('meta_description', ''),
+        'content_preview': data.get('content', ''),
+        'keywords': data.get('meta_keywords', ''),
+        'target_keywords': data.get('meta_keywords', ''),
+        'headings': [heading for items in headings.values() for heading in items],
+        'current_headings': headings,
+        'scraped_data': data,
+    }
+
+
+def _resolve_ai_payload(request):
+    """
+    Build the AI endpoint input from a snapshot_id or from the posted payload.
+    Explicitly posted fields take precedence over snapshot values.
+
+    Returns (payload, snapshot, error_response)
+    """
+    snapshot_id = request.data.get('snapshot_id')
+    if not snapshot_id:
+        return request.data, None, None
+
+    snapshot, error_response = _get_owned_snapshot(request, snapshot_id)
+    if error_response:
+        return None, None, error_response
+
+    payload = _snapshot_ai_fields(snapshot.data)
+    payload.update({key: value for key, value in request.data.items() if key != 'snapshot_id'})
+    return payload, snapshot, None
+
+
+def _text_field(payload, field):
+    """A posted text field as a string; numbers are accepted, anything else is a ValidationError"""
+    value = payload.get(field)
+    if value is None:
+        return ''
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValidationError(f'{field} must be a string')
+    return str(value)
+
+
+def _heading_texts(value):
+    """Posted headings as a flat list of strings: a list, or a dict of lists per tag (as scraped)"""
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = [heading for items in value.values()
+                 for heading in (items if isinstance(items, list) else [items])]
+    if not isinstance(value, list) or not all(isinstance(heading, str) for heading in value):
+        raise ValidationError('headings must be a list of strings or a dict of lists of strings')
+    return value
+
+
+def _local_keywords(payload, snapshot, top_n=15):
+    """
+    Extract keywords from the full stored page text, or the posted content.
+    Raises ValidationError for malformed content, meta_title or headings.
+    """
+    text = (_text_field(payload, 'content') or (snapshot.page_text if snapshot else '')
+            or _text_field(payload, 'content_preview'))
+    return extract_keywords(
+        text,
+        headings=_heading_texts(payload.get('headings')),
+        title=_text_field(payload, 'meta_title'),
+        corpus=corpus_provider.get(),
+        top_n=top_n
+    )
 
 
 @api_view(['GET'])
@@ -87,13 +243,34 @@ def scrape_website(request):
         url = 'https://' + url
     
     try:
-        scraper = WebScraper(url)
-        data = scraper.scrape()
+        def run_scrape():
+            scraper = WebScraper(url)
+            return scraper.scrape(), scraper.get_page_text()
         
-        return Response({
+        # Identical in-flight scrapes of the same URL share one fetch and PSI run; each caller
+        # gets its own copy of the data, since snapshots and audit records may modify theirs
+        (data, page_text), _ = coalesce('scrape', request_key(normalize_url(url)), run_scrape)
+        data = copy.deepcopy(data)
+        
+        snapshot = AuditSnapshot.create_snapshot(
+            data,
+            user=request.user,
+            session_key=_get_session_key(request, create=not request.user.is_authenticated),
+            page_text=page_text
+        )
+        corpus_provider.add_document(page_text)
+        
+        response_data = {
             'success': True,
+            'snapshot_id': str(snapshot.id),
             'data': data
-        }, status=status.HTTP_200_OK)
+        }
+        if settings.AUDIT_HISTORY_ENABLED and request.user.is_authenticated:
+            audit = AuditRecord.record(request.user, data, page_text=page_text)
+            response_data['audit_id'] = audit.id
+            response_data['changes'] = audit.changes
+        
+        return Response(response_data, status=status.HTTP_200_OK)
         
     except Exception as e:
         return Response({
@@ -103,6 +280,380 @@ def scrape_website(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET', 'DELETE'])
+@permission_classes([AllowAny])
+def audit_snapshot(request, snapshot_id):
+    """
+    Retrieve or discard a stored scrape snapshot
+    """
+    snapshot, error_response = _get_owned_snapshot(request, snapshot_id)
+    if error_response:
+        return error_response
+    
+    if request.method == 'DELETE':
+        snapshot.delete()
+        return Response({
+            'success': True,
+            'message': 'Snapshot deleted.'
+        }, status=status.HTTP_200_OK)
+    
+    return Response({
+        'success': True,
+        'snapshot_id': str(snapshot.id),
+        'data': snapshot.data,
+        'chat_history': snapshot.chat_history,
+        'expires_at': snapshot.expires_at
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['DELETE'])
+@permission_classes([AllowAny])
+def clear_snapshot_chat(request, snapshot_id):
+    """
+    Clear the server-side chat history of a snapshot
+    """
+    snapshot, error_response = _get_owned_snapshot(request, snapshot_id)
+    if error_response:
+        return error_response
+    
+    snapshot.chat_history = []
+    snapshot.save(update_fields=['chat_history', 'last_accessed_at'])
+    return Response({
+        'success': True,
+        'message': 'Chat history cleared.'
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def audit_history(request):
+    """
+    The signed-in user's past audits, newest first (summaries only)
+    
+    Query parameters:
+        url: only audits of this page
+        cursor: next_cursor of the previous page
+        limit: page size (default AUDIT_HISTORY_PAGE_SIZE)
+    """
+    before, limit, error_response = _get_page_params(request)
+    if error_response:
+        return error_response
+    
+    audits, next_cursor = AuditRecord.history(
+        request.user, url=request.query_params.get('url'), before=before, limit=limit
+    )
+    return Response({
+        'success': True,
+        'audits': audits,
+        'next_cursor': next_cursor
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def audit_timeline(request):
+    """
+    What changed between the signed-in user's audits of one page, newest first
+    
+    Query parameters:
+        url: the audited page (required)
+        cursor, limit: as for the audit history
+    """
+    url = request.query_params.get('url')
+    if not url:
+        return Response({
+            'success': False,
+            'error': 'url is required.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    before, limit, error_response = _get_page_params(request)
+    if error_response:
+        return error_response
+    
+    timeline, next_cursor = AuditRecord.timeline(request.user, url, before=before, limit=limit)
+    return Response({
+        'success': True,
+        'timeline': timeline,
+        'next_cursor': next_cursor
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def audit_record(request, audit_id):
+    """
+    Retrieve or delete one audit of the signed-in user's history
+    """
+    audits = AuditRecord.objects.filter(pk=audit_id, user=request.user)
+    
+    if request.method == 'DELETE':
+        if not audits.delete()[0]:
+            return Response({
+                'success': False,
+                'error': 'Audit not found.'
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'success': True,
+            'message': 'Audit deleted.'
+        }, status=status.HTTP_200_OK)
+    
+    audit = audits.first()
+    if audit is None:
+        return Response({
+            'success': False,
+            'error': 'Audit not found.'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'success': True,
+        'audit_id': audit.id,
+        'created_at': audit.created_at,
+        'data': audit.get_data()
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search_audits(request):
+    """
+    Full-text search over every user's stored audits, best match first (staff only)
+    
+    Query parameters:
+        q: words must all appear, "quoted phrases" as written, -word excludes
+        page, limit: pagination (limit defaults to SEARCH_PAGE_SIZE)
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({
+            'success': False,
+            'error': 'q is required.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        limit = min(max(int(request.query_params.get('limit', settings.SEARCH_PAGE_SIZE)), 1), 100)
+    except ValueError:
+        return Response({
+            'success': False,
+            'error': 'page and limit must be integers.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    offset = (page - 1) * limit
+    if offset + limit > settings.SEARCH_MAX_RESULTS:
+        return Response({
+            'success': False,
+            'error': f'Only the first {settings.SEARCH_MAX_RESULTS} results can be paged through; refine the query.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    results, has_more = AuditRecord.search(query, limit=limit, offset=offset)
+    return Response({
+        'success': True,
+        'results': results,
+        'page': page,
+        'has_more': has_more
+    }, status=status.HTTP_200_OK)
+
+
+SCHEDULE_FIELDS = ('id', 'url', 'interval_minutes', 'is_active', 'next_run_at', 'last_enqueued_at', 'created_at')
+
+
+def _schedule_data(schedule):
+    return {field: getattr(schedule, field) for field in SCHEDULE_FIELDS}
+
+
+def _validate_interval(value):
+    """(interval_minutes, error_response)"""
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        interval = 0
+    if interval < settings.SCHEDULER_MIN_INTERVAL_MINUTES:
+        return None, Response({
+            'success': False,
+            'error': f'interval_minutes must be a whole number of at least {settings.SCHEDULER_MIN_INTERVAL_MINUTES}.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return interval, None
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def audit_schedules(request):
+    """
+    List the signed-in user's scheduled re-audits, or schedule one
+    
+    Request body (POST):
+    {
+        "url": "https://example.com",
+        "interval_minutes": 1440
+    }
+    """
+    if request.method == 'GET':
+        schedules = AuditSchedule.objects.filter(user=request.user).order_by('id').values(*SCHEDULE_FIELDS)
+        return Response({
+            'success': True,
+            'schedules': list(schedules)
+        }, status=status.HTTP_200_OK)
+    
+    url = request.data.get('url')
+    if not url:
+        return Response({
+            'success': False,
+            'error': 'URL is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    interval, error_response = _validate_interval(request.data.get('interval_minutes'))
+    if error_response:
+        return error_response
+    
+    schedules = AuditSchedule.objects.filter(user=request.user)
+    if schedules.filter(url_hash=AuditRecord.hash_url(url)).exists():
+        return Response({
+            'success': False,
+            'error': 'This page is already scheduled.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if schedules.count() >= settings.SCHEDULER_MAX_SCHEDULES_PER_USER:
+        return Response({
+            'success': False,
+            'error': f'You can schedule at most {settings.SCHEDULER_MAX_SCHEDULES_PER_USER} pages.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    schedule = create_schedule(request.user, url, interval)
+    return Response({
+        'success': True,
+        'schedule': _schedule_data(schedule)
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def audit_schedule(request, schedule_id):
+    """
+    Change (interval_minutes, is_active) or remove a scheduled re-audit
+    """
+    schedule = AuditSchedule.objects.filter(pk=schedule_id, user=request.user).first()
+    if schedule is None:
+        return Response({
+            'success': False,
+            'error': 'Schedule not found.'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method == 'DELETE':
+        schedule.delete()
+        return Response({
+            'success': True,
+            'message': 'Schedule deleted.'
+        }, status=status.HTTP_200_OK)
+    
+    if 'interval_minutes' in request.data:
+        interval, error_response = _validate_interval(request.data['interval_minutes'])
+        if error_response:
+            return error_response
+        set_interval(schedule, interval)
+    if 'is_active' in request.data:
+        schedule.is_active = str(request.data['is_active']).lower() in ('true', '1')
+    schedule.save()
+    return Response({
+        'success': True,
+        'schedule': _schedule_data(schedule)
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def seo_score(request):
+    """
+    Score pages with the local SEO rule engine (no AI call)
+    
+    Request body, one of:
+    {"snapshot_id": "..."}
+    {"scraped_data": {...}}
+    {"pages": [{...}, {...}]}
+    """
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    pages = payload.get('pages')
+    if pages is not None:
+        if not isinstance(pages, list):
+            return Response({
+                'success': False,
+                'error': 'pages must be a list of scraped page objects'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(pages) > settings.SEO_SCORE_MAX_PAGES:
+            return Response({
+                'success': False,
+                'error': f'At most {settings.SEO_SCORE_MAX_PAGES} pages can be scored per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            pages = [clean_page(page) for page in pages]
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': f'Invalid page: {e}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'success': True,
+            'reports': evaluate_pages(pages)
+        }, status=status.HTTP_200_OK)
+    
+    scraped_data = payload.get('scraped_data')
+    if not isinstance(scraped_data, dict) or not scraped_data:
+        return Response({
+            'success': False,
+            'error': 'snapshot_id, scraped_data or pages is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        scraped_data = clean_page(scraped_data)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'error': f'Invalid scraped_data: {e}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'success': True,
+        'report': evaluate_page(scraped_data)
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def local_keywords(request):
+    """
+    Extract ranked keywords locally with TF-IDF and RAKE (no AI call)
+    
+    Request body, one of:
+    {"snapshot_id": "..."}
+    {"content": "...", "meta_title": "...", "headings": [...]}
+    """
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    if not (snapshot or payload.get('content') or payload.get('content_preview')):
+        return Response({
+            'success': False,
+            'error': 'snapshot_id or content is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        top_n = min(max(int(payload.get('top_n', 15)), 1), 50)
+    except (TypeError, ValueError):
+        top_n = 15
+    
+    try:
+        keywords = _local_keywords(payload, snapshot, top_n=top_n)
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'error': e.message
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'success': True,
+        'keywords': keywords
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def ai_optimize_title(request):
@@ -125,10 +676,14 @@ def ai_optimize_title(request):
             'message': 'Please add GEMINI_API_KEY to your environment variables'
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    current_title = request.data.get('current_title', '')
-    meta_description = request.data.get('meta_description', '')
-    content_preview = request.data.get('content_preview', '')
-    keywords = request.data.get('keywords', '')
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    current_title = payload.get('current_title', '')
+    meta_description = payload.get('meta_description', '')
+    content_preview = payload.get('content_preview', '')
+    keywords = payload.get('keywords', '')
     
     try:
         suggestions = ai_service.generate_meta_title(
@@ -146,6 +701,8 @@ def ai_optimize_title(request):
             'suggestions': suggestions
         }, status=status.HTTP_200_OK)
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -167,10 +724,14 @@ def ai_optimize_description(request):
             'message': 'Please add GEMINI_API_KEY to your environment variables'
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    current_description = request.data.get('current_description', '')
-    meta_title = request.data.get('meta_title', '')
-    content_preview = request.data.get('content_preview', '')
-    keywords = request.data.get('keywords', '')
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    current_description = payload.get('current_description', '')
+    meta_title = payload.get('meta_title', '')
+    content_preview = payload.get('content_preview', '')
+    keywords = payload.get('keywords', '')
     
     try:
         suggestions = ai_service.generate_meta_description(
@@ -188,6 +749,8 @@ def ai_optimize_description(request):
             'suggestions': suggestions
         }, status=status.HTTP_200_OK)
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -209,14 +772,23 @@ def ai_generate_keywords(request):
             'message': 'Please add GEMINI_API_KEY to your environment variables'
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    meta_title = request.data.get('meta_title', '')
-    meta_description = request.data.get('meta_description', '')
-    content_preview = request.data.get('content_preview', '')
-    headings = request.data.get('headings', [])
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    meta_title = payload.get('meta_title', '')
+    meta_description = payload.get('meta_description', '')
+    content_preview = payload.get('content_preview', '')
+    headings = payload.get('headings', [])
     
     try:
+        hints = None
+        if payload.get('use_local_hints', True):
+            local = _local_keywords(payload, snapshot, top_n=10)
+            hints = [item['phrase'] for item in local['phrases']] + [item['term'] for item in local['unigrams']]
+        
         keywords = ai_service.generate_keywords(
-            meta_title, meta_description, content_preview, headings
+            meta_title, meta_description, content_preview, headings, hints=hints
         )
         
         if isinstance(keywords, dict) and 'error' in keywords:
@@ -230,6 +802,13 @@ def ai_generate_keywords(request):
             'keywords': keywords
         }, status=status.HTTP_200_OK)
         
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'error': e.message
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -251,10 +830,14 @@ def ai_content_improvements(request):
             'message': 'Please add GEMINI_API_KEY to your environment variables'
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    content_preview = request.data.get('content_preview', '')
-    meta_title = request.data.get('meta_title', '')
-    headings = request.data.get('headings', [])
-    target_keywords = request.data.get('target_keywords', '')
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    content_preview = payload.get('content_preview', '')
+    meta_title = payload.get('meta_title', '')
+    headings = payload.get('headings', [])
+    target_keywords = payload.get('target_keywords', '')
     
     try:
         improvements = ai_service.generate_content_improvements(
@@ -272,6 +855,8 @@ def ai_content_improvements(request):
             'improvements': improvements
         }, status=status.HTTP_200_OK)
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -293,9 +878,13 @@ def ai_heading_suggestions(request):
             'message': 'Please add GEMINI_API_KEY to your environment variables'
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    current_headings = request.data.get('current_headings', {})
-    meta_title = request.data.get('meta_title', '')
-    content_preview = request.data.get('content_preview', '')
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    current_headings = payload.get('current_headings', {})
+    meta_title = payload.get('meta_title', '')
+    content_preview = payload.get('content_preview', '')
     
     try:
         suggestions = ai_service.generate_heading_suggestions(
@@ -313,6 +902,8 @@ def ai_heading_suggestions(request):
             'suggestions': suggestions
         }, status=status.HTTP_200_OK)
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -334,7 +925,17 @@ def ai_comprehensive_analysis(request):
             'message': 'Please add GEMINI_API_KEY to your environment variables'
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    scraped_data = request.data.get('scraped_data', {})
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    try:
+        scraped_data = clean_page(payload.get('scraped_data', {}))
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'error': f'Invalid scraped_data: {e}'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
     try:
         analysis = ai_service.generate_comprehensive_analysis(scraped_data)
@@ -350,6 +951,8 @@ def ai_comprehensive_analysis(request):
             'analysis': analysis
         }, status=status.HTTP_200_OK)
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -366,9 +969,11 @@ def ai_chat_about_website(request):
     Request body:
     {
         "question": "user's question",
-        "scraped_data": {...},
-        "chat_history": [...]
+        "snapshot_id": "..."
     }
+    
+    When snapshot_id is given, the chat history is kept server-side.
+    Otherwise "scraped_data" and "chat_history" must be posted.
     """
     ai_service = GeminiAIService()
     
@@ -378,9 +983,13 @@ def ai_chat_about_website(request):
             'message': 'Please add GEMINI_API_KEY to your environment variables'
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
-    question = request.data.get('question', '')
-    scraped_data = request.data.get('scraped_data', {})
-    chat_history = request.data.get('chat_history', [])
+    payload, snapshot, error_response = _resolve_ai_payload(request)
+    if error_response:
+        return error_response
+    
+    question = payload.get('question', '')
+    scraped_data = payload.get('scraped_data', {})
+    chat_history = snapshot.chat_history if snapshot else payload.get('chat_history', [])
     
     if not question:
         return Response({
@@ -389,7 +998,8 @@ def ai_chat_about_website(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        result = ai_service.chat_about_website(question, scraped_data, chat_history)
+        page_index = get_snapshot_index(snapshot) if snapshot else None
+        result = ai_service.chat_about_website(question, scraped_data, chat_history, page_index)
         
         if isinstance(result, dict) and 'error' in result:
             return Response({
@@ -397,6 +1007,11 @@ def ai_chat_about_website(request):
                 'error': result['error']
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+        if snapshot:
+            snapshot.append_chat('user', question)
+            snapshot.append_chat('assistant', result['answer'])
+            snapshot.save(update_fields=['chat_history', 'last_accessed_at'])
+        
         return Response({
             'success': True,
             'answer': result['answer'],
@@ -404,6 +1019,8 @@ def ai_chat_about_website(request):
             'original_question': result.get('original_question', question)
         }, status=status.HTTP_200_OK)
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -411,6 +1028,76 @@ def ai_chat_about_website(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def ai_usage_metrics(request):
+    """
+    Per-endpoint LLM call counts, token usage, prompt size and latency,
+    duplicate executions avoided by request coalescing, throttling /
+    admission decisions and two-level cache hit rates, for this process
+    (staff only)
+    """
+    return Response({
+        'success': True,
+        'endpoints': llm_usage_summary(),
+        'coalescing': coalescing_summary(),
+        'throttling': throttling_summary(),
+        'caches': cache_summary()
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def quota_status(request):
+    """
+    The caller's current request quota and what each endpoint costs
+    """
+    scope, ident = client_scope(request, TokenBucketThrottle().get_ident)
+    bucket = get_bucket(scope)
+    return Response({
+        'success': True,
+        'enabled': settings.THROTTLE_ENABLED,
+        'scope': scope,
+        'tokens': round(bucket.peek(ident), 2),
+        'capacity': bucket.capacity,
+        'refill_per_minute': bucket.refill_per_second * 60,
+        'costs': settings.THROTTLE_ENDPOINT_COSTS
+    }, status=status.HTTP_200_OK)
+
+
+def prometheus_metrics(request):
+    """
+    Counters, gauges and latency histograms of every worker on this node in
+    the Prometheus text format. Open to staff sessions and to scrapers
+    sending "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not token_ok and not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({'success': False, 'error': 'Not authorized.'}, status=403)
+
+    return HttpResponse(render_prometheus(collect_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def download_request_profile(request, profile_id):
+    """
+    Raw CPU profile of a stored request profile, for pstats / snakeviz (staff only)
+    """
+    profile = RequestProfile.objects.filter(pk=profile_id).first()
+    if profile is None:
+        return Response({
+            'success': False,
+            'error': 'Profile not found.'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    response = HttpResponse(zlib.decompress(profile.profile_data), content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="request-profile-{profile.pk}.prof"'
+    return response
+
+
 # ==================== Authentication Endpoints ====================
 
 @api_view(['POST'])
@@ -442,9 +1129,9 @@ def register(request):
             is_verified=False
         )
         
-        # Generate and send OTP
+        # Generate OTP and queue the email (delivered in the background)
         otp = OTP.create_otp(email, 'registration')
-        email_sent = EmailService.send_otp_email(email, otp.otp_code, 'registration')
+        email_sent = EmailService.queue_otp_email(email, otp.otp_code, 'registration')
         
         return Response({
             'success': True,
@@ -512,8 +1199,8 @@ def verify_otp(request):
         user.is_verified = True
         user.save()
         
-        # Log the user in
-        login(request, user)
+        # Log the user in (fetched directly, so the backend has to be named)
+        login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
         
         return Response({
             'success': True,
@@ -564,9 +1251,9 @@ def resend_otp(request):
                 'error': 'Email already verified.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Generate and send new OTP
+        # Generate new OTP and queue the email
         otp = OTP.create_otp(email, otp_type)
-        email_sent = EmailService.send_otp_email(email, otp.otp_code, otp_type)
+        email_sent = EmailService.queue_otp_email(email, otp.otp_code, otp_type)
         
         return Response({
             'success': True,
@@ -647,9 +1334,9 @@ def forgot_password(request):
     email = serializer.validated_data['email']
     
     try:
-        # Generate and send OTP
+        # Generate OTP and queue the email (delivered in the background)
         otp = OTP.create_otp(email, 'password_reset')
-        email_sent = EmailService.send_otp_email(email, otp.otp_code, 'password_reset')
+        email_sent = EmailService.queue_otp_email(email, otp.otp_code, 'password_reset')
         
         return Response({
             'success': True,
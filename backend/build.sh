@@ -12,5 +12,8 @@ python manage.py collectstatic --no-input
 echo "🗄️ Running database migrations..."
 python manage.py migrate
 
+echo "🗃️ Creating cache table (used when CACHE_BACKEND=db)..."
+python manage.py createcachetable
+
 echo "✅ Build completed successfully!"
 
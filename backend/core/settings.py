@@ -79,6 +79,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files in production
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -86,8 +87,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.throttling.AdmissionControlMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -133,6 +136,52 @@ else:
     }
 
 
+# Cache
+# CACHE_BACKEND: 'locmem' (per process), 'file' or 'db' (shared by the processes on one node,
+# `manage.py createcachetable` for 'db'), 'redis' or 'memcached' (shared across nodes), or the
+# dotted path of any cache backend class. CACHE_LOCATION is the backend's LOCATION.
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'sitescope'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'django_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+}
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+_cache_class, _cache_location = CACHE_BACKENDS.get(CACHE_BACKEND, (CACHE_BACKEND, ''))
+CACHES = {
+    'default': {
+        'BACKEND': _cache_class,
+        'LOCATION': config('CACHE_LOCATION', default=_cache_location),
+        'TIMEOUT': config('CACHE_TIMEOUT_SECONDS', default=300, cast=int),
+        'KEY_PREFIX': config('CACHE_KEY_PREFIX', default='sitescope'),
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file', 'db'):
+    # These backends cull a third of their entries once MAX_ENTRIES (default 300) is reached
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int)}
+
+# A per-process cache only stays coherent with a single worker process (gunicorn's default,
+# WEB_CONCURRENCY raises it): a logout or password change in one worker would not reach the
+# others' copies. Cached sessions and users are only on by default when that holds.
+CACHE_IS_COHERENT = CACHE_BACKEND != 'locmem' or config('WEB_CONCURRENCY', default=1, cast=int) <= 1
+
+# Sessions are written through to the database and read from the cache
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.cached_db' if CACHE_IS_COHERENT else 'django.contrib.sessions.backends.db',
+)
+
+# The session's user is looked up in the cache instead of the users table on every request.
+# ModelBackend stays listed so sessions created before the cached backend still resolve.
+AUTHENTICATION_BACKENDS = [
+    'api.authentication.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USER_CACHE_ALIAS = config('AUTH_USER_CACHE_ALIAS', default='default')
+AUTH_USER_CACHE_SECONDS = config('AUTH_USER_CACHE_SECONDS', default=300 if CACHE_IS_COHERENT else 0, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -229,4 +278,176 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'api.authentication.CsrfExemptSessionAuthentication',  # Custom class without CSRF
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
+    'EXCEPTION_HANDLER': 'api.throttling.api_exception_handler',
+    # Reverse proxies in front of the app. Anonymous clients are throttled by IP: with 0 that is
+    # REMOTE_ADDR, otherwise the X-Forwarded-For entry the outermost trusted proxy added. Never
+    # leave it unset - DRF would then key on the whole, client-controlled X-Forwarded-For.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
+
+# Audit Snapshots (server-side scrape results referenced by AI endpoints)
+AUDIT_SNAPSHOT_TTL_MINUTES = config('AUDIT_SNAPSHOT_TTL_MINUTES', default=60, cast=int)
+AUDIT_SNAPSHOT_MAX_PER_OWNER = config('AUDIT_SNAPSHOT_MAX_PER_OWNER', default=20, cast=int)
+AUDIT_SNAPSHOT_CHAT_HISTORY_LIMIT = config('AUDIT_SNAPSHOT_CHAT_HISTORY_LIMIT', default=20, cast=int)
+CHAT_RETRIEVAL_TOP_K = config('CHAT_RETRIEVAL_TOP_K', default=4, cast=int)
+
+# Audit history (every scrape by a signed-in user, kept compressed; /api/audits/)
+AUDIT_HISTORY_ENABLED = config('AUDIT_HISTORY_ENABLED', default=True, cast=bool)
+AUDIT_HISTORY_PAGE_SIZE = config('AUDIT_HISTORY_PAGE_SIZE', default=20, cast=int)
+AUDIT_HISTORY_MAX_PAGE_SIZE = config('AUDIT_HISTORY_MAX_PAGE_SIZE', default=100, cast=int)
+
+# Full-text search over stored audits (api.search, staff only: /api/search/). Up to
+# SEARCH_CONTENT_MAX_CHARS of each page's text is indexed; results are paged, at most
+# SEARCH_MAX_RESULTS deep.
+SEARCH_ENABLED = config('SEARCH_ENABLED', default=True, cast=bool)
+SEARCH_CONTENT_MAX_CHARS = config('SEARCH_CONTENT_MAX_CHARS', default=50000, cast=int)
+SEARCH_PAGE_SIZE = config('SEARCH_PAGE_SIZE', default=20, cast=int)
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=1000, cast=int)
+
+# Scheduled re-audits (api.scheduler): `manage.py run_scheduler` turns due schedules into audit jobs
+# every SCHEDULER_TICK_SECONDS, `manage.py run_audit_jobs` runs them. Each run starts up to
+# SCHEDULER_MAX_JITTER_SECONDS (and at most SCHEDULER_JITTER_FRACTION of the interval) after its slot;
+# at most SCHEDULER_MAX_ENQUEUE_PER_MINUTE jobs are enqueued per minute across all schedulers, and
+# audits of one host start at least SCHEDULER_HOST_SPACING_SECONDS apart. A run more than
+# SCHEDULER_MISSED_GRACE_MINUTES late (scheduler downtime) was missed: SCHEDULER_CATCH_UP 'once'
+# runs it once however many slots were missed, 'skip' waits for the next slot.
+SCHEDULER_TICK_SECONDS = config('SCHEDULER_TICK_SECONDS', default=10, cast=float)
+SCHEDULER_BATCH_SIZE = config('SCHEDULER_BATCH_SIZE', default=500, cast=int)
+SCHEDULER_MAX_ENQUEUE_PER_MINUTE = config('SCHEDULER_MAX_ENQUEUE_PER_MINUTE', default=120, cast=int)
+SCHEDULER_MAX_JITTER_SECONDS = config('SCHEDULER_MAX_JITTER_SECONDS', default=600, cast=int)
+SCHEDULER_JITTER_FRACTION = config('SCHEDULER_JITTER_FRACTION', default=0.1, cast=float)
+SCHEDULER_HOST_SPACING_SECONDS = config('SCHEDULER_HOST_SPACING_SECONDS', default=30, cast=int)
+SCHEDULER_MISSED_GRACE_MINUTES = config('SCHEDULER_MISSED_GRACE_MINUTES', default=30, cast=int)
+SCHEDULER_CATCH_UP = config('SCHEDULER_CATCH_UP', default='once')
+SCHEDULER_MIN_INTERVAL_MINUTES = config('SCHEDULER_MIN_INTERVAL_MINUTES', default=60, cast=int)
+SCHEDULER_MAX_SCHEDULES_PER_USER = config('SCHEDULER_MAX_SCHEDULES_PER_USER', default=50, cast=int)
+SCHEDULER_JOB_BATCH_SIZE = config('SCHEDULER_JOB_BATCH_SIZE', default=5, cast=int)
+SCHEDULER_JOB_MAX_ATTEMPTS = config('SCHEDULER_JOB_MAX_ATTEMPTS', default=3, cast=int)
+SCHEDULER_JOB_RETRY_SECONDS = config('SCHEDULER_JOB_RETRY_SECONDS', default=300, cast=int)
+SCHEDULER_JOB_CLAIM_SECONDS = config('SCHEDULER_JOB_CLAIM_SECONDS', default=600, cast=int)
+SCHEDULER_JOB_RETENTION_DAYS = config('SCHEDULER_JOB_RETENTION_DAYS', default=7, cast=int)
+
+# AI prompt sizing: estimated input tokens allowed per prompt before sections are trimmed
+AI_PROMPT_TOKEN_BUDGET = config('AI_PROMPT_TOKEN_BUDGET', default=3000, cast=int)
+# Longest user question (estimated tokens) passed on to a prompt; the rest is cut
+AI_QUESTION_MAX_TOKENS = config('AI_QUESTION_MAX_TOKENS', default=500, cast=int)
+
+# AI call resilience (per process): timeouts, retries, circuit breaker and concurrency cap
+AI_CALL_TIMEOUT_SECONDS = config('AI_CALL_TIMEOUT_SECONDS', default=20.0, cast=float)
+AI_CALL_DEADLINE_SECONDS = config('AI_CALL_DEADLINE_SECONDS', default=45.0, cast=float)
+AI_RETRY_ATTEMPTS = config('AI_RETRY_ATTEMPTS', default=2, cast=int)
+AI_RETRY_BACKOFF_SECONDS = config('AI_RETRY_BACKOFF_SECONDS', default=0.5, cast=float)
+AI_RETRY_BACKOFF_MAX_SECONDS = config('AI_RETRY_BACKOFF_MAX_SECONDS', default=4.0, cast=float)
+AI_CIRCUIT_FAILURE_THRESHOLD = config('AI_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+AI_CIRCUIT_RESET_SECONDS = config('AI_CIRCUIT_RESET_SECONDS', default=30.0, cast=float)
+AI_MAX_CONCURRENT_CALLS = config('AI_MAX_CONCURRENT_CALLS', default=4, cast=int)
+AI_CONCURRENCY_WAIT_SECONDS = config('AI_CONCURRENCY_WAIT_SECONDS', default=2.0, cast=float)
+
+# Request coalescing: share one execution between identical in-flight scrape / AI requests.
+# Cross-worker coalescing needs a cache shared by all workers.
+REQUEST_COALESCING_CROSS_WORKER = config('REQUEST_COALESCING_CROSS_WORKER', default=False, cast=bool)
+REQUEST_COALESCING_CACHE_ALIAS = config('REQUEST_COALESCING_CACHE_ALIAS', default='default')
+
+# Local keyword extraction: background corpus for IDF, rebuilt off the request path from the
+# most recently stored audits (the search index text when search is enabled)
+KEYWORD_CORPUS_MAX_DOCUMENTS = config('KEYWORD_CORPUS_MAX_DOCUMENTS', default=2000, cast=int)
+KEYWORD_CORPUS_REFRESH_SECONDS = config('KEYWORD_CORPUS_REFRESH_SECONDS', default=3600, cast=int)
+
+# LLM provider: 'gemini' (GEMINI_API_KEY in api/.env), 'fake' (in-process, deterministic)
+# or 'http' (a server speaking the fake LLM protocol, e.g. manage.py run_fake_llm)
+LLM_PROVIDER = config('LLM_PROVIDER', default='gemini')
+LLM_GEMINI_MODEL = config('LLM_GEMINI_MODEL', default='gemini-2.5-flash')
+LLM_HTTP_BASE_URL = config('LLM_HTTP_BASE_URL', default='http://127.0.0.1:8765')
+LLM_FAKE_LATENCY_SECONDS = config('LLM_FAKE_LATENCY_SECONDS', default=0.0, cast=float)
+LLM_FAKE_JITTER_SECONDS = config('LLM_FAKE_JITTER_SECONDS', default=0.0, cast=float)
+LLM_FAKE_ERROR_RATE = config('LLM_FAKE_ERROR_RATE', default=0.0, cast=float)
+
+# Scraper: leave nav, aside and footer text out of the page content excerpt
+SCRAPE_CONTENT_SKIP_BOILERPLATE = config('SCRAPE_CONTENT_SKIP_BOILERPLATE', default=False, cast=bool)
+# Structured data: JSON-LD blocks longer than JSON_LD_MAX_CHARS are skipped, and at most
+# STRUCTURED_DATA_MAX_ITEMS JSON-LD blocks and microdata items are kept per page
+SCRAPE_JSON_LD_MAX_CHARS = config('SCRAPE_JSON_LD_MAX_CHARS', default=100000, cast=int)
+SCRAPE_STRUCTURED_DATA_MAX_ITEMS = config('SCRAPE_STRUCTURED_DATA_MAX_ITEMS', default=50, cast=int)
+
+# PageSpeed Insights endpoint (PAGE_INSIGHTS_API_KEY in api/.env); manage.py loadtest points it at a stand-in
+PAGESPEED_API_URL = config('PAGESPEED_API_URL', default='https://www.googleapis.com/pagespeedonline/v5/runPagespeed')
+
+# Per-client token buckets (user id, or IP for anonymous clients). Each request spends
+# THROTTLE_ENDPOINT_COSTS tokens for its URL name; endpoints not listed are free.
+THROTTLE_ENABLED = config('THROTTLE_ENABLED', default=True, cast=bool)
+THROTTLE_CACHE_ALIAS = config('THROTTLE_CACHE_ALIAS', default='default')
+THROTTLE_ANON_CAPACITY = config('THROTTLE_ANON_CAPACITY', default=40, cast=int)
+THROTTLE_ANON_REFILL_PER_MINUTE = config('THROTTLE_ANON_REFILL_PER_MINUTE', default=20, cast=float)
+THROTTLE_USER_CAPACITY = config('THROTTLE_USER_CAPACITY', default=80, cast=int)
+THROTTLE_USER_REFILL_PER_MINUTE = config('THROTTLE_USER_REFILL_PER_MINUTE', default=40, cast=float)
+THROTTLE_ENDPOINT_COSTS = {
+    'scrape_website': 10,            # page fetch + two PageSpeed Insights runs
+    'ai_comprehensive_analysis': 6,
+    'ai_optimize_title': 4,
+    'ai_optimize_description': 4,
+    'ai_generate_keywords': 4,
+    'ai_content_improvements': 4,
+    'ai_heading_suggestions': 4,
+    'ai_chat_about_website': 3,
+    'local_keywords': 1,
+    'seo_score': 1,
+}
+
+# /api/seo/score/ scores at most this many posted pages per request (one throttle token)
+SEO_SCORE_MAX_PAGES = config('SEO_SCORE_MAX_PAGES', default=100, cast=int)
+
+# Admission control: at most ADMISSION_MAX_IN_FLIGHT requests to endpoints costing at least
+# ADMISSION_MIN_COST run at once (across workers when the cache is shared); the rest get 503.
+ADMISSION_CONTROL_ENABLED = config('ADMISSION_CONTROL_ENABLED', default=True, cast=bool)
+ADMISSION_MAX_IN_FLIGHT = config('ADMISSION_MAX_IN_FLIGHT', default=8, cast=int)
+ADMISSION_MIN_COST = config('ADMISSION_MIN_COST', default=3, cast=int)
+ADMISSION_SLOT_TTL_SECONDS = config('ADMISSION_SLOT_TTL_SECONDS', default=120, cast=int)
+ADMISSION_RETRY_AFTER_SECONDS = config('ADMISSION_RETRY_AFTER_SECONDS', default=5, cast=int)
+
+# Email outbox: OTP emails are queued in the email_outbox table and delivered in batches over
+# one SMTP connection. 'thread' delivers from a background thread in each web process,
+# 'worker' leaves delivery to `manage.py send_outbox_emails`, 'inline' sends during the request.
+EMAIL_OUTBOX_MODE = config('EMAIL_OUTBOX_MODE', default='thread')
+EMAIL_OUTBOX_BATCH_SIZE = config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_OUTBOX_RETRY_SECONDS = config('EMAIL_OUTBOX_RETRY_SECONDS', default=30, cast=int)
+EMAIL_OUTBOX_CLAIM_SECONDS = config('EMAIL_OUTBOX_CLAIM_SECONDS', default=300, cast=int)
+EMAIL_OUTBOX_POLL_SECONDS = config('EMAIL_OUTBOX_POLL_SECONDS', default=10, cast=float)
+EMAIL_OUTBOX_LINGER_SECONDS = config('EMAIL_OUTBOX_LINGER_SECONDS', default=5, cast=float)
+# Delivered emails have their body (the OTP) blanked; sent and failed rows are deleted after this
+EMAIL_OUTBOX_RETENTION_DAYS = config('EMAIL_OUTBOX_RETENTION_DAYS', default=7, cast=int)
+
+# Expired OTPs are deleted in bounded batches: one batch whenever an OTP is created, and in
+# bulk by `manage.py purge_otps` (e.g. from a cron job)
+OTP_PURGE_BATCH_SIZE = config('OTP_PURGE_BATCH_SIZE', default=100, cast=int)
+
+# Two-level caches (api.caching): a per-process LRU of up to LOCAL_MAX_ENTRIES entries per namespace
+# in front of the Django cache TWO_LEVEL_CACHE_ALIAS. Local copies live at most LOCAL_TTL_SECONDS,
+# which bounds how long a process can serve a value deleted or invalidated by another process.
+TWO_LEVEL_CACHE_ALIAS = config('TWO_LEVEL_CACHE_ALIAS', default='default')
+TWO_LEVEL_CACHE_LOCAL_MAX_ENTRIES = config('TWO_LEVEL_CACHE_LOCAL_MAX_ENTRIES', default=1024, cast=int)
+TWO_LEVEL_CACHE_LOCAL_TTL_SECONDS = config('TWO_LEVEL_CACHE_LOCAL_TTL_SECONDS', default=30, cast=float)
+
+# Metrics: GET /metrics serves every worker's metrics in the Prometheus text format to staff
+# sessions and to "Authorization: Bearer METRICS_TOKEN". Workers on one node share them through
+# METRICS_DIR (written at most every METRICS_FLUSH_SECONDS); when unset /metrics shows only the
+# worker that answers. Responses to staff (and to everyone with METRICS_SERVER_TIMING or DEBUG)
+# carry the request's stage timings (fetch, parse, extractors, PageSpeed strategies, LLM calls) in
+# a Server-Timing header; leave it off where clients aren't trusted, it exposes backend internals.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5.0, cast=float)
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=False, cast=bool)
+
+# Request profiling (api.profiling): with PROFILING_ENABLED, requests from staff users sending the
+# PROFILING_HEADER header, plus a random PROFILING_SAMPLE_RATE share of all requests, are profiled
+# and stored as RequestProfile rows (see the admin). Disabled, the middleware is not loaded at all.
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_HEADER = config('PROFILING_HEADER', default='X-Profile-Request')
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_MAX_PER_MINUTE = config('PROFILING_MAX_PER_MINUTE', default=6, cast=int)
+PROFILING_MAX_STORED = config('PROFILING_MAX_STORED', default=200, cast=int)
+PROFILING_TOP_FUNCTIONS = config('PROFILING_TOP_FUNCTIONS', default=40, cast=int)
@@ -76,11 +76,11 @@ function AIChatbot({ scrapedData }) {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken || '',
         },
-        body: JSON.stringify({
-          question: inputMessage,
-          scraped_data: scrapedData,
-          chat_history: chatHistory
-        }),
+        body: JSON.stringify(
+          scrapedData.snapshot_id
+            ? { question: inputMessage, snapshot_id: scrapedData.snapshot_id }
+            : { question: inputMessage, scraped_data: scrapedData, chat_history: chatHistory }
+        ),
       });
 
       const result = await response.json();
@@ -138,6 +138,13 @@ function AIChatbot({ scrapedData }) {
   };
 
   const clearChat = () => {
+    if (scrapedData.snapshot_id) {
+      fetch(`/api/snapshots/${scrapedData.snapshot_id}/chat/`, {
+        method: 'DELETE',
+        credentials: 'include',
+        headers: { 'X-CSRFToken': getCookie('csrftoken') || '' },
+      }).catch((error) => console.error('Error:', error));
+    }
     setMessages([
       {
         role: 'assistant',
@@ -34,6 +34,12 @@ function AIOptimizer({ scrapedData }) {
     setTimeout(() => setCopiedText(''), 2000);
   };
 
+  // With a server-side snapshot the backend reads the page data itself;
+  // the scraped fields are only posted for results that have none
+  const aiPayload = (fields) => (
+    scrapedData.snapshot_id ? { snapshot_id: scrapedData.snapshot_id } : fields
+  );
+
   const generateTitleSuggestions = async () => {
     setAiLoading(true);
     setActiveSection('title');
@@ -46,12 +52,12 @@ function AIOptimizer({ scrapedData }) {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken || '',
         },
-        body: JSON.stringify({
+        body: JSON.stringify(aiPayload({
           current_title: scrapedData.meta_title,
           meta_description: scrapedData.meta_description,
           content_preview: scrapedData.content,
           keywords: scrapedData.meta_keywords
-        }),
+        })),
       });
       const result = await response.json();
       if (result.success) {
@@ -76,12 +82,12 @@ function AIOptimizer({ scrapedData }) {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken || '',
         },
-        body: JSON.stringify({
+        body: JSON.stringify(aiPayload({
           current_description: scrapedData.meta_description,
           meta_title: scrapedData.meta_title,
           content_preview: scrapedData.content,
           keywords: scrapedData.meta_keywords
-        }),
+        })),
       });
       const result = await response.json();
       if (result.success) {
@@ -107,12 +113,12 @@ function AIOptimizer({ scrapedData }) {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken || '',
         },
-        body: JSON.stringify({
+        body: JSON.stringify(aiPayload({
           meta_title: scrapedData.meta_title,
           meta_description: scrapedData.meta_description,
           content_preview: scrapedData.content,
           headings: headingsArray
-        }),
+        })),
       });
       const result = await response.json();
       if (result.success) {
@@ -137,11 +143,11 @@ function AIOptimizer({ scrapedData }) {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken || '',
         },
-        body: JSON.stringify({
+        body: JSON.stringify(aiPayload({
           current_headings: scrapedData.headings,
           meta_title: scrapedData.meta_title,
           content_preview: scrapedData.content
-        }),
+        })),
       });
       const result = await response.json();
       if (result.success) {
@@ -166,9 +172,7 @@ function AIOptimizer({ scrapedData }) {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken || '',
         },
-        body: JSON.stringify({
-          scraped_data: scrapedData
-        }),
+        body: JSON.stringify(aiPayload({ scraped_data: scrapedData })),
       });
       const result = await response.json();
       if (result.success) {
@@ -194,12 +198,12 @@ function AIOptimizer({ scrapedData }) {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken || '',
         },
-        body: JSON.stringify({
+        body: JSON.stringify(aiPayload({
           content_preview: scrapedData.content,
           meta_title: scrapedData.meta_title,
           headings: headingsArray,
           target_keywords: scrapedData.meta_keywords
-        }),
+        })),
       });
       const result = await response.json();
       if (result.success) {
@@ -80,7 +80,7 @@ function App() {
       const result = await response.json();
 
       if (result.success) {
-        setScrapedData(result.data);
+        setScrapedData({ ...result.data, snapshot_id: result.snapshot_id });
         setError('');
       } else {
         setError(result.message || 'Failed to scrape website');